@@ -0,0 +1,55 @@
+"""Benchmark de serialização de resultados grandes de search_notes.
+
+Compara o formato antigo (``str(result)``), ``json`` da stdlib e o serializador
+compartilhado (``mcp_simple_tool.jsonutil``, orjson quando instalado).
+
+Uso:
+    python benchmarks/bench_serialization.py --rows 5000 --repeat 20
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+
+from mcp_simple_tool import jsonutil
+
+
+def make_result(rows: int) -> dict:
+    notes = [
+        {
+            "id": i,
+            "title": f"Nota {i} – reunião de status",
+            "content": "Conteúdo com acentuação: ação, índice, conclusão. " * 8,
+            "tags": ["mcp", "trabalho", f"tag-{i % 50}"],
+            "created_at": "2025-01-01T12:00:00+00:00",
+        }
+        for i in range(rows)
+    ]
+    return {"success": True, "data": {"results": notes, "cached": False}}
+
+
+def bench(label: str, fn, payload, repeat: int) -> None:
+    fn(payload)  # aquecimento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        out = fn(payload)
+    elapsed = (time.perf_counter() - start) / repeat
+    size = len(out.encode("utf-8") if isinstance(out, str) else out)
+    print(f"{label:<28} {elapsed * 1000:9.2f} ms/op {size / 1024:10.1f} KiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    payload = make_result(args.rows)
+    print(f"rows={args.rows} backend={jsonutil.backend_name()}")
+    bench("str(result) (antigo)", str, payload, args.repeat)
+    bench("json.dumps ensure_ascii", lambda p: json.dumps(p), payload, args.repeat)
+    bench("jsonutil.dumps", jsonutil.dumps, payload, args.repeat)
+    bench("jsonutil.dumps_bytes", jsonutil.dumps_bytes, payload, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
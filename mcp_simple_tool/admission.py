@@ -0,0 +1,230 @@
+from __future__ import annotations
+"""Controle de admissão (backpressure) por upstream: OpenRouter e Supabase.
+
+Cada upstream tem um limite de chamadas simultâneas e uma fila de espera limitada,
+globais no processo (MCP ``notes_chat`` e API web compartilham os mesmos limites).
+Com a fila cheia, ou após ``ADMISSION_QUEUE_TIMEOUT`` segundos esperando, a chamada é
+rejeitada na hora com ``Overloaded`` (a API web responde 503 + ``Retry-After``), em vez
+de empilhar requisições lentas e provocar 429 no upstream.
+
+Configuração via env: ``{UPSTREAM}_MAX_CONCURRENCY`` e ``{UPSTREAM}_MAX_QUEUE``
+(ex.: ``OPENROUTER_MAX_CONCURRENCY=8``, ``SUPABASE_MAX_QUEUE=64``); concorrência
+``0`` desliga o limite.
+
+Threads fora do event loop (refresh do cache em background, exportação em streaming)
+usam ``run_limited_sync``: a vaga é pedida no loop que serve as requisições.
+"""
+from contextlib import asynccontextmanager
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional, TypeVar
+import asyncio
+import concurrent.futures
+import logging
+import os
+import time
+
+logger = logging.getLogger("mcp_notes.admission")
+
+T = TypeVar("T")
+
+_DEFAULTS = {
+    "openrouter": (8, 32),
+    "supabase": (8, 64),
+}
+
+
+def _discard(waiters: Deque[asyncio.Future], fut: asyncio.Future) -> None:
+    try:
+        waiters.remove(fut)
+    except ValueError:
+        pass
+
+
+class Overloaded(Exception):
+    """Fila de espera do upstream cheia (ou tempo de espera esgotado)."""
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(f"{upstream} overloaded; retry after {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+    def to_meta(self) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": f"Servidor sobrecarregado ({self.upstream}); tente novamente em instantes.",
+            "status": 503,
+            "code": "overloaded",
+            "upstream": self.upstream,
+            "retryable": True,
+            "retry_after": round(self.retry_after, 1),
+        }
+
+
+class AdmissionLimiter:
+    """Semáforo com fila FIFO limitada e métricas de tempo em fila."""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float = 10.0) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._queue_times: Deque[float] = deque(maxlen=500)
+        self._service_ewma: Optional[float] = None
+        self.admitted = 0
+        self.shed = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _retry_after(self) -> float:
+        # Estimativa: tempo para a fila atual escoar com a vazão observada
+        service = self._service_ewma or 1.0
+        slots = max(1, self.max_concurrency)
+        return max(1.0, service * (len(self._waiters) + 1) / slots)
+
+    def _reject(self, reason: str) -> Overloaded:
+        self.shed += 1
+        logger.warning("admission shed upstream=%s reason=%s in_flight=%s queued=%s", self.name, reason, self._in_flight, len(self._waiters))
+        return Overloaded(self.name, self._retry_after())
+
+    async def acquire(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self.max_concurrency <= 0:
+            self.admitted += 1
+            return
+        if self._in_flight < self.max_concurrency and not self._waiters:
+            self._in_flight += 1
+            self.admitted += 1
+            self._queue_times.append(0.0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Vaga liberada no mesmo instante do timeout: segue com ela
+            if not (fut.done() and not fut.cancelled()):
+                fut.cancel()
+                _discard(self._waiters, fut)
+                raise self._reject("queue_timeout")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()  # vaga transferida a quem desistiu: devolve
+            else:
+                fut.cancel()
+                _discard(self._waiters, fut)
+            raise
+        # release() transferiu a vaga (``_in_flight`` não foi decrementado)
+        self.admitted += 1
+        self._queue_times.append(time.perf_counter() - started)
+
+    def release(self) -> None:
+        if self.max_concurrency <= 0:
+            return
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._in_flight = max(0, self._in_flight - 1)
+
+    def _record_service(self, seconds: float) -> None:
+        self._service_ewma = seconds if self._service_ewma is None else 0.2 * seconds + 0.8 * self._service_ewma
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record_service(time.perf_counter() - started)
+            self.release()
+
+    def run_sync(self, func: Callable[..., T], *args: Any) -> T:
+        """Executa ``func`` na thread atual sob o limite; a fila é a do loop que usa este limitador.
+
+        Sem loop ativo (CLI, antes da 1ª requisição) ou chamada do próprio loop, executa direto.
+        """
+        loop = self._loop
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if loop is None or on_loop or loop.is_closed() or not loop.is_running():
+            return func(*args)
+        waiting = asyncio.run_coroutine_threadsafe(self.acquire(), loop)
+        try:
+            waiting.result(self.queue_timeout + 5)  # acquire já expira em queue_timeout; isto cobre o loop parado
+        except concurrent.futures.TimeoutError:
+            waiting.cancel()
+            raise Overloaded(self.name, self._retry_after())
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            loop.call_soon_threadsafe(self._record_service, elapsed)
+            loop.call_soon_threadsafe(self.release)
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._queue_times)
+
+        def pct(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(round(p / 100 * (len(waits) - 1))))] * 1000, 1)
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "queue_ms_p50": pct(50),
+            "queue_ms_p95": pct(95),
+            "queue_ms_max": round(waits[-1] * 1000, 1) if waits else 0.0,
+        }
+
+
+_LIMITERS: Dict[str, AdmissionLimiter] = {}
+
+
+def get_limiter(name: str) -> AdmissionLimiter:
+    limiter = _LIMITERS.get(name)
+    if limiter is None:
+        conc, queue = _DEFAULTS.get(name, (8, 32))
+        prefix = name.upper()
+        limiter = _LIMITERS.setdefault(
+            name,
+            AdmissionLimiter(
+                name,
+                int(os.getenv(f"{prefix}_MAX_CONCURRENCY", conc)),
+                int(os.getenv(f"{prefix}_MAX_QUEUE", queue)),
+                float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+            ),
+        )
+    return limiter
+
+
+async def run_limited(name: str, func: Callable[..., T], *args: Any) -> T:
+    """Executa função síncrona (cliente Supabase) numa thread, sob o limite do upstream."""
+    async with get_limiter(name).slot():
+        return await asyncio.to_thread(func, *args)
+
+
+def run_limited_sync(name: str, func: Callable[..., T], *args: Any) -> T:
+    """Como ``run_limited``, para threads fora do event loop (bloqueia esperando a vaga)."""
+    return get_limiter(name).run_sync(func, *args)
+
+
+def stats() -> Dict[str, Any]:
+    return {name: limiter.stats() for name, limiter in _LIMITERS.items()}
+
+
+def reset() -> None:
+    _LIMITERS.clear()
@@ -0,0 +1,43 @@
+from __future__ import annotations
+"""Serialização JSON compartilhada (resultados de ferramentas, histórico, API web, logs).
+
+Usa ``orjson`` quando instalado (``pip install -e .[fast]``); caso contrário, ``json``
+da stdlib. Saída sempre compacta e em UTF-8 (sem escapes ``\\uXXXX``).
+"""
+from typing import Any
+import json
+
+try:  # pragma: no cover - depende do ambiente
+    import orjson as _orjson
+except Exception:  # pragma: no cover
+    _orjson = None  # type: ignore
+
+_ORJSON_OPTS = getattr(_orjson, "OPT_NON_STR_KEYS", 0)
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    return str(obj)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    if _orjson is not None:
+        return _orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    if _orjson is not None:
+        return _orjson.dumps(obj, default=_default, option=_ORJSON_OPTS).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def loads(data: str | bytes) -> Any:
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+
+def backend_name() -> str:
+    return "orjson" if _orjson is not None else "json"
@@ -0,0 +1,169 @@
+from __future__ import annotations
+"""Contexto conversacional limitado: últimas N trocas + resumo incremental das anteriores.
+
+O prompt enviado ao LLM tem tamanho limitado independentemente do tamanho da sessão:
+- ``CONTEXT_MAX_TURNS`` trocas (usuário+assistente) mais recentes, cada texto cortado
+  em ``CONTEXT_TURN_MAX_CHARS``;
+- um resumo (``CONTEXT_SUMMARY_MAX_CHARS``) das mensagens que saíram da janela.
+
+O resumo é atualizado só quando a janela desliza: ao acumular
+``CONTEXT_SUMMARY_BATCH`` mensagens fora da janela, elas são incorporadas ao resumo
+anterior (nunca se re-resume a sessão inteira).
+
+Mensagens, resumo e ponteiro ``covered_until`` vêm do ``history`` injetado por quem
+chama (a API web passa o módulo ``webapp.storage`` quando o SQLite está ativo); sem ele,
+``SharedStateHistory`` usa o estado compartilhado.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+import os
+
+from mcp_simple_tool.shared_state import get_backend, session_messages
+
+logger = logging.getLogger("mcp_notes.context")
+
+_SUMMARY_NS = "session_summaries"
+
+Summarizer = Callable[[str, List[Dict[str, Any]]], Awaitable[str]]
+
+
+@dataclass
+class SessionContext:
+    summary: str = ""
+    turns: List[Dict[str, Any]] = field(default_factory=list)
+    pending: int = 0  # mensagens fora da janela ainda não resumidas
+
+    def __bool__(self) -> bool:
+        return bool(self.summary or self.turns)
+
+    def to_messages(self) -> List[Dict[str, str]]:
+        msgs: List[Dict[str, str]] = []
+        if self.summary:
+            msgs.append({"role": "system", "content": f"Resumo da conversa anterior: {self.summary}"})
+        for t in self.turns:
+            role = "assistant" if t.get("role") == "assistant" else "user"
+            msgs.append({"role": role, "content": t.get("text") or ""})
+        return msgs
+
+
+def max_turns() -> int:
+    return int(os.getenv("CONTEXT_MAX_TURNS", "3"))
+
+
+def _limits() -> Tuple[int, int, int]:
+    return (
+        int(os.getenv("CONTEXT_TURN_MAX_CHARS", "600")),
+        int(os.getenv("CONTEXT_SUMMARY_MAX_CHARS", "1200")),
+        max(1, int(os.getenv("CONTEXT_SUMMARY_BATCH", "4"))),
+    )
+
+
+class SharedStateHistory:
+    """Histórico no estado compartilhado (posição como id).
+
+    Interface esperada de ``history``: ``load_recent``, ``load_range``, ``get_summary`` e
+    ``save_summary``, com as mesmas assinaturas do módulo ``webapp.storage``.
+    """
+
+    def load_recent(self, session_id: str, limit: int) -> List[Dict[str, Any]]:
+        msgs = session_messages(session_id)
+        start = max(0, len(msgs) - limit)
+        return [{"id": i + 1, "role": m.get("role"), "text": m.get("text")} for i, m in enumerate(msgs) if i >= start]
+
+    def load_range(self, session_id: str, after_id: int, before_id: int) -> List[Dict[str, Any]]:
+        msgs = session_messages(session_id)
+        return [{"id": i + 1, "role": m.get("role"), "text": m.get("text")} for i, m in enumerate(msgs) if after_id < i + 1 < before_id]
+
+    def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return get_backend().get(_SUMMARY_NS, session_id)
+
+    def save_summary(self, session_id: str, summary: str, covered_until: int) -> None:
+        get_backend().set(_SUMMARY_NS, session_id, {"summary": summary, "covered_until": covered_until})
+
+
+_SHARED_HISTORY = SharedStateHistory()
+
+
+def _get_summary(history: Any, session_id: str) -> Dict[str, Any]:
+    return history.get_summary(session_id) or {"summary": "", "covered_until": 0}
+
+
+def build_session_context(session_id: Optional[str], turns: Optional[int] = None, history: Any = None) -> SessionContext:
+    """Lê janela + resumo sem chamar o LLM (custo O(janela), não O(sessão))."""
+    history = history or _SHARED_HISTORY
+    turns = max_turns() if turns is None else turns
+    if not session_id or turns <= 0:
+        return SessionContext()
+    turn_chars, _, batch = _limits()
+    # Pede até batch-1 mensagens extras: pendentes (ainda não resumidas) entram como turnos
+    recent = history.load_recent(session_id, 2 * turns + batch - 1)
+    if not recent:
+        return SessionContext()
+    state = _get_summary(history, session_id)
+    covered = int(state.get("covered_until") or 0)
+    window = recent[-2 * turns:]
+    extra = [m for m in recent[: -2 * turns] if m["id"] > covered]
+    first_kept = (extra or window)[0]["id"]
+    older_unsummarized = len(history.load_range(session_id, covered, first_kept)) if first_kept - covered > 1 else 0
+    msgs = extra + window
+    return SessionContext(
+        summary=state.get("summary") or "",
+        turns=[{"role": m["role"], "text": (m["text"] or "")[:turn_chars]} for m in msgs],
+        pending=len(extra) + older_unsummarized,
+    )
+
+
+def _extractive_summary(previous: str, messages: List[Dict[str, Any]], max_chars: int) -> str:
+    parts = [previous] if previous else []
+    for m in messages:
+        who = "Assistente" if m.get("role") == "assistant" else "Usuário"
+        parts.append(f"{who}: {(m.get('text') or '')[:160]}")
+    text = " | ".join(parts)
+    return text[-max_chars:]
+
+
+async def llm_summarize(previous: str, messages: List[Dict[str, Any]]) -> str:
+    """Incorpora ``messages`` ao resumo anterior usando o LLM (sem ferramentas)."""
+    from .openrouter_client import chat_with_tools
+
+    _, summary_chars, _ = _limits()
+    transcript = "\n".join(
+        f"{'Assistente' if m.get('role') == 'assistant' else 'Usuário'}: {(m.get('text') or '')[:600]}" for m in messages
+    )
+    prompt = (
+        f"Resumo atual da conversa:\n{previous or '(vazio)'}\n\n"
+        f"Novas mensagens:\n{transcript}\n\n"
+        f"Atualize o resumo em português, em no máximo {summary_chars} caracteres, "
+        "mantendo fatos, nomes de notas, tags e pedidos do usuário."
+    )
+    text, _ = await chat_with_tools(prompt, max_tokens=300, max_tool_passes=1, use_tools=False, model=os.getenv("OPENROUTER_SUMMARY_MODEL"))
+    return text
+
+
+async def refresh_summary(
+    session_id: Optional[str], summarize: Optional[Summarizer] = None, turns: Optional[int] = None, history: Any = None,
+) -> bool:
+    """Atualiza o resumo se houver >= CONTEXT_SUMMARY_BATCH mensagens fora da janela. Retorna True se resumiu."""
+    history = history or _SHARED_HISTORY
+    turns = max_turns() if turns is None else turns
+    if not session_id or turns <= 0:
+        return False
+    _, summary_chars, batch = _limits()
+    window = history.load_recent(session_id, 2 * turns)
+    if not window:
+        return False
+    state = _get_summary(history, session_id)
+    covered = int(state.get("covered_until") or 0)
+    older = history.load_range(session_id, covered, window[0]["id"])
+    if len(older) < batch:
+        return False
+    previous = state.get("summary") or ""
+    try:
+        summary = await (summarize or llm_summarize)(previous, older)
+    except Exception:
+        logger.exception("context: summarize failed; using extractive fallback session=%s", session_id)
+        summary = _extractive_summary(previous, older, summary_chars)
+    history.save_summary(session_id, (summary or "")[:summary_chars], older[-1]["id"])
+    logger.debug("context: summary updated session=%s covered_until=%s", session_id, older[-1]["id"])
+    return True
@@ -0,0 +1,192 @@
+from __future__ import annotations
+"""Parser local de intenções para comandos mecânicos do notes_chat.
+
+Reconhece (em português) pedidos como::
+
+    Crie uma nota 'Reunião de status' com tags [mcp, trabalho]
+    Busque notas sobre python com a tag dev
+
+e os mapeia direto para ``add_note`` / ``search_notes`` com uma confiança em [0, 1].
+Abaixo do limiar (``INTENT_CONFIDENCE_THRESHOLD``, default 0.85) o orquestrador usa o LLM.
+Negações ("sem a tag dev") e termos que são frases ("python que eu criei ontem") ficam
+abaixo do limiar; termo entre aspas é usado literalmente.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import re
+
+_QUOTED = r"""['"“‘«]([^'"”’»]{1,200})['"”’»]"""
+_CREATE_RE = re.compile(
+    r"^\s*(?:por favor,?\s+)?(?:crie|criar|cria|adicione|adicionar|adiciona|salve|salvar|registre|registrar|anote)\s+"
+    r"(?:uma\s+)?(?:nova\s+)?nota\b(?P<rest>.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+_SEARCH_RE = re.compile(
+    r"^\s*(?:por favor,?\s+)?(?:busque|buscar|busca|procure|procurar|pesquise|pesquisar|encontre|encontrar|liste|listar|mostre|mostrar)\s+"
+    r"(?:as\s+|minhas\s+|todas\s+as\s+)?notas?\b(?P<rest>.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+_TAGS_BRACKET_RE = re.compile(r"(?:com\s+)?(?:as\s+|a\s+)?tags?\b\s*[:=]?\s*\[([^\]]*)\]", re.IGNORECASE)
+_TAGS_PLAIN_RE = re.compile(r"(?:com\s+)?(?:as\s+|a\s+)?tags?\b\s*[:=]?\s*([\w-]+(?:\s*(?:,|\be\b)\s*[\w-]+)*)\s*$", re.IGNORECASE)
+_HASHTAG_RE = re.compile(r"#([\w-]+)")
+_CONTENT_RE = re.compile(r"(?:com\s+)?(?:o\s+)?(?:conte[uú]do|texto)\s*[:=]?\s*" + _QUOTED, re.IGNORECASE)
+_TITLE_RE = re.compile(r"(?:com\s+)?(?:o\s+)?(?:t[ií]tulo|chamada|intitulada)\s*[:=]?\s*" + _QUOTED, re.IGNORECASE)
+_QUERY_RE = re.compile(r"^\s*(?:sobre|contendo|com\s+o\s+termo|que\s+falam\s+(?:de|sobre)|relacionadas\s+a|de)\s+(.+)$", re.IGNORECASE | re.DOTALL)
+# Pedidos compostos ("... e resuma", "... e compare") precisam do LLM
+_COMPOUND_RE = re.compile(r"\b(?:e|depois|ent[aã]o)\s+(?:me\s+)?(?:resuma|resumir|explique|explicar|compare|comparar|diga|analise|analisar|traduza|escreva|gere)\b", re.IGNORECASE)
+_FILLER = {"com", "e", "a", "as", "o", "os", "uma", "um", "de", "da", "do", "por", "favor", "para", "mim", "pra", "obrigado", "obrigada", "valeu"}
+# Cortesias não fazem parte do termo de busca ("sobre python, por favor")
+_POLITE_RE = re.compile(r"[\s,;.!]*\b(?:por\s+favor|obrigad[oa]|valeu|pfv?)\b[\s,;.!]*", re.IGNORECASE)
+# Cortesia no fim do pedido ("... com tag dev, por favor") é removida antes de extrair tags
+_POLITE_TAIL_RE = re.compile(r"(?:[\s,;.!]*\b(?:por\s+favor|obrigad[oa]|valeu|pfv?)\b)+[\s,;.!?]*$", re.IGNORECASE)
+# Negação ("sem a tag dev", "exceto python") inverte o filtro: só o LLM interpreta
+_NEGATION_RE = re.compile(r"\b(?:sem|exceto|menos|n[aã]o|nenhuma?)\b", re.IGNORECASE)
+# Termo com palavras funcionais/oração relativa ("python que eu criei ontem") não é termo literal
+_QUERY_CLAUSE_RE = re.compile(
+    r"\b(?:que|quem|onde|quando|como|qual|quais|eu|meu|minha|meus|minhas|na|no|nas|nos|em|ontem|hoje|semana|m[eê]s)\b",
+    re.IGNORECASE,
+)
+# Termo com vários assuntos ("python e java", "python, docker") é ambíguo: E ou OU? Fica com o LLM
+_QUERY_JOIN_RE = re.compile(r"[,;/]|\b(?:e|ou|mas)\b", re.IGNORECASE)
+
+DEFAULT_THRESHOLD = 0.85
+
+
+@dataclass
+class Intent:
+    tool: str
+    args: Dict[str, Any]
+    confidence: float
+
+
+def _split_tags(raw: str) -> List[str]:
+    parts = re.split(r"\s*(?:,|\be\b|\s)\s*", raw.strip())
+    return [p.strip().strip("'\"") for p in parts if p.strip().strip("'\"")]
+
+
+def _take(pattern: re.Pattern, text: str) -> Tuple[Optional[re.Match], str]:
+    m = pattern.search(text)
+    if not m:
+        return None, text
+    return m, (text[: m.start()] + " " + text[m.end():])
+
+
+def _leftover_words(text: str) -> List[str]:
+    words = re.findall(r"[\wÀ-ÿ-]+", text.lower())
+    return [w for w in words if w not in _FILLER]
+
+
+def _parse_tags(rest: str) -> Tuple[List[str], str]:
+    tags: List[str] = []
+    m, rest = _take(_TAGS_BRACKET_RE, rest)
+    if m:
+        tags.extend(_split_tags(m.group(1)))
+    else:
+        m, rest = _take(_TAGS_PLAIN_RE, rest)
+        if m:
+            tags.extend(_split_tags(m.group(1)))
+    hashtags = _HASHTAG_RE.findall(rest)
+    if hashtags:
+        tags.extend(hashtags)
+        rest = _HASHTAG_RE.sub(" ", rest)
+    return tags, rest
+
+
+def _parse_create(rest: str) -> Optional[Intent]:
+    confidence = 0.6
+    content_m, rest = _take(_CONTENT_RE, rest)
+    title_m, rest = _take(_TITLE_RE, rest)
+    if title_m is None:
+        title_m, rest = _take(re.compile(_QUOTED), rest)
+    tags, rest = _parse_tags(rest)
+    if title_m is None:
+        return Intent("add_note", {}, confidence)
+    title = title_m.group(1).strip()
+    confidence += 0.3
+    if tags:
+        confidence += 0.05
+    if content_m:
+        confidence += 0.05
+    content = content_m.group(1).strip() if content_m else title
+    # Texto não explicado pelos padrões = instrução que só o LLM entende
+    if _leftover_words(rest.strip(" .:;,-")):
+        confidence -= 0.4
+    return Intent("add_note", {"title": title, "content": content, "tags": tags}, round(min(confidence, 1.0), 2))
+
+
+def _parse_search(rest: str) -> Optional[Intent]:
+    confidence = 0.7
+    rest = _POLITE_TAIL_RE.sub("", rest)
+    negated = bool(_NEGATION_RE.search(re.sub(_QUOTED, " ", rest)))
+    title_m, rest = _take(_TITLE_RE, rest)
+    query: Optional[str] = None
+    quoted_query = False
+    qm = _QUERY_RE.match(rest)
+    quoted = re.match(_QUOTED, qm.group(1)) if qm else None
+    if qm and quoted:
+        # Termo entre aspas é completo; o que vem depois (tags, sobras) é analisado à parte
+        query, quoted_query = quoted.group(1).strip(), True
+        rest = qm.group(1)[quoted.end():]
+    tags, rest = _parse_tags(rest)
+    if not quoted_query:
+        qm = _QUERY_RE.match(rest)
+        if qm:
+            query = _POLITE_RE.sub(" ", qm.group(1)).strip(" .?!:;,\"'“”")
+            rest = ""
+        else:
+            quoted_m, rest = _take(re.compile(_QUOTED), rest)
+            if quoted_m:
+                query, quoted_query = quoted_m.group(1).strip(), True
+    args: Dict[str, Any] = {"query": query or None, "title": title_m.group(1).strip() if title_m else None, "tags": tags}
+    if not (query or args["title"] or tags):
+        return Intent("search_notes", args, confidence)
+    confidence += 0.2
+    if negated:
+        confidence -= 0.5
+    if query and not quoted_query:
+        # Termo de busca é literal (ilike): frase ou oração é pergunta para o LLM
+        if len(query.split()) > 2:
+            confidence -= 0.3
+        if _QUERY_CLAUSE_RE.search(query):
+            confidence -= 0.4
+    if _leftover_words(rest.strip(" .:;,-?!")) or (query and _QUERY_JOIN_RE.search(query)):
+        confidence -= 0.4
+    return Intent("search_notes", args, round(min(confidence, 1.0), 2))
+
+
+def parse_intent(prompt: str) -> Optional[Intent]:
+    """Intenção determinística do prompt, ou ``None`` se não for um comando reconhecível."""
+    if not prompt or len(prompt) > 500 or _COMPOUND_RE.search(prompt):
+        return None
+    text = prompt.strip()
+    m = _CREATE_RE.match(text)
+    if m:
+        return _parse_create(m.group("rest"))
+    m = _SEARCH_RE.match(text)
+    if m:
+        return _parse_search(m.group("rest"))
+    return None
+
+
+def render_reply(intent: Intent, result: Dict[str, Any]) -> str:
+    """Resposta em template (sem LLM) para o resultado da ferramenta."""
+    if not result.get("success"):
+        verb = "criar a nota" if intent.tool == "add_note" else "buscar notas"
+        return f"Não consegui {verb}: {result.get('error', 'erro desconhecido')}"
+    if intent.tool == "add_note":
+        tags = intent.args.get("tags") or []
+        suffix = f" com tags: {', '.join(tags)}." if tags else "."
+        return f"Nota \"{intent.args.get('title')}\" criada{suffix}"
+    data = result.get("data") or {}
+    results = data.get("results") or []
+    label = intent.args.get("query") or intent.args.get("title") or ", ".join(intent.args.get("tags") or [])
+    if not results:
+        return f"Nenhuma nota encontrada para \"{label}\"."
+    more = " (mostrando as primeiras)" if data.get("truncated_results") else ""
+    lines = [f"Encontrei {len(results)} nota(s) para \"{label}\"{more}:"]
+    for note in results[:10]:
+        tags = note.get("tags") or []
+        lines.append(f"- {note.get('title') or '(sem título)'}" + (f" [{', '.join(tags)}]" if tags else ""))
+    if len(results) > 10:
+        lines.append(f"... e mais {len(results) - 10}.")
+    return "\n".join(lines)
@@ -2,20 +2,16 @@ from __future__ import annotations
 
 from typing import Any, Dict, List, Optional, Tuple
 import os
-import asyncio
 import logging
 import json
 from contextlib import suppress
 from dotenv import load_dotenv
+from .resilience import CircuitOpenError, call_with_resilience, status_of
+from mcp_simple_tool.admission import Overloaded, get_limiter
 
 # Carrega variáveis de ambiente
 load_dotenv()
 
-try:  # pragma: no cover - apenas caminho de import
-    from openai import AsyncOpenAI
-except Exception:  # pragma: no cover
-    AsyncOpenAI = None  # type: ignore
-
 logger = logging.getLogger("mcp_notes.llm")
 
 MAX_INPUT_CHARS = 4000
@@ -27,9 +23,13 @@ def get_async_client() -> Any:
     base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
     if not api_key:
         raise RuntimeError("OPENROUTER_API_KEY is not set")
-    if AsyncOpenAI is None:
+    try:  # import tardio: openai é caro e só necessário na 1ª chamada ao LLM
+        from openai import AsyncOpenAI
+    except Exception:  # pragma: no cover
         raise RuntimeError("openai package not installed; run `pip install openai`.")
-    return AsyncOpenAI(api_key=api_key, base_url=base_url)
+    # Retries ficam só com ``call_with_resilience``: os do SDK se multiplicariam com os nossos
+    # e atrasariam as falhas vistas pelo circuit breaker
+    return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
 
 
 def default_headers() -> Dict[str, str]:
@@ -57,6 +57,7 @@ def tool_schemas() -> List[Dict[str, Any]]:
                         "content": {"type": "string"},
                         "title": {"type": "string"},
                         "tags": {"type": "array", "items": {"type": "string"}},
+                        "idempotency_key": {"type": "string", "description": "Repetir a mesma chave não cria outra nota."},
                     },
                 },
             },
@@ -65,7 +66,7 @@ def tool_schemas() -> List[Dict[str, Any]]:
             "type": "function",
             "function": {
                 "name": "search_notes",
-                "description": "Busca notas por conteúdo, título e/ou tags.",
+                "description": "Busca notas por conteúdo, título e/ou tags. Resultados trazem só um trecho (snippet) do conteúdo.",
                 "parameters": {
                     "type": "object",
                     "properties": {
@@ -76,12 +77,42 @@ def tool_schemas() -> List[Dict[str, Any]]:
                 },
             },
         },
+        {
+            "type": "function",
+            "function": {
+                "name": "get_notes",
+                "description": "Conteúdo completo de notas pelos ids (use só quando o trecho da busca não bastar).",
+                "parameters": {
+                    "type": "object",
+                    "required": ["ids"],
+                    "properties": {
+                        "ids": {"type": "array", "items": {"type": ["integer", "string"]}},
+                    },
+                },
+            },
+        },
+        {
+            "type": "function",
+            "function": {
+                "name": "list_tags",
+                "description": "Lista tags existentes com contagem (use antes de filtrar por tags).",
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "prefix": {"type": "string"},
+                        "limit": {"type": "integer"},
+                    },
+                },
+            },
+        },
     ]
 
 
 SYSTEM_PROMPT = (
     "Você é um assistente de notas. Use ferramentas para criar e buscar notas. "
-    "Responda em português, de forma curta e clara. Quando buscar notas, apresente um resumo e itens relevantes."
+    "Responda em português, de forma curta e clara. Quando buscar notas, apresente um resumo e itens relevantes. "
+    "Para filtrar por tags, use apenas tags existentes (as mais usadas vêm listadas no contexto, quando disponíveis). "
+    "A busca devolve trechos; use get_notes com os ids quando precisar do conteúdo completo."
 )
 
 
@@ -92,12 +123,22 @@ async def chat_with_tools(
     max_tokens: int = 400,
     timeout: float = 60.0,
     max_tool_passes: int = 3,
+    fallback_models: Optional[List[str]] = None,
+    history: Optional[List[Dict[str, str]]] = None,
+    use_tools: bool = True,
+    used_models: Optional[List[str]] = None,
     _client: Any | None = None,
 ) -> Tuple[str, List[Dict[str, Any]]]:
     """Conversa com LLM permitindo passes de planejamento de ferramentas.
 
     Retorna (texto_final, ações_planejadas). Cada ação: {tool, args}.
     Em erros de rede/proxy levanta RuntimeError cujo message é JSON com metadados.
+    Retries, circuit breaker, hedging e fallback de modelos: ver ``resilience``.
+    Cada tentativa (retry, hedge, fallback) ocupa uma vaga do limite ``openrouter`` só
+    enquanto a requisição está em voo (ver ``admission``); com a fila cheia levanta ``Overloaded``.
+    ``history``: mensagens anteriores (resumo + últimas trocas, ver ``context``) inseridas
+    entre o system prompt e a mensagem atual. ``use_tools=False`` desativa ferramentas.
+    ``used_models``: se passada, recebe o modelo que atendeu cada chamada (o fallback, quando usado).
     """
 
     if not user_prompt or not str(user_prompt).strip():
@@ -123,34 +164,46 @@ async def chat_with_tools(
 
     messages: List[Dict[str, Any]] = [
         {"role": "system", "content": SYSTEM_PROMPT[:MAX_PROMPT_CHARS]},
+        *(history or []),
         {"role": "user", "content": user_content},
     ]
 
     async def _call_llm(msgs: List[Dict[str, Any]]):
         headers = default_headers()
-        last_err: Optional[Exception] = None
-        for attempt in range(3):
-            try:
+
+        tool_kwargs: Dict[str, Any] = {"tools": tool_schemas(), "tool_choice": "auto"} if use_tools else {}
+
+        async def _request(model_id: str):
+            # Vaga por tentativa: backoff entre retries não segura vaga; hedge ocupa a sua
+            async with get_limiter("openrouter").slot():
                 return await client.chat.completions.create(
-                    model=model,
+                    model=model_id,
                     temperature=temperature,
                     max_tokens=max_tokens,
                     messages=msgs,
-                    tools=tool_schemas(),
-                    tool_choice="auto",
                     timeout=timeout,
                     extra_headers=headers or None,
+                    **tool_kwargs,
                 )
-            except Exception as e:  # pragma: no cover - ambiente real
-                last_err = e
-                status = getattr(e, "status_code", None) or getattr(e, "http_status", None)
-                if status and status < 500 and status != 429:
-                    break  # não adianta retry
-                if status == 429:
-                    logger.warning("rate limit (429) attempt=%s", attempt)
-                await asyncio.sleep(min(2 ** attempt, 5))
-        if last_err:
-            status_code = getattr(last_err, "status_code", None) or getattr(last_err, "http_status", None)
+
+        try:
+            resp, used_model = await call_with_resilience(_request, model, fallback_models=fallback_models)
+            if used_models is not None:
+                used_models.append(used_model)
+            return resp
+        except Overloaded:
+            raise
+        except CircuitOpenError as e:
+            meta = {
+                "error": "OpenRouter indisponível (circuit breaker aberto); tente novamente em instantes.",
+                "status": 503,
+                "code": "circuit_open",
+                "retryable": True,
+                "retry_after": round(e.retry_after, 1),
+            }
+            raise RuntimeError(json.dumps(meta, ensure_ascii=False))
+        except Exception as last_err:  # pragma: no cover - ambiente real
+            status_code = status_of(last_err)
             raw_text = str(last_err)
             lower = raw_text.lower()
             if status_code == 403 and ("<html" in lower or "<head" in lower or "bloqueio chat ia" in lower):
@@ -168,7 +221,6 @@ async def chat_with_tools(
                 raise RuntimeError(json.dumps(meta, ensure_ascii=False))
             meta = {"error": raw_text[:800], "type": cls_name, "status": status_code}
             raise RuntimeError(json.dumps(meta, ensure_ascii=False))
-        raise RuntimeError("unexpected: LLM returned neither result nor exception")  # pragma: no cover
 
     for _ in range(max_tool_passes):
         resp = await _call_llm(messages)
@@ -8,14 +8,194 @@ Contrato de saída:
   actions: [ { tool, args, result } ],
   synthesized: bool
 }
+
+``on_progress`` (opcional, sync ou async) recebe eventos ``{stage, ...}`` durante o fluxo:
+fast_path, planning, planned, tool, synthesis.
 """
-from typing import Any, Callable, Dict, List, Optional
-import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import functools
+import inspect
 import logging
+import os
+import time
+from mcp_simple_tool.jsonutil import dumps
+from mcp_simple_tool.admission import run_limited
+from mcp_simple_tool.tools.notes import compact_results, known_tags
 from .openrouter_client import chat_with_tools
+from .routing import ROUTER, routing_active, select_model
+from .intent import DEFAULT_THRESHOLD, parse_intent, render_reply
+from .context import SessionContext
+from . import speculative
 
 logger = logging.getLogger("mcp_notes.orchestrator")
 
+
+def _truncate_results(res: Dict[str, Any], limit: int = 10) -> Dict[str, Any]:
+    """Limita resultados de search_notes (economia de tokens/payload)."""
+    try:
+        if res.get("success") and isinstance(res.get("data"), dict):
+            results = res["data"].get("results")
+            if isinstance(results, list) and len(results) > limit:
+                res["data"]["results"] = results[:limit]
+                res["data"]["truncated_results"] = True
+    except Exception:  # pragma: no cover
+        pass
+    return res
+
+
+_TAG_INDEX_BUILD: Optional[asyncio.Future] = None
+
+
+def _build_tag_index(list_tags_func: Callable[..., Dict[str, Any]]) -> None:
+    """Constrói o índice de tags em background (uma vez por vez); o planejamento não espera."""
+    global _TAG_INDEX_BUILD
+    task = _TAG_INDEX_BUILD
+    if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+        return
+    task = _TAG_INDEX_BUILD = asyncio.ensure_future(run_limited("supabase", list_tags_func, None, 1))
+
+    def _done(t: asyncio.Future) -> None:
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("tag index build failed: %s", t.exception())
+
+    task.add_done_callback(_done)
+
+
+def _tag_hint(list_tags_func: Callable[..., Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Vocabulário de tags para o planejamento (o plano é feito num passo só, sem ver list_tags)."""
+    limit = int(os.getenv("PLANNING_TAG_HINTS", "20"))
+    if limit <= 0:
+        return []
+    tags = known_tags(limit)
+    if not tags:
+        # Processo novo: ninguém chamou list_tags ainda; as próximas rodadas já veem as tags
+        _build_tag_index(list_tags_func)
+        return []
+    return [{"role": "system", "content": f"Tags existentes (mais usadas): {', '.join(tags)}"}]
+
+
+def _fast_path_enabled(params: Dict[str, Any]) -> bool:
+    if "fast_path" in params:
+        return bool(params["fast_path"])
+    return os.getenv("INTENT_FAST_PATH", "1").lower() not in ("0", "false", "no", "off")
+
+
+async def _emit(on_progress: Callable[[Dict[str, Any]], Any] | None, event: Dict[str, Any]) -> None:
+    if on_progress is None:
+        return
+    try:
+        ret = on_progress(event)
+        if inspect.isawaitable(ret):
+            await ret
+    except Exception:  # progresso é best-effort (ex.: cliente desconectou)
+        logger.debug("on_progress failed stage=%s", event.get("stage"), exc_info=True)
+
+
+def _start_prefetch(prompt: str, params: Dict[str, Any], search_notes_func: Callable[..., Dict[str, Any]] | None) -> Tuple[Dict[str, Any], "asyncio.Task[Dict[str, Any]]"] | None:
+    """Dispara a busca prevista em paralelo ao planejamento (modo especulativo)."""
+    if search_notes_func is None or not speculative.enabled(params):
+        return None
+    predicted = speculative.predict_search(prompt)
+    if predicted is None:
+        return None
+    speculative.record("attempts")
+    # Linhas completas (full=True): o filtro local de "covered" precisa do content
+    task = asyncio.ensure_future(run_limited("supabase", functools.partial(search_notes_func, full=True), predicted["query"], predicted["title"], predicted["tags"]))
+    # Descartada ou com erro: evita "Task exception was never retrieved"
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return predicted, task
+
+
+async def _use_prefetch(prefetch: Tuple[Dict[str, Any], "asyncio.Task[Dict[str, Any]]"], args: Dict[str, Any]) -> Dict[str, Any] | None:
+    """Resultado da busca prevista, se cobrir a planejada; registra o desfecho uma única vez."""
+    predicted, task = prefetch
+    outcome = speculative.match(predicted, args)
+    if outcome is None:
+        task.cancel()  # previsão errada: não segura vaga "supabase" por um resultado descartado
+        speculative.record("miss")
+        return None
+    try:
+        res = await task
+    except Exception:
+        logger.debug("speculative search failed", exc_info=True)
+        speculative.record("errors")
+        return None
+    if not res.get("success"):
+        speculative.record("errors")
+        return None
+    results = res["data"].get("results") or []
+    if outcome == "covered":
+        results = speculative.filter_results(results, args)
+    results = compact_results(results, args.get("query"))
+    speculative.record(outcome)
+    return {**res, "data": {**res["data"], "results": results, "speculative": outcome}}
+
+
+def _synthesis_note_ids(executed: List[Dict[str, Any]], limit: int) -> List[Any]:
+    """Ids dos primeiros resultados de busca cujo snippet não cobre a nota (e que o plano não abriu)."""
+    opened = {str(i) for ex in executed if ex["tool"] == "get_notes" for i in (ex["args"].get("ids") or [])}
+    ids: List[Any] = []
+    for ex in executed:
+        if ex["tool"] != "search_notes" or not ex["result"].get("success"):
+            continue
+        for row in (ex["result"].get("data") or {}).get("results") or []:
+            if not isinstance(row, dict) or row.get("id") is None or "snippet" not in row:
+                continue
+            if row.get("content_length", 0) > len(row["snippet"]) and str(row["id"]) not in opened and row["id"] not in ids:
+                ids.append(row["id"])
+    return ids[:limit]
+
+
+async def _synthesis_notes(executed: List[Dict[str, Any]], get_notes_func: Callable[..., Dict[str, Any]] | None) -> str:
+    """Conteúdo completo das melhores notas para a síntese, até ``SYNTHESIS_CONTENT_CHARS``.
+
+    O plano é feito num passo só: o LLM não vê os ids da busca a tempo de pedir ``get_notes``.
+    """
+    top_k = int(os.getenv("SYNTHESIS_FULL_NOTES", "3"))
+    ids = _synthesis_note_ids(executed, top_k) if get_notes_func and top_k > 0 else []
+    if not ids:
+        return ""
+    try:
+        res = await run_limited("supabase", get_notes_func, ids)
+    except Exception:
+        logger.warning("notes_chat: get_notes for synthesis failed", exc_info=True)
+        return ""
+    if not res.get("success"):
+        logger.warning("notes_chat: get_notes for synthesis failed error=%s", res.get("error"))
+        return ""
+    budget = int(os.getenv("SYNTHESIS_CONTENT_CHARS", "4000"))
+    parts = []
+    for note in (res.get("data") or {}).get("notes") or []:
+        if budget <= 0:
+            break
+        content = str(note.get("content") or "")[:budget]
+        budget -= len(content)
+        parts.append(f"[id={note.get('id')}] {note.get('title') or ''}\n{content}")
+    return "\n\n".join(parts)
+
+
+async def _timed_chat(chat_callable: Callable[..., Any], prompt: str, model: Optional[str], **kwargs: Any) -> Tuple[Tuple[str, List[Dict[str, Any]]], float, str]:
+    """Chama o LLM registrando latência/erro no roteador sob o modelo que de fato atendeu.
+
+    Retorna (resultado, segundos, modelo usado).
+    """
+    started = time.perf_counter()
+    router_key = model or os.getenv("OPENROUTER_MODEL", "openrouter/auto")
+    served: List[str] = []  # preenchida pelo chat_with_tools (fallback incluído)
+    try:
+        result = await chat_callable(prompt, model=model, used_models=served, **kwargs)
+    except Exception:
+        ROUTER.record(router_key, time.perf_counter() - started, ok=False)
+        raise
+    elapsed = time.perf_counter() - started
+    used = served[-1] if served else router_key
+    if used != router_key:
+        # Fallback atendeu: o pedido falhou no modelo escolhido; a latência é do fallback
+        ROUTER.record(router_key, elapsed, ok=False)
+    ROUTER.record(used, elapsed, ok=True)
+    return result, elapsed, used
+
 async def run_notes_chat(
     prompt: str,
     *,
@@ -24,6 +204,49 @@ async def run_notes_chat(
     chat_func: Callable[..., Any] | None = None,
     add_note_func: Callable[..., Dict[str, Any]] | None = None,
     search_notes_func: Callable[..., Dict[str, Any]] | None = None,
+    list_tags_func: Callable[..., Dict[str, Any]] | None = None,
+    get_notes_func: Callable[..., Dict[str, Any]] | None = None,
+    context: SessionContext | None = None,
+    on_progress: Callable[[Dict[str, Any]], Any] | None = None,
+) -> Dict[str, Any]:
+    funcs: Dict[str, Any] = {
+        "add_note_func": add_note_func, "search_notes_func": search_notes_func,
+        "list_tags_func": list_tags_func, "get_notes_func": get_notes_func,
+    }
+    path = None
+    if os.getenv("REPLAY_RECORD_PATH"):
+        from mcp_simple_tool import replay  # import tardio: gravação é opcional e traz o CLI (click)
+
+        path = replay.recording_path()
+    if path is None:
+        return await _run_notes_chat(prompt, model=model, params=params, chat_func=chat_func, context=context, on_progress=on_progress, **funcs)
+    # REPLAY_RECORD_PATH: grava LLM + ferramentas do turno como fixture de replay
+    recorder = replay.Recorder()
+    recorded = {k: recorder.wrap_tool(k[: -len("_func")], f) for k, f in funcs.items()}
+    try:
+        payload = await _run_notes_chat(
+            prompt, model=model, params=params, chat_func=recorder.wrap_chat(chat_func or chat_with_tools),
+            context=context, on_progress=on_progress, **recorded,
+        )
+    except Exception as e:
+        await asyncio.to_thread(replay.append_turn, path, recorder.turn(prompt, model, params or {}, error=str(e)))
+        raise
+    await asyncio.to_thread(replay.append_turn, path, recorder.turn(prompt, model, params or {}, payload))
+    return payload
+
+
+async def _run_notes_chat(
+    prompt: str,
+    *,
+    model: Optional[str] = None,
+    params: Dict[str, Any] | None = None,
+    chat_func: Callable[..., Any] | None = None,
+    add_note_func: Callable[..., Dict[str, Any]] | None = None,
+    search_notes_func: Callable[..., Dict[str, Any]] | None = None,
+    list_tags_func: Callable[..., Dict[str, Any]] | None = None,
+    get_notes_func: Callable[..., Dict[str, Any]] | None = None,
+    context: SessionContext | None = None,
+    on_progress: Callable[[Dict[str, Any]], Any] | None = None,
 ) -> Dict[str, Any]:
     if not prompt or not str(prompt).strip():
         raise ValueError("prompt vazio")
@@ -31,54 +254,115 @@ async def run_notes_chat(
     temperature = float(params.get("temperature", 0.2))
     max_tokens = int(params.get("max_tokens", 400))
     timeout_seconds = float(params.get("timeout_seconds", 60))
+    if _fast_path_enabled(params):
+        intent = parse_intent(prompt)
+        threshold = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", DEFAULT_THRESHOLD))
+        tool_func = {"add_note": add_note_func, "search_notes": search_notes_func}.get(intent.tool) if intent else None
+        if intent and tool_func and intent.confidence >= threshold:
+            # Comando mecânico: executa direto, sem round-trip de planejamento/síntese
+            a = intent.args
+            await _emit(on_progress, {"stage": "fast_path", "tool": intent.tool, "confidence": intent.confidence})
+            if intent.tool == "add_note":
+                res = await run_limited("supabase", tool_func, a["content"], a["title"], a.get("tags") or [])
+            else:
+                res = _truncate_results(await run_limited("supabase", tool_func, a.get("query"), a.get("title"), a.get("tags") or []))
+            logger.info("notes_chat fast path tool=%s confidence=%s", intent.tool, intent.confidence)
+            return {
+                "success": True,
+                "text": render_reply(intent, res),
+                "actions": [{"tool": intent.tool, "args": a, "result": res}],
+                "synthesized": False,
+                "fast_path": {"confidence": intent.confidence},
+            }
     chat_callable = chat_func or chat_with_tools
-    draft_text, planned_actions = await chat_callable(
+    llm_extra: Dict[str, Any] = {}
+    if params.get("fallback_models"):
+        llm_extra["fallback_models"] = list(params["fallback_models"])
+    history = _tag_hint(list_tags_func) if list_tags_func else []
+    if context:
+        # Resumo + últimas trocas: tamanho limitado, independente do tamanho da sessão
+        history += context.to_messages()
+    if history:
+        llm_extra["history"] = history
+    planning_model, planning_reason = select_model("planning", params, model)
+    prefetch = _start_prefetch(prompt, params, search_notes_func)
+    await _emit(on_progress, {"stage": "planning", "model": planning_model})
+    (draft_text, planned_actions), planning_elapsed, planning_served = await _timed_chat(
+        chat_callable,
         prompt,
-        model=model,
+        planning_model,
         temperature=temperature,
         max_tokens=max_tokens,
         timeout=timeout_seconds,
+        **llm_extra,
     )
+    routing: Dict[str, Any] = {
+        "planning": {"model": planning_model, "served_by": planning_served, "reason": planning_reason, "latency_ms": round(planning_elapsed * 1000, 1)},
+    }
     executed: List[Dict[str, Any]] = []
+    if planned_actions:
+        await _emit(on_progress, {"stage": "planned", "tools": [a.get("tool") for a in planned_actions]})
     for act in planned_actions:
         tool = act.get("tool")
         args = act.get("args") or {}
+        # Ferramentas (cliente Supabase síncrono) numa thread, sob o limite "supabase"
         if tool == "add_note" and add_note_func:
-            res = add_note_func(args.get("content"), args.get("title"), args.get("tags") or [])
+            # Repetições do plano (retries / passes) são deduplicadas pelo add_note_tool
+            note_args = [args.get("content"), args.get("title"), args.get("tags") or []]
+            if args.get("idempotency_key"):
+                note_args.append(args["idempotency_key"])
+            res = await run_limited("supabase", add_note_func, *note_args)
         elif tool == "search_notes" and search_notes_func:
-            res = search_notes_func(args.get("query"), args.get("title"), args.get("tags") or [])
-            try:
-                if res.get("success") and isinstance(res.get("data"), dict):
-                    results = res["data"].get("results")
-                    if isinstance(results, list) and len(results) > 10:
-                        res["data"]["results"] = results[:10]
-                        res["data"]["truncated_results"] = True
-            except Exception:  # pragma: no cover
-                pass
+            res = None
+            if prefetch is not None:
+                res = await _use_prefetch(prefetch, args)
+                prefetch = None  # vale só para a primeira busca planejada
+            if res is None:
+                res = await run_limited("supabase", search_notes_func, args.get("query"), args.get("title"), args.get("tags") or [])
+            res = _truncate_results(res)
+        elif tool == "list_tags" and list_tags_func:
+            res = await run_limited("supabase", list_tags_func, args.get("prefix"), args.get("limit") or 50)
+        elif tool == "get_notes" and get_notes_func:
+            res = await run_limited("supabase", get_notes_func, args.get("ids") or [])
         else:
             res = {"success": False, "error": "tool not supported"}
         executed.append({"tool": tool, "args": args, "result": res})
+        await _emit(on_progress, {"stage": "tool", "tool": tool, "success": bool(res.get("success"))})
+    if prefetch is not None:
+        prefetch[1].cancel()
+        speculative.record("unused")
     final_text = draft_text
     synthesized = False
     if executed:
         ctx_parts = []
         for ex in executed:
             res = ex["result"]
-            res_str = json.dumps(res, ensure_ascii=False)[:800]
-            ctx_parts.append(f"Ferramenta={ex['tool']}: args={json.dumps(ex['args'], ensure_ascii=False)} resultado={res_str}")
+            res_str = dumps(res)[:800]
+            ctx_parts.append(f"Ferramenta={ex['tool']}: args={dumps(ex['args'])} resultado={res_str}")
         tool_context = "\n".join(ctx_parts)
+        notes_text = await _synthesis_notes(executed, get_notes_func)
+        if notes_text:
+            tool_context += f"\n\nConteúdo completo das notas mais relevantes:\n{notes_text}"
         synth_prompt = (
             f"O usuário pediu: {prompt}\n\n"
             f"Resultados das ferramentas executadas:\n{tool_context}\n\n"
             "Produza uma resposta final concisa em português para o usuário, incorporando os dados relevantes."
         )
-        final_text, _ = await chat_callable(
+        synthesis_model, synthesis_reason = select_model("synthesis", params, model)
+        await _emit(on_progress, {"stage": "synthesis", "model": synthesis_model})
+        (final_text, _), synthesis_elapsed, synthesis_served = await _timed_chat(
+            chat_callable,
             synth_prompt,
-            model=model,
+            synthesis_model,
             temperature=0.2,
             max_tokens=max_tokens,
             timeout=timeout_seconds,
             max_tool_passes=1,
+            **llm_extra,
         )
         synthesized = True
+        routing["synthesis"] = {"model": synthesis_model, "served_by": synthesis_served, "reason": synthesis_reason, "latency_ms": round(synthesis_elapsed * 1000, 1)}
+    if routing_active(params):
+        routing["observed"] = ROUTER.snapshot()
+        executed.append({"tool": "_routing", "args": {}, "result": routing})
     return {"success": True, "text": final_text, "actions": executed, "synthesized": synthesized}
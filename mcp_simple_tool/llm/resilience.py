@@ -0,0 +1,275 @@
+from __future__ import annotations
+"""Camada de resiliência para chamadas ao OpenRouter.
+
+- Circuit breaker por modelo, compartilhado entre requisições do processo:
+  após ``failure_threshold`` falhas seguidas abre e falha rápido por ``reset_seconds``;
+  depois deixa passar uma chamada de teste (half-open).
+- Retries configuráveis com backoff exponencial (sem dormir após a última tentativa).
+- Hedging opcional: dispara uma 2ª requisição se a 1ª passar do p95 observado.
+- Cadeia de fallback: modelos tentados em ordem quando o anterior falha ou estoura timeout.
+
+Configuração via env (``ResiliencePolicy.from_env``): ``LLM_MAX_ATTEMPTS``,
+``LLM_RETRY_BASE_DELAY``, ``LLM_RETRY_MAX_DELAY``, ``LLM_CB_FAILURE_THRESHOLD``,
+``LLM_CB_RESET_SECONDS``, ``LLM_HEDGE_ENABLED``, ``LLM_HEDGE_MIN_DELAY``,
+``LLM_HEDGE_MIN_SAMPLES`` e ``OPENROUTER_FALLBACK_MODELS`` (lista separada por vírgula).
+"""
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from mcp_simple_tool.admission import Overloaded
+
+logger = logging.getLogger("mcp_notes.llm.resilience")
+
+
+class CircuitOpenError(Exception):
+    """Todos os modelos da cadeia estão com o circuito aberto."""
+
+    def __init__(self, models: List[str], retry_after: float) -> None:
+        super().__init__(f"circuit open for models: {', '.join(models)}")
+        self.models = models
+        self.retry_after = retry_after
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class ResiliencePolicy:
+    max_attempts: int = 3
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 5.0
+    failure_threshold: int = 5
+    reset_seconds: float = 30.0
+    hedge_enabled: bool = False
+    hedge_min_delay: float = 1.0
+    hedge_min_samples: int = 20
+    fallback_models: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        fallbacks = [m.strip() for m in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(",") if m.strip()]
+        return cls(
+            max_attempts=max(1, int(os.getenv("LLM_MAX_ATTEMPTS", "3"))),
+            retry_base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1")),
+            retry_max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "5")),
+            failure_threshold=max(1, int(os.getenv("LLM_CB_FAILURE_THRESHOLD", "5"))),
+            reset_seconds=float(os.getenv("LLM_CB_RESET_SECONDS", "30")),
+            hedge_enabled=_env_flag("LLM_HEDGE_ENABLED"),
+            hedge_min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "1")),
+            hedge_min_samples=int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")),
+            fallback_models=fallbacks,
+        )
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                # Uma única chamada de teste; as demais continuam falhando rápido
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def release(self) -> None:
+        """Resultado neutro (erro do cliente): não conta como sucesso nem falha."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probe_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """Janela deslizante de latências (segundos) com percentis."""
+
+    def __init__(self, window: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[idx]
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_LATENCIES: Dict[str, LatencyTracker] = {}
+
+
+def get_breaker(model: str, policy: ResiliencePolicy) -> CircuitBreaker:
+    breaker = _BREAKERS.get(model)
+    if breaker is None:
+        breaker = _BREAKERS.setdefault(model, CircuitBreaker(policy.failure_threshold, policy.reset_seconds))
+    return breaker
+
+
+def get_latency(model: str) -> LatencyTracker:
+    tracker = _LATENCIES.get(model)
+    if tracker is None:
+        tracker = _LATENCIES.setdefault(model, LatencyTracker())
+    return tracker
+
+
+def breaker_state(model: str) -> str:
+    breaker = _BREAKERS.get(model)
+    return breaker.state if breaker is not None else "closed"
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        model: {
+            "state": b.state,
+            "retry_after": round(b.retry_after(), 2),
+            "p95_ms": round((get_latency(model).percentile(95) or 0) * 1000, 1),
+        }
+        for model, b in _BREAKERS.items()
+    }
+
+
+def reset() -> None:
+    _BREAKERS.clear()
+    _LATENCIES.clear()
+
+
+def status_of(exc: BaseException) -> Optional[int]:
+    return getattr(exc, "status_code", None) or getattr(exc, "http_status", None)
+
+
+def _is_fatal(exc: BaseException) -> bool:
+    # Credencial/proxy: nenhum retry ou fallback resolve
+    return status_of(exc) in (401, 403)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    status = status_of(exc)
+    return not status or status >= 500 or status in (408, 429)
+
+
+async def _hedged(call: Callable[[str], Awaitable[Any]], model: str, policy: ResiliencePolicy) -> Any:
+    tracker = get_latency(model)
+    p95 = tracker.percentile(95) if len(tracker) >= policy.hedge_min_samples else None
+    if not policy.hedge_enabled or p95 is None:
+        return await call(model)
+    delay = max(policy.hedge_min_delay, p95)
+    primary = asyncio.ensure_future(call(model))
+    pending = {primary}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return primary.result()
+        logger.info("hedging request model=%s after=%.2fs", model, delay)
+        pending.add(asyncio.ensure_future(call(model)))
+        last_exc: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_exc = task.exception()
+        assert last_exc is not None
+        raise last_exc
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def call_with_resilience(
+    call: Callable[[str], Awaitable[Any]],
+    model: str,
+    policy: Optional[ResiliencePolicy] = None,
+    fallback_models: Optional[List[str]] = None,
+) -> Tuple[Any, str]:
+    """Executa ``call(model_id)`` com breaker/retry/hedge/fallback. Retorna (resposta, modelo usado)."""
+    policy = policy or ResiliencePolicy.from_env()
+    chain: List[str] = []
+    for m in [model, *(fallback_models if fallback_models is not None else policy.fallback_models)]:
+        if m and m not in chain:
+            chain.append(m)
+    last_err: Optional[BaseException] = None
+    skipped: List[str] = []
+    for model_id in chain:
+        breaker = get_breaker(model_id, policy)
+        if not breaker.allow():
+            skipped.append(model_id)
+            continue
+        for attempt in range(policy.max_attempts):
+            started = time.perf_counter()
+            try:
+                resp = await _hedged(call, model_id, policy)
+            except (asyncio.CancelledError, Overloaded):
+                # Fila local cheia não diz nada sobre a saúde do modelo: sem breaker nem retry
+                breaker.release()
+                raise
+            except Exception as e:
+                last_err = e
+                if _is_fatal(e):
+                    breaker.release()
+                    raise
+                if not _is_retryable(e):
+                    breaker.release()
+                    logger.warning("model=%s non-retryable error status=%s; trying fallback", model_id, status_of(e))
+                    break
+                breaker.record_failure()
+                if status_of(e) == 429:
+                    logger.warning("rate limit (429) model=%s attempt=%s", model_id, attempt)
+                if breaker.state != "closed" or attempt == policy.max_attempts - 1:
+                    break
+                await asyncio.sleep(min(policy.retry_base_delay * (2 ** attempt), policy.retry_max_delay))
+                continue
+            breaker.record_success()
+            get_latency(model_id).record(time.perf_counter() - started)
+            if model_id != model:
+                logger.warning("fallback model used model=%s requested=%s", model_id, model)
+            return resp, model_id
+    if last_err is not None:
+        raise last_err
+    retry_after = min((get_breaker(m, policy).retry_after() for m in skipped), default=policy.reset_seconds)
+    raise CircuitOpenError(skipped, retry_after)
@@ -0,0 +1,112 @@
+from __future__ import annotations
+"""Roteamento de modelos por passo (planejamento / síntese), opcionalmente adaptativo.
+
+Modelos por passo: ``params.planning_model`` / ``params.synthesis_model``, senão o
+``model`` da requisição, senão ``OPENROUTER_PLANNING_MODEL`` / ``OPENROUTER_SYNTHESIS_MODEL``.
+
+Com ``LLM_ADAPTIVE_ROUTING=1`` e um pool (``OPENROUTER_PLANNING_POOL`` /
+``OPENROUTER_SYNTHESIS_POOL``, listas separadas por vírgula), o ``ModelRouter``
+escolhe o candidato saudável mais rápido pela latência média móvel (EWMA).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import threading
+
+from .resilience import breaker_state
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "on")
+
+
+def _env_list(name: str) -> List[str]:
+    return [m.strip() for m in os.getenv(name, "").split(",") if m.strip()]
+
+
+class ModelRouter:
+    """Latência (EWMA) e taxa de erro (EWMA) por modelo, compartilhadas entre requisições."""
+
+    def __init__(self, alpha: float = 0.3, max_error_rate: float = 0.5, min_samples: int = 3) -> None:
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, model: str, latency_s: float, ok: bool) -> None:
+        with self._lock:
+            st = self._stats.get(model)
+            if st is None:
+                self._stats[model] = {"latency": latency_s, "error_rate": 0.0 if ok else 1.0, "samples": 1}
+                return
+            a = self.alpha
+            if ok:
+                # Erros rápidos (ex.: timeout de conexão) não devem parecer "modelo rápido"
+                st["latency"] = a * latency_s + (1 - a) * st["latency"]
+            st["error_rate"] = a * (0.0 if ok else 1.0) + (1 - a) * st["error_rate"]
+            st["samples"] += 1
+
+    def _healthy(self, model: str, st: Dict[str, float]) -> bool:
+        if breaker_state(model) == "open":
+            return False
+        return st["error_rate"] <= self.max_error_rate
+
+    def choose(self, pool: List[str]) -> Tuple[str, str]:
+        """Retorna (modelo, motivo). Modelos com poucas amostras são explorados primeiro."""
+        with self._lock:
+            stats = {m: dict(self._stats[m]) for m in pool if m in self._stats}
+        for m in pool:
+            if (m not in stats or stats[m]["samples"] < self.min_samples) and breaker_state(m) != "open":
+                return m, "explore"
+        healthy = [m for m in pool if m in stats and self._healthy(m, stats[m])]
+        if healthy:
+            return min(healthy, key=lambda m: stats[m]["latency"]), "fastest_healthy"
+        # Nenhum saudável: menor taxa de erro
+        return min(pool, key=lambda m: stats.get(m, {}).get("error_rate", 1.0)), "least_errors"
+
+    def snapshot(self, models: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            keys = models if models is not None else list(self._stats)
+            return {
+                m: {
+                    "latency_ms": round(self._stats[m]["latency"] * 1000, 1),
+                    "error_rate": round(self._stats[m]["error_rate"], 3),
+                    "samples": int(self._stats[m]["samples"]),
+                }
+                for m in keys
+                if m in self._stats
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+ROUTER = ModelRouter()
+
+
+def select_model(step: str, params: Dict[str, Any], model: Optional[str]) -> Tuple[Optional[str], str]:
+    """Modelo para o passo ``planning`` ou ``synthesis``. Retorna (modelo, motivo)."""
+    explicit = params.get(f"{step}_model")
+    if explicit:
+        return explicit, "params"
+    if model:
+        return model, "request"
+    pool = _env_list(f"OPENROUTER_{step.upper()}_POOL")
+    if pool and _env_flag("LLM_ADAPTIVE_ROUTING"):
+        return ROUTER.choose(pool)
+    configured = os.getenv(f"OPENROUTER_{step.upper()}_MODEL")
+    if configured:
+        return configured, "env"
+    return None, "default"
+
+
+def routing_active(params: Dict[str, Any]) -> bool:
+    """Relatório de roteamento só quando há escolha por passo (evita ruído em `actions`)."""
+    return bool(
+        params.get("planning_model")
+        or params.get("synthesis_model")
+        or os.getenv("OPENROUTER_PLANNING_MODEL")
+        or os.getenv("OPENROUTER_SYNTHESIS_MODEL")
+        or (_env_flag("LLM_ADAPTIVE_ROUTING") and (_env_list("OPENROUTER_PLANNING_POOL") or _env_list("OPENROUTER_SYNTHESIS_POOL")))
+    )
@@ -0,0 +1,121 @@
+from __future__ import annotations
+"""Prefetch especulativo de ``search_notes`` durante a chamada de planejamento.
+
+Para prompts de leitura a busca que o LLM vai pedir costuma ser previsível pelas
+palavras do prompt. Com ``SPECULATIVE_SEARCH=1`` (ou ``params.speculative_search``)
+o orquestrador dispara uma busca prevista em paralelo ao planejamento e, se a busca
+planejada for igual ou estiver contida na prevista, responde com o resultado já pronto:
+
+- ``hit``: mesmos argumentos;
+- ``covered``: a prevista é mais ampla (query/título planejados contêm os previstos,
+  tags planejadas ⊆ previstas); o resultado é filtrado localmente com a mesma
+  semântica do Supabase (``ilike`` / ``overlaps``) sobre as linhas completas e só
+  depois reduzido a trechos, como o ``search_notes`` normal;
+- ``miss``: a busca planejada roda normalmente e a prevista é descartada
+  (o resultado dela ainda aquece o cache de busca).
+
+``stats()`` expõe as taxas para avaliar se o prefetch compensa.
+"""
+from typing import Any, Dict, List, Optional
+import os
+import re
+import threading
+
+from .intent import parse_intent
+
+_READ_RE = re.compile(
+    r"\b(?:busque|buscar|busca|procure|procurar|pesquise|pesquisar|encontre|encontrar|liste|listar|mostre|mostrar|"
+    r"quais|qual|tenho|existe|existem|sobre|falam)\b|\?",
+    re.IGNORECASE,
+)
+_WRITE_RE = re.compile(r"\b(?:crie|criar|cria|adicione|adicionar|salve|salvar|registre|registrar|anote|apague|edite)\b", re.IGNORECASE)
+_STOPWORDS = {
+    "busque", "buscar", "busca", "procure", "procurar", "pesquise", "pesquisar", "encontre", "encontrar", "liste",
+    "listar", "mostre", "mostrar", "quais", "qual", "tenho", "existe", "existem", "sobre", "falam", "nota", "notas",
+    "minhas", "minha", "meus", "todas", "todos", "alguma", "algum", "algo", "onde", "como", "quando", "para", "pelo",
+    "pela", "com", "sem", "que", "das", "dos", "uma", "umas", "uns", "por", "favor", "tag", "tags", "relacionadas",
+    "contendo", "termo", "mim", "pra", "isso", "esse", "essa", "aquela", "aquele", "acerca",
+}
+_WILDCARDS = set("%_")
+
+_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {"attempts": 0, "hit": 0, "covered": 0, "miss": 0, "unused": 0, "errors": 0}
+
+
+def enabled(params: Dict[str, Any]) -> bool:
+    if "speculative_search" in params:
+        return bool(params["speculative_search"])
+    return os.getenv("SPECULATIVE_SEARCH", "").lower() in ("1", "true", "yes", "on")
+
+
+def predict_search(prompt: str) -> Optional[Dict[str, Any]]:
+    """Argumentos de ``search_notes`` prováveis para o prompt, ou ``None`` se não for leitura."""
+    if not prompt or _WRITE_RE.search(prompt):
+        return None
+    intent = parse_intent(prompt)
+    if intent and intent.tool == "search_notes" and (intent.args.get("query") or intent.args.get("title") or intent.args.get("tags")):
+        return {"query": intent.args.get("query"), "title": intent.args.get("title"), "tags": list(intent.args.get("tags") or [])}
+    if not _READ_RE.search(prompt):
+        return None
+    words = [w for w in re.findall(r"[\wÀ-ÿ-]+", prompt.lower()) if len(w) >= 4 and w not in _STOPWORDS and not w.isdigit()]
+    if not words:
+        return None
+    # Um termo só (o mais específico): ``ilike %termo%`` mais amplo cobre mais buscas planejadas
+    return {"query": max(words, key=len), "title": None, "tags": []}
+
+
+def _norm(args: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "query": (args.get("query") or "").strip().lower() or None,
+        "title": (args.get("title") or "").strip().lower() or None,
+        "tags": sorted({t for t in (args.get("tags") or []) if t}),
+    }
+
+
+def match(predicted: Dict[str, Any], planned: Dict[str, Any]) -> Optional[str]:
+    """``"hit"``, ``"covered"`` ou ``None`` (a prevista não contém a planejada)."""
+    p, q = _norm(predicted), _norm(planned)
+    if p == q:
+        return "hit"
+    for field in ("query", "title"):
+        if p[field] is None:
+            continue
+        if q[field] is None or _WILDCARDS & set(q[field] + p[field]) or p[field] not in q[field]:
+            return None
+    if p["tags"] and not (q["tags"] and set(q["tags"]) <= set(p["tags"])):
+        return None
+    return "covered"
+
+
+def filter_results(results: List[Dict[str, Any]], planned: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aplica localmente os filtros da busca planejada (``ilike`` em content/title, ``overlaps`` em tags)."""
+    q = _norm(planned)
+    out = []
+    for row in results:
+        if q["query"] and q["query"] not in str(row.get("content") or "").lower():
+            continue
+        if q["title"] and q["title"] not in str(row.get("title") or "").lower():
+            continue
+        if q["tags"] and not set(q["tags"]) & set(row.get("tags") or []):
+            continue
+        out.append(row)
+    return out
+
+
+def record(outcome: str) -> None:
+    with _LOCK:
+        _STATS[outcome] = _STATS.get(outcome, 0) + 1
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        snap: Dict[str, Any] = dict(_STATS)
+    decided = snap["hit"] + snap["covered"] + snap["miss"] + snap["unused"]
+    snap["hit_rate"] = round((snap["hit"] + snap["covered"]) / decided, 3) if decided else None
+    return snap
+
+
+def reset() -> None:
+    with _LOCK:
+        for k in _STATS:
+            _STATS[k] = 0
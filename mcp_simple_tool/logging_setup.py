@@ -0,0 +1,158 @@
+from __future__ import annotations
+"""Configuração de logging compartilhada (server MCP, API web e ferramentas).
+
+- ``JsonFormatter``: uma linha JSON por registro, timestamp em cache por segundo.
+- ``QueueHandler``/``QueueListener``: o caminho da requisição só enfileira; a escrita
+  no stream acontece numa thread separada (fora do event loop).
+- ``SamplingFilter``: amostragem (``LOG_SAMPLE_RATE``) e limite por segundo
+  (``LOG_RATE_LIMIT_PER_SEC``) para registros INFO/DEBUG de alta frequência.
+  WARNING ou acima nunca são descartados.
+"""
+from typing import Any, Dict, Optional, Tuple
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+from mcp_simple_tool.jsonutil import dumps
+
+APP_LOGGER = "mcp_notes"
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__()
+        self._ts_sec = -1
+        self._ts_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        sec = int(created)
+        if sec != self._ts_sec:
+            self._ts_sec = sec
+            self._ts_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(sec))
+        return f"{self._ts_prefix}.{int((created - sec) * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self._timestamp(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "func": record.funcName,
+            "line": record.lineno,
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return dumps(payload)
+
+
+class SamplingFilter(logging.Filter):
+    """Descarta parte dos registros < WARNING: amostragem aleatória e teto por segundo por template."""
+
+    def __init__(self, sample_rate: float = 1.0, rate_limit_per_sec: int = 0) -> None:
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit_per_sec = rate_limit_per_sec
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._window = -1
+        self._counts: Dict[Tuple[str, Any], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.dropped += 1
+            return False
+        if self.rate_limit_per_sec > 0:
+            now = int(time.monotonic())
+            key = (record.name, record.msg)
+            with self._lock:
+                if now != self._window:
+                    self._window = now
+                    self._counts.clear()
+                count = self._counts.get(key, 0) + 1
+                self._counts[key] = count
+            if count > self.rate_limit_per_sec:
+                self.dropped += 1
+                return False
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve mensagem/traceback aqui (objetos em args podem mudar depois) mas deixa
+        # a formatação JSON para a thread do listener.
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_LOCK = threading.Lock()
+_LISTENER: Optional[logging.handlers.QueueListener] = None
+_FILTER: Optional[SamplingFilter] = None
+
+
+def _level_from_env() -> int:
+    level_name = (os.getenv("MCP_LOG_LEVEL") or os.getenv("LOG_LEVEL") or "INFO").upper()
+    return getattr(logging, level_name, logging.INFO)
+
+
+def build_queue_handler(target: logging.Handler, sampling: Optional[SamplingFilter] = None) -> Tuple[logging.Handler, logging.handlers.QueueListener]:
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _QueueHandler(q)
+    if sampling is not None:
+        handler.addFilter(sampling)
+    listener = logging.handlers.QueueListener(q, target, respect_handler_level=True)
+    return handler, listener
+
+
+def configure_logging() -> logging.Logger:
+    """Configura (uma vez por processo) o logger ``mcp_notes`` com fila + JSON; idempotente."""
+    global _LISTENER, _FILTER
+    level = _level_from_env()
+    app_logger = logging.getLogger(APP_LOGGER)
+    with _LOCK:
+        if _LISTENER is not None:
+            return app_logger
+        # Logs de terceiros (uvicorn, mcp) continuam no formato padrão, em stderr
+        logging.basicConfig(level=level)
+        stream = logging.StreamHandler()
+        stream.setLevel(level)
+        stream.setFormatter(JsonFormatter())
+        _FILTER = SamplingFilter(
+            sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1")),
+            rate_limit_per_sec=int(os.getenv("LOG_RATE_LIMIT_PER_SEC", "0")),
+        )
+        handler, _LISTENER = build_queue_handler(stream, _FILTER)
+        app_logger.handlers[:] = [handler]
+        app_logger.setLevel(level)
+        # Evita duplicar logs em loggers pais
+        app_logger.propagate = False
+        _LISTENER.start()
+        atexit.register(shutdown_logging)
+    return app_logger
+
+
+def shutdown_logging() -> None:
+    """Esvazia a fila e para a thread do listener."""
+    global _LISTENER
+    with _LOCK:
+        if _LISTENER is not None:
+            _LISTENER.stop()
+            _LISTENER = None
+
+
+def dropped_records() -> int:
+    return _FILTER.dropped if _FILTER else 0
@@ -0,0 +1,214 @@
+from __future__ import annotations
+"""Profiling sob demanda (API web e servidor MCP).
+
+- ``SamplingProfiler``: profiler estatístico de relógio de parede; uma thread lê
+  ``sys._current_frames()`` a cada ``PROFILE_INTERVAL_MS`` e conta pilhas no formato
+  "collapsed" (``thread;frame;frame N``), aceito por flamegraph.pl / speedscope.
+  Mede tempo real, incluindo espera de I/O, sem instrumentar o código.
+- ``request_scope``: envolve um turno de ``/api/chat`` ou um ``call_tool`` do MCP.
+  Com ``PROFILING_ENABLED`` uma fração ``PROFILE_SAMPLE_RATE`` das requisições é
+  amostrada e o resultado vai para ``PROFILE_DIR``. Independente disso, requisições
+  acima de ``SLOW_REQUEST_MS`` geram um log WARNING com o tempo de cada etapa.
+- ``profile_process``: captura o processo inteiro por N segundos (``POST /debug/profile``).
+
+Um profiler por vez no processo: amostras de requisições são puladas enquanto outro
+estiver ativo, e a captura manual recebe ``ProfilerBusy``.
+"""
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from mcp_simple_tool.jsonutil import dumps
+
+logger = logging.getLogger("mcp_notes.profiling")
+slow_logger = logging.getLogger("mcp_notes.slow_requests")
+
+_ACTIVE = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Já existe um profiler rodando neste processo."""
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").lower() in ("1", "true", "yes", "on")
+
+
+def enabled() -> bool:
+    return _env_flag("PROFILING_ENABLED")
+
+
+def sample_rate() -> float:
+    return min(1.0, max(0.0, float(os.getenv("PROFILE_SAMPLE_RATE", "0.01"))))
+
+
+def profile_dir() -> str:
+    return os.getenv("PROFILE_DIR", "profiles")
+
+
+def slow_threshold_ms() -> float:
+    return float(os.getenv("SLOW_REQUEST_MS", "0"))
+
+
+def _frame_label(code: Any) -> str:
+    parts = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({'/'.join(parts[-2:])}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: Optional[float] = None) -> None:
+        self.interval = interval if interval is not None else float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fold(self, frame: Any, thread_name: str) -> str:
+        labels = self._labels
+        names: List[str] = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _frame_label(code)
+            names.append(label)
+            frame = frame.f_back
+        names.append(thread_name)
+        return ";".join(reversed(names))
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            threads = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.stacks[self._fold(frame, threads.get(ident, str(ident)))] += 1
+            self.samples += 1
+
+    def start(self) -> "SamplingProfiler":
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+    def top(self, limit: int = 15) -> List[Dict[str, Any]]:
+        """Funções com mais amostras no topo da pilha (self time)."""
+        leaf: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            leaf[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaf.values()) or 1
+        return [{"frame": f, "samples": n, "pct": round(100 * n / total, 1)} for f, n in leaf.most_common(limit)]
+
+    def dump(self, label: str) -> str:
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}-{os.getpid()}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def summary(self, path: Optional[str] = None) -> Dict[str, Any]:
+        return {"samples": self.samples, "seconds": round(self.duration, 3), "path": path, "top": self.top()}
+
+
+def profile_process(seconds: float, label: str = "process") -> Dict[str, Any]:
+    """Amostra todas as threads por ``seconds`` (bloqueia; chamar fora do event loop)."""
+    if not _ACTIVE.acquire(blocking=False):
+        raise ProfilerBusy("profiler already running")
+    try:
+        prof = SamplingProfiler().start()
+        time.sleep(seconds)
+        prof.stop()
+        return prof.summary(prof.dump(label))
+    finally:
+        _ACTIVE.release()
+
+
+def _finish_sample(prof: SamplingProfiler, label: str) -> Optional[str]:
+    """Para o profiler da requisição e grava o dump (join + escrita: roda fora do event loop)."""
+    try:
+        prof.stop()
+        return prof.dump(label)
+    except Exception:
+        logger.exception("failed writing profile label=%s", label)
+        return None
+    finally:
+        _ACTIVE.release()
+
+
+class StageTimer:
+    """Marca o início de cada etapa; serve também de callback ``on_progress`` do orquestrador."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, stage: str) -> None:
+        self.marks.append((stage, time.perf_counter()))
+
+    def wrap(self, on_progress: Callable[[Dict[str, Any]], Any] | None) -> Callable[[Dict[str, Any]], Any]:
+        def callback(event: Dict[str, Any]) -> Any:
+            self.mark(str(event.get("stage", "?")))
+            return on_progress(event) if on_progress is not None else None
+        return callback
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def stages(self) -> List[Dict[str, Any]]:
+        end = time.perf_counter()
+        points = [("setup", self.started)] + self.marks
+        out = []
+        for i, (stage, t) in enumerate(points):
+            nxt = points[i + 1][1] if i + 1 < len(points) else end
+            if stage == "setup" and nxt == t:
+                continue
+            out.append({"stage": stage, "ms": round((nxt - t) * 1000, 1)})
+        return out
+
+
+@asynccontextmanager
+async def request_scope(kind: str, name: str) -> AsyncIterator[StageTimer]:
+    """Timer de etapas + profiler amostrado (se habilitado) em volta de uma requisição."""
+    timer = StageTimer()
+    prof: Optional[SamplingProfiler] = None
+    if enabled() and random.random() < sample_rate() and _ACTIVE.acquire(blocking=False):
+        prof = SamplingProfiler().start()
+    error: Optional[str] = None
+    try:
+        yield timer
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        elapsed = timer.elapsed_ms()
+        path = None
+        if prof is not None:
+            # shield: mesmo se a requisição for cancelada aqui, a thread termina e libera _ACTIVE
+            path = await asyncio.shield(asyncio.to_thread(_finish_sample, prof, f"{kind}-{name}"))
+        threshold = slow_threshold_ms()
+        if threshold > 0 and elapsed >= threshold:
+            slow_logger.warning(
+                "slow request kind=%s name=%s ms=%.1f error=%s profile=%s stages=%s",
+                kind, name, elapsed, error, path, dumps(timer.stages()),
+            )
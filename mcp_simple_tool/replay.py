@@ -0,0 +1,378 @@
+from __future__ import annotations
+"""Gravação e replay determinístico de turnos do ``notes_chat``.
+
+Gravação: ``Recorder`` envolve ``chat_with_tools`` e as funções de ferramenta
+(add_note, search_notes, list_tags, get_notes) e registra prompts, tool calls,
+resultados do Supabase e tempos. Cada turno vira uma linha NDJSON na fixture.
+Em produção basta ``REPLAY_RECORD_PATH`` (fração ``REPLAY_RECORD_SAMPLE_RATE``,
+default 1.0); o arquivo contém prompts e notas reais, trate como dado sensível.
+
+Replay: ``Replayer`` devolve as respostas gravadas, sem rede, esperando o tempo
+original dividido por ``speed`` (0 = sem espera). Chamadas ao LLM são casadas por
+ordem; ferramentas por (nome, argumentos). Chamadas não gravadas (ex.: código novo
+que busca algo diferente) recebem erro ``replay_miss`` e entram no relatório.
+
+Uso::
+
+    python -m mcp_simple_tool.replay record prompts.txt --out sessao.ndjson
+    python -m mcp_simple_tool.replay run sessao.ndjson --speed 10 --target api --concurrency 4
+"""
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import click
+
+from mcp_simple_tool.jsonutil import dumps, loads
+
+logger = logging.getLogger("mcp_notes.replay")
+
+FORMAT_VERSION = 1
+TOOL_NAMES = ("add_note", "search_notes", "list_tags", "get_notes")
+_LLM_KWARGS = ("temperature", "max_tokens", "max_tool_passes", "fallback_models")
+_WRITE_LOCK = threading.Lock()
+
+
+class ReplayMismatch(Exception):
+    """O código fez mais chamadas ao LLM do que a gravação contém."""
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+# ---------------------------------------------------------------- gravação
+class Recorder:
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, event: Dict[str, Any]) -> None:
+        with self._lock:
+            self.events.append(event)
+
+    def wrap_chat(self, chat_func: Callable[..., Any]) -> Callable[..., Any]:
+        async def chat(prompt: str, **kw: Any) -> Tuple[str, List[Dict[str, Any]]]:
+            event: Dict[str, Any] = {
+                "kind": "llm", "at_ms": _ms(self.started), "prompt": prompt, "model": kw.get("model"),
+                "kwargs": {k: kw[k] for k in _LLM_KWARGS if k in kw}, "history": len(kw.get("history") or []),
+            }
+            t0 = time.perf_counter()
+            try:
+                text, actions = await chat_func(prompt, **kw)
+            except Exception as e:
+                self._add({**event, "ms": _ms(t0), "error": str(e)})
+                raise
+            self._add({**event, "ms": _ms(t0), "text": text, "actions": actions})
+            return text, actions
+        return chat
+
+    def wrap_tool(self, name: str, func: Callable[..., Dict[str, Any]] | None) -> Callable[..., Dict[str, Any]] | None:
+        if func is None:
+            return None
+
+        def tool(*args: Any, **kw: Any) -> Dict[str, Any]:
+            event: Dict[str, Any] = {"kind": "tool", "at_ms": _ms(self.started), "tool": name, "args": list(args)}
+            if kw:
+                event["kwargs"] = kw
+            t0 = time.perf_counter()
+            try:
+                result = func(*args, **kw)
+            except Exception as e:
+                self._add({**event, "ms": _ms(t0), "error": str(e)})
+                raise
+            self._add({**event, "ms": _ms(t0), "result": result})
+            return result
+        return tool
+
+    def turn(self, prompt: str, model: Optional[str], params: Dict[str, Any], payload: Any = None, error: Optional[str] = None) -> Dict[str, Any]:
+        turn: Dict[str, Any] = {
+            "version": FORMAT_VERSION, "recorded_at": time.time(), "prompt": prompt, "model": model,
+            "params": params, "ms": _ms(self.started), "events": sorted(self.events, key=lambda e: e["at_ms"]),
+        }
+        if error is not None:
+            turn["error"] = error
+        else:
+            turn["result"] = payload
+        return turn
+
+
+def recording_path() -> Optional[str]:
+    path = os.getenv("REPLAY_RECORD_PATH")
+    if not path or random.random() >= float(os.getenv("REPLAY_RECORD_SAMPLE_RATE", "1")):
+        return None
+    return path
+
+
+def append_turn(path: str, turn: Dict[str, Any]) -> None:
+    line = dumps(turn) + "\n"
+    with _WRITE_LOCK, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def load_turns(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [loads(line) for line in f if line.strip()]
+
+
+# ---------------------------------------------------------------- replay
+class Replayer:
+    def __init__(self, turn: Dict[str, Any], speed: float = 1.0) -> None:
+        self.speed = speed
+        events = turn.get("events") or []
+        self._llm: Deque[Dict[str, Any]] = deque(e for e in events if e["kind"] == "llm")
+        self._tools: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        for e in events:
+            if e["kind"] == "tool":
+                self._tools[self._tool_key(e["tool"], e["args"], e.get("kwargs"))].append(e)
+        self._lock = threading.Lock()
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.misses: List[Dict[str, Any]] = []
+        self.divergent_prompts = 0
+
+    @staticmethod
+    def _tool_key(name: str, args: Iterable[Any], kwargs: Optional[Dict[str, Any]] = None) -> str:
+        # kwargs fazem parte da chamada: a busca especulativa (full=True) não pode casar com a normal
+        return dumps([name, list(args), sorted((kwargs or {}).items())])
+
+    def _delay(self, event: Dict[str, Any]) -> float:
+        return event.get("ms", 0) / 1000 / self.speed if self.speed > 0 else 0.0
+
+    async def chat(self, prompt: str, **kw: Any) -> Tuple[str, List[Dict[str, Any]]]:
+        if not self._llm:
+            raise ReplayMismatch(f"chamada ao LLM #{self.llm_calls + 1} não gravada")
+        event = self._llm.popleft()
+        self.llm_calls += 1
+        if event.get("prompt") != prompt:
+            self.divergent_prompts += 1
+        delay = self._delay(event)
+        if delay:
+            await asyncio.sleep(delay)
+        if "error" in event:
+            raise RuntimeError(event["error"])
+        return event.get("text") or "", event.get("actions") or []
+
+    def tool(self, name: str) -> Callable[..., Dict[str, Any]]:
+        def replay_tool(*args: Any, **kw: Any) -> Dict[str, Any]:
+            key = self._tool_key(name, args, kw)
+            with self._lock:
+                self.tool_calls += 1
+                queue = self._tools.get(key)
+                event = queue.popleft() if queue else None
+                if event is None:
+                    self.misses.append({"tool": name, "args": list(args), **({"kwargs": kw} if kw else {})})
+            if event is None:
+                return {"success": False, "error": "replay: chamada não gravada", "code": "replay_miss"}
+            delay = self._delay(event)
+            if delay:
+                time.sleep(delay)  # ferramentas rodam em thread (run_limited), como o cliente real
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            return event["result"]
+        return replay_tool
+
+    def tool_funcs(self) -> Dict[str, Callable[..., Dict[str, Any]]]:
+        return {f"{name}_func": self.tool(name) for name in TOOL_NAMES}
+
+
+_CURRENT: ContextVar[Replayer] = ContextVar("replay_current")
+
+
+def _current_chat(prompt: str, **kw: Any) -> Any:
+    return _CURRENT.get().chat(prompt, **kw)
+
+
+def _current_tool(name: str) -> Callable[..., Dict[str, Any]]:
+    def tool(*args: Any, **kw: Any) -> Dict[str, Any]:
+        return _CURRENT.get().tool(name)(*args, **kw)
+    return tool
+
+
+@contextmanager
+def patched_app() -> Iterator[None]:
+    """Troca LLM e ferramentas usados por ``/api/chat`` pelos do replay do turno corrente (ContextVar)."""
+    from mcp_simple_tool.llm import orchestrator
+    from mcp_simple_tool.webapp import app as webapp
+
+    targets: List[Tuple[Any, str, Any]] = [(orchestrator, "chat_with_tools", _current_chat)]
+    targets += [(webapp, f"{name}_tool", _current_tool(name)) for name in TOOL_NAMES]
+    saved = [(mod, attr, getattr(mod, attr)) for mod, attr, _ in targets]
+    for mod, attr, value in targets:
+        setattr(mod, attr, value)
+    try:
+        yield
+    finally:
+        for mod, attr, value in saved:
+            setattr(mod, attr, value)
+
+
+async def _run_orchestrator(turn: Dict[str, Any], replayer: Replayer) -> Dict[str, Any]:
+    from mcp_simple_tool.llm.orchestrator import run_notes_chat
+
+    return await run_notes_chat(
+        turn["prompt"], model=turn.get("model"), params=dict(turn.get("params") or {}),
+        chat_func=replayer.chat, **replayer.tool_funcs(),
+    )
+
+
+async def _run_api(turn: Dict[str, Any], replayer: Replayer, client: Any) -> Dict[str, Any]:
+    body = {"message": turn["prompt"], "model": turn.get("model"), "params": turn.get("params") or {}}
+    _CURRENT.set(replayer)  # task própria por turno: cada requisição vê o seu replayer
+    resp = await client.post("/api/chat", json=body, headers={"x-api-key": os.getenv("AUTH_API_KEY", "")})
+    if resp.status_code != 200:
+        raise RuntimeError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+    return resp.json()["response"]
+
+
+async def replay_turn(turn: Dict[str, Any], speed: float = 1.0, target: str = "orchestrator", client: Any = None) -> Dict[str, Any]:
+    """Reexecuta um turno gravado contra o código atual; devolve o relatório do turno."""
+    replayer = Replayer(turn, speed)
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"prompt": turn["prompt"][:80], "recorded_ms": turn.get("ms")}
+    try:
+        if target == "api":
+            payload = await _run_api(turn, replayer, client)
+        else:
+            payload = await _run_orchestrator(turn, replayer)
+        recorded = turn.get("result") or {}
+        report["text_match"] = payload.get("text") == recorded.get("text")
+    except Exception as e:
+        report["error"] = str(e)[:300]
+        report["text_match"] = False
+    report.update({
+        "replayed_ms": _ms(started), "llm_calls": replayer.llm_calls, "tool_calls": replayer.tool_calls,
+        "misses": replayer.misses, "divergent_prompts": replayer.divergent_prompts,
+    })
+    return report
+
+
+def _pct(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+
+
+async def replay_turns(turns: List[Dict[str, Any]], speed: float = 1.0, target: str = "orchestrator", concurrency: int = 1) -> Dict[str, Any]:
+    """Replay de vários turnos (até ``concurrency`` simultâneos) com resumo de latência."""
+    sem = asyncio.Semaphore(max(1, concurrency))
+    client = None
+    if target == "api":
+        import httpx
+        from mcp_simple_tool.webapp.app import app
+
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay")
+
+    async def one(turn: Dict[str, Any]) -> Dict[str, Any]:
+        async with sem:
+            return await replay_turn(turn, speed, target, client)
+
+    started = time.perf_counter()
+    with patched_app() if target == "api" else nullcontext():
+        try:
+            reports = await asyncio.gather(*(one(t) for t in turns))
+        finally:
+            if client is not None:
+                await client.aclose()
+    elapsed = time.perf_counter() - started
+    replayed = [r["replayed_ms"] for r in reports if "error" not in r]
+    recorded = [r["recorded_ms"] for r in reports if r.get("recorded_ms") is not None]
+    return {
+        "turns": len(reports),
+        "errors": sum(1 for r in reports if "error" in r),
+        "text_mismatches": sum(1 for r in reports if not r["text_match"]),
+        "misses": sum(len(r["misses"]) for r in reports),
+        "divergent_prompts": sum(r["divergent_prompts"] for r in reports),
+        "recorded_ms": {"p50": _pct(recorded, 0.5), "p95": _pct(recorded, 0.95)},
+        "replayed_ms": {"p50": _pct(replayed, 0.5), "p95": _pct(replayed, 0.95)},
+        "turns_per_sec": round(len(reports) / elapsed, 2) if elapsed > 0 else None,
+        "reports": list(reports),
+    }
+
+
+# ---------------------------------------------------------------- CLI
+@contextmanager
+def _env(**values: Optional[str]) -> Iterator[None]:
+    """Variáveis de ambiente só durante o comando (``None`` remove); restaura as anteriores."""
+    saved = {k: os.environ.get(k) for k in values}
+    for k, v in values.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+@click.group()
+def cli() -> None:
+    """Grava e reexecuta turnos do notes_chat (fixtures NDJSON)."""
+
+
+@cli.command("record")
+@click.argument("prompts", type=click.File("r", encoding="utf-8"))
+@click.option("--out", required=True, help="Fixture NDJSON (acrescenta turnos)")
+@click.option("--model", default=None, help="Modelo OpenRouter")
+def record_cmd(prompts: Any, out: str, model: Optional[str]) -> None:
+    """Executa cada linha de PROMPTS ao vivo (OpenRouter + Supabase) gravando a fixture."""
+    from mcp_simple_tool.llm.orchestrator import run_notes_chat
+    from mcp_simple_tool.tools.notes import add_note_tool, get_notes_tool, list_tags_tool, search_notes_tool
+
+    async def run_all() -> int:
+        done = 0
+        for line in prompts:
+            if not line.strip():
+                continue
+            try:
+                await run_notes_chat(
+                    line.strip(), model=model, add_note_func=add_note_tool, search_notes_func=search_notes_tool,
+                    list_tags_func=list_tags_tool, get_notes_func=get_notes_tool,
+                )
+            except Exception as e:  # turno com erro também é gravado
+                click.echo(f"erro: {str(e)[:200]}", err=True)
+            done += 1
+        return done
+
+    with _env(REPLAY_RECORD_PATH=out, REPLAY_RECORD_SAMPLE_RATE="1"):
+        done = asyncio.run(run_all())
+    click.echo(f"turnos gravados: {done}", err=True)
+
+
+@cli.command("run")
+@click.argument("fixture")
+@click.option("--speed", default=1.0, type=float, help="Fator de aceleração (0 = sem esperas)")
+@click.option("--target", type=click.Choice(["orchestrator", "api"]), default="orchestrator", help="run_notes_chat direto ou POST /api/chat")
+@click.option("--concurrency", default=1, type=int, help="Turnos simultâneos")
+@click.option("--strict", is_flag=True, help="Sai com erro se houver divergência")
+@click.option("--verbose", is_flag=True, help="Inclui relatório por turno")
+def run_cmd(fixture: str, speed: float, target: str, concurrency: int, strict: bool, verbose: bool) -> None:
+    overrides: Dict[str, Optional[str]] = {"REPLAY_RECORD_PATH": None}
+    if target == "api":
+        # Replay não deve esbarrar no rate limit nem gravar no histórico real
+        overrides.update(RATE_LIMIT_PER_MIN="0", DISABLE_PERSISTENCE=os.getenv("DISABLE_PERSISTENCE") or "1")
+    with _env(**overrides):
+        summary = asyncio.run(replay_turns(load_turns(fixture), speed, target, concurrency))
+    if not verbose:
+        summary.pop("reports")
+    click.echo(dumps(summary))
+    if strict and (summary["errors"] or summary["text_mismatches"] or summary["misses"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    cli()
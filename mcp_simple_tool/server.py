@@ -1,32 +1,29 @@
 from __future__ import annotations
 
-from typing import Any, List
+from typing import Any, Dict, List, Tuple
 import os
-import json
 import logging
 import ssl
 import anyio
-import httpx
 import click
 
 import mcp.types as types
 from mcp.server.lowlevel import Server
 
-# Opcional: usar repositório de certificados do Windows
-try:
-    import truststore  # type: ignore
-    truststore.inject_into_ssl()
-except Exception:
-    pass
-
-# Funções utilitárias (Supabase)
-from mcp_simple_tool.tools.notes import add_note_tool, search_notes_tool
-from mcp_simple_tool.llm.openrouter_client import chat_with_tools
+# Funções utilitárias (Supabase). Dependências pesadas (supabase, openai, truststore)
+# são importadas só no primeiro uso de ferramenta para acelerar o `initialize`.
+from mcp_simple_tool.tools.notes import add_note_tool, get_notes_tool, search_notes_tool, list_tags_tool
 from mcp_simple_tool.llm.orchestrator import run_notes_chat
+from mcp_simple_tool.jsonutil import dumps
+from mcp_simple_tool.admission import Overloaded, run_limited
+from mcp_simple_tool.logging_setup import configure_logging
+from mcp_simple_tool import profiling
+
+# Resultado de ferramenta: blocos de conteúdo + structuredContent (MCP)
+ToolResult = Tuple[List[types.ContentBlock], Dict[str, Any]]
 
+configure_logging()
 logger = logging.getLogger("mcp_notes.server")
-if not logger.handlers:
-    logging.basicConfig(level=os.getenv("MCP_LOG_LEVEL") or os.getenv("LOG_LEVEL") or "INFO")
 
 
 def _env_flag(name: str) -> bool:
@@ -38,7 +35,38 @@ def notes_chat_enabled() -> bool:
     return _env_flag("ENABLE_NOTES_CHAT") and bool(os.getenv("OPENROUTER_API_KEY"))
 
 
-async def fetch_website(url: str) -> List[types.ContentBlock]:
+_TRUSTSTORE_READY = False
+
+
+def _ensure_truststore() -> None:
+    """Opcional: usa repositório de certificados do sistema (Windows); feito antes da 1ª conexão."""
+    global _TRUSTSTORE_READY
+    if _TRUSTSTORE_READY:
+        return
+    _TRUSTSTORE_READY = True
+    try:
+        import truststore  # type: ignore
+        truststore.inject_into_ssl()
+    except Exception:
+        pass
+
+
+def _json_result(payload: Dict[str, Any]) -> ToolResult:
+    """structuredContent + bloco de texto com o mesmo JSON compacto (clientes sem suporte a structured)."""
+    return [types.TextContent(type="text", text=dumps(payload))], payload
+
+
+async def _limited_tool(func: Any, *args: Any) -> ToolResult:
+    """Ferramenta Supabase numa thread, sob o limite compartilhado com a API web."""
+    try:
+        return _json_result(await run_limited("supabase", func, *args))
+    except Overloaded as e:
+        return _json_result(e.to_meta())
+
+
+async def fetch_website(url: str) -> ToolResult:
+    import httpx
+
     headers = {"User-Agent": "MCP Test Server (github.com/modelcontextprotocol/python-sdk)"}
     insecure = os.getenv("MCP_INSECURE_SKIP_VERIFY", "").lower() in ("1", "true", "yes")
     verify: bool | ssl.SSLContext = False if insecure else True
@@ -46,21 +74,24 @@ async def fetch_website(url: str) -> List[types.ContentBlock]:
     async with httpx.AsyncClient(headers=headers, verify=verify, follow_redirects=True, timeout=30) as client:
         resp = await client.get(url)
         resp.raise_for_status()
-        return [types.TextContent(type="text", text=resp.text)]
+        meta = {"url": str(resp.url), "status": resp.status_code, "content_type": resp.headers.get("content-type"), "chars": len(resp.text)}
+        return [types.TextContent(type="text", text=resp.text)], meta
 
 
-@click.command()
-@click.option("--port", default=8000, help="Port to listen on for SSE")
-@click.option("--transport", type=click.Choice(["stdio", "sse"]), default="stdio", help="Transport type")
-def main(port: int, transport: str) -> int:
+def create_server() -> Server:
     app = Server("mcp-note-server")
 
-    # Handler único de ferramentas
+    # Handler único de ferramentas (timer de etapas / profiling amostrado em volta de cada chamada)
     @app.call_tool()
-    async def handle_tools(name: str, arguments: dict[str, Any]) -> List[types.ContentBlock]:
+    async def handle_tools(name: str, arguments: dict[str, Any]) -> ToolResult:
+        async with profiling.request_scope("mcp", name) as timer:
+            return await _dispatch_tool(name, arguments, timer)
+
+    async def _dispatch_tool(name: str, arguments: dict[str, Any], timer: profiling.StageTimer) -> ToolResult:
+        _ensure_truststore()
         if name == "notes_chat":
             if not notes_chat_enabled():
-                return [types.TextContent(type="text", text=json.dumps({"success": False, "error": "notes_chat desabilitado (defina ENABLE_NOTES_CHAT=1 e OPENROUTER_API_KEY)"}))]
+                return _json_result({"success": False, "error": "notes_chat desabilitado (defina ENABLE_NOTES_CHAT=1 e OPENROUTER_API_KEY)"})
             try:
                 payload = await run_notes_chat(
                     (arguments or {}).get("prompt"),
@@ -68,11 +99,16 @@ def main(port: int, transport: str) -> int:
                     params=(arguments or {}).get("params") or {},
                     add_note_func=add_note_tool,
                     search_notes_func=search_notes_tool,
+                    list_tags_func=list_tags_tool,
+                    get_notes_func=get_notes_tool,
+                    on_progress=timer.wrap(None),
                 )
-                return [types.TextContent(type="text", text=json.dumps(payload, ensure_ascii=False))]
+                return _json_result(payload)
+            except Overloaded as e:
+                return _json_result(e.to_meta())
             except Exception as e:  # pragma: no cover
                 logger.exception("notes_chat error")
-                return [types.TextContent(type="text", text=json.dumps({"success": False, "error": str(e)}))]
+                return _json_result({"success": False, "error": str(e)})
         if name == "fetch":
             url = arguments.get("url")
             if not url:
@@ -85,15 +121,22 @@ def main(port: int, transport: str) -> int:
             tags = arguments.get("tags", [])
             if content is None or title is None:
                 raise ValueError("Missing required 'content' or 'title'")
-            result = add_note_tool(content, title, tags)
-            return [types.TextContent(type="text", text=str(result))]
+            return await _limited_tool(add_note_tool, content, title, tags, arguments.get("idempotency_key"))
 
         if name == "search_notes":
             query = arguments.get("query")
             title = arguments.get("title")
             tags = arguments.get("tags", [])
-            result = search_notes_tool(query, title, tags)
-            return [types.TextContent(type="text", text=str(result))]
+            return await _limited_tool(search_notes_tool, query, title, tags)
+
+        if name == "list_tags":
+            return await _limited_tool(list_tags_tool, arguments.get("prefix"), arguments.get("limit", 50))
+
+        if name == "get_notes":
+            ids = arguments.get("ids")
+            if not isinstance(ids, list):
+                raise ValueError("Missing required 'ids' (array)")
+            return await _limited_tool(get_notes_tool, ids)
 
         raise ValueError(f"Unknown tool: {name}")
 
@@ -119,6 +162,11 @@ def main(port: int, transport: str) -> int:
                                     "temperature": {"type": "number"},
                                     "max_tokens": {"type": "integer"},
                                     "timeout_seconds": {"type": "number", "description": "Timeout por chamada (default 60)"},
+                                    "fallback_models": {"type": "array", "items": {"type": "string"}, "description": "Modelos tentados em ordem se o principal falhar"},
+                                    "planning_model": {"type": "string", "description": "Modelo do passo de planejamento (tool calling)"},
+                                    "synthesis_model": {"type": "string", "description": "Modelo do passo de síntese final"},
+                                    "fast_path": {"type": "boolean", "description": "Comandos simples sem LLM (default true)"},
+                                    "speculative_search": {"type": "boolean", "description": "Busca prevista em paralelo ao planejamento (default SPECULATIVE_SEARCH)"},
                                 },
                             },
                         },
@@ -153,13 +201,17 @@ def main(port: int, transport: str) -> int:
                                 "items": {"type": "string"},
                                 "description": "Lista de tags associadas à nota",
                             },
+                            "idempotency_key": {
+                                "type": "string",
+                                "description": "Chave opcional: retries com a mesma chave devolvem a nota já criada",
+                            },
                         },
                     },
                 ),
                 types.Tool(
                     name="search_notes",
                     title="Search Notes",
-                    description="Busca notas no Supabase",
+                    description="Busca notas no Supabase (resultados com trecho do conteúdo; use get_notes para o texto completo)",
                     inputSchema={
                         "type": "object",
                         "properties": {
@@ -173,10 +225,100 @@ def main(port: int, transport: str) -> int:
                         },
                     },
                 ),
+                types.Tool(
+                    name="get_notes",
+                    title="Get Notes",
+                    description="Retorna notas completas (com conteúdo) pelos ids, em lote",
+                    inputSchema={
+                        "type": "object",
+                        "required": ["ids"],
+                        "properties": {
+                            "ids": {
+                                "type": "array",
+                                "items": {"type": ["integer", "string"]},
+                                "description": "Ids das notas (máx. 50)",
+                            },
+                        },
+                    },
+                ),
+                types.Tool(
+                    name="list_tags",
+                    title="List Tags",
+                    description="Lista as tags em uso com contagem de notas; use prefix para autocomplete",
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "prefix": {"type": "string", "description": "Prefixo da tag (case-insensitive)"},
+                            "limit": {"type": "integer", "description": "Máximo de tags retornadas (default 50)"},
+                        },
+                    },
+                ),
             ]
         )
         return tools
 
+    return app
+
+
+def create_http_app():
+    """App ASGI do transporte streamable HTTP em modo stateless (factory usada pelos workers uvicorn).
+
+    Sem estado de sessão no processo: qualquer worker/instância atrás de um load balancer
+    atende qualquer requisição. Configuração via env, pois workers são processos novos.
+    """
+    import contextlib
+    from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+
+    app = create_server()
+    session_manager = StreamableHTTPSessionManager(
+        app=app,
+        json_response=_env_flag("MCP_HTTP_JSON_RESPONSE"),
+        stateless=True,
+    )
+
+    async def handle_streamable_http(scope, receive, send):
+        await session_manager.handle_request(scope, receive, send)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(_app):
+        async with session_manager.run():
+            yield
+
+    return Starlette(
+        debug=_env_flag("MCP_DEBUG"),
+        routes=[Mount("/mcp", app=handle_streamable_http)],
+        lifespan=lifespan,
+    )
+
+
+@click.command()
+@click.option("--port", default=8000, help="Port to listen on for SSE/HTTP")
+@click.option("--host", default=lambda: os.getenv("MCP_HOST", "127.0.0.1"), help="Host to bind for SSE/HTTP")
+@click.option("--transport", type=click.Choice(["stdio", "sse", "http"]), default="stdio", help="Transport type")
+@click.option("--workers", default=lambda: int(os.getenv("MCP_WORKERS", 1)), type=int, help="Worker processes (http only)")
+@click.option("--keep-alive", "keep_alive", default=lambda: int(os.getenv("MCP_KEEP_ALIVE", 5)), type=int, help="HTTP keep-alive timeout in seconds (http only)")
+@click.option("--json-response", is_flag=True, default=False, help="Reply with JSON instead of SSE streams (http only)")
+def main(port: int, host: str, transport: str, workers: int, keep_alive: int, json_response: bool) -> int:
+    if transport == "http":
+        import uvicorn
+
+        if json_response:
+            os.environ["MCP_HTTP_JSON_RESPONSE"] = "1"
+        # Import string + factory: cada worker constrói seu próprio app
+        uvicorn.run(
+            "mcp_simple_tool.server:create_http_app",
+            factory=True,
+            host=host,
+            port=port,
+            workers=workers,
+            timeout_keep_alive=keep_alive,
+        )
+        return 0
+
+    app = create_server()
+
     if transport == "sse":
         # Modo SSE opcional (requer starlette e uvicorn)
         from mcp.server.sse import SseServerTransport
@@ -194,10 +336,13 @@ def main(port: int, transport: str) -> int:
             return Response()
 
         starlette_app = Starlette(
-            debug=True,
+            debug=_env_flag("MCP_DEBUG"),
             routes=[Route("/sse", endpoint=handle_sse, methods=["GET"]), Mount("/messages/", app=sse.handle_post_message)],
         )
-        uvicorn.run(starlette_app, host="127.0.0.1", port=port)
+        # SSE mantém a conexão presa a um processo: sem suporte a múltiplos workers
+        if workers > 1:
+            logger.warning("--workers ignorado no transporte sse; use --transport http")
+        uvicorn.run(starlette_app, host=host, port=port)
     else:
         from mcp.server.stdio import stdio_server
 
@@ -0,0 +1,245 @@
+from __future__ import annotations
+"""Estado compartilhado (rate limit, sessões, caches) com backends plugáveis.
+
+Backends:
+- ``memory``: dicts em processo (default; comportamento histórico).
+- ``sqlite``: arquivo SQLite em WAL compartilhado entre processos/workers do uvicorn.
+
+Seleção via ``SHARED_STATE_BACKEND`` (memory|sqlite) e ``SHARED_STATE_PATH``
+(default ``shared_state.db``). Valores precisam ser serializáveis em JSON.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import os
+import json
+import sqlite3
+import threading
+import time
+
+# Chaves nunca relidas (ex.: janelas do rate limit) só saem na limpeza periódica: a cada N escritas
+_PURGE_EVERY = int(os.getenv("SHARED_STATE_PURGE_EVERY", "1000"))
+
+
+class StateBackend:
+    """Interface comum: chave/valor com TTL separado por namespace."""
+
+    _writes = 0
+
+    def get(self, ns: str, key: str) -> Any:
+        raise NotImplementedError
+
+    def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, ns: str, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, ns: str, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Incrementa contador atômico; TTL só é aplicado na criação da chave."""
+        raise NotImplementedError
+
+    def append(self, ns: str, key: str, item: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def clear(self, ns: str) -> None:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Remove todas as chaves expiradas; retorna quantas."""
+        raise NotImplementedError
+
+    def _wrote(self) -> None:
+        # Contagem aproximada (sem lock): basta purgar "de vez em quando"
+        self._writes += 1
+        if _PURGE_EVERY > 0 and self._writes % _PURGE_EVERY == 0:
+            self.purge_expired()
+
+
+class MemoryBackend(StateBackend):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Tuple[Any, Optional[float]]]] = {}
+
+    def _live(self, ns: str, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(ns, {}).get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            del self._data[ns][key]
+            return None
+        return entry
+
+    def get(self, ns: str, key: str) -> Any:
+        with self._lock:
+            entry = self._live(ns, key)
+            return entry[0] if entry else None
+
+    def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data.setdefault(ns, {})[key] = (value, time.time() + ttl if ttl else None)
+        self._wrote()
+
+    def delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._data.get(ns, {}).pop(key, None)
+
+    def incr(self, ns: str, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            entry = self._live(ns, key)
+            if entry is None:
+                entry = (0, time.time() + ttl if ttl else None)
+            value = int(entry[0]) + amount
+            self._data.setdefault(ns, {})[key] = (value, entry[1])
+        self._wrote()
+        return value
+
+    def append(self, ns: str, key: str, item: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            entry = self._live(ns, key)
+            if entry is None:
+                entry = ([], time.time() + ttl if ttl else None)
+                self._data.setdefault(ns, {})[key] = entry
+            entry[0].append(item)
+        self._wrote()
+
+    def clear(self, ns: str) -> None:
+        with self._lock:
+            self._data.pop(ns, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for ns, entries in list(self._data.items()):
+                expired = [k for k, (_, exp) in entries.items() if exp is not None and exp <= now]
+                for k in expired:
+                    del entries[k]
+                removed += len(expired)
+                if not entries:
+                    del self._data[ns]
+        return removed
+
+
+class SQLiteBackend(StateBackend):
+    """Backend local compartilhado: um arquivo SQLite (WAL) visível a todos os workers."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._pid: int | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Conexão por processo (workers podem ser criados via fork)
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("""CREATE TABLE IF NOT EXISTS kv(
+                ns TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NULL,
+                PRIMARY KEY(ns, key))""")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _read(self, conn: sqlite3.Connection, ns: str, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        row = conn.execute("SELECT value, expires_at FROM kv WHERE ns=? AND key=?", (ns, key)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            conn.execute("DELETE FROM kv WHERE ns=? AND key=?", (ns, key))
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _write(self, conn: sqlite3.Connection, ns: str, key: str, value: Any, expires_at: Optional[float]) -> None:
+        conn.execute(
+            "INSERT INTO kv(ns, key, value, expires_at) VALUES (?,?,?,?) "
+            "ON CONFLICT(ns, key) DO UPDATE SET value=excluded.value, expires_at=excluded.expires_at",
+            (ns, key, json.dumps(value, ensure_ascii=False), expires_at),
+        )
+
+    def get(self, ns: str, key: str) -> Any:
+        with self._lock:
+            entry = self._read(self._connect(), ns, key)
+            return entry[0] if entry else None
+
+    def set(self, ns: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._write(self._connect(), ns, key, value, time.time() + ttl if ttl else None)
+        self._wrote()
+
+    def delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM kv WHERE ns=? AND key=?", (ns, key))
+
+    def _modify(self, ns: str, key: str, default: Any, ttl: Optional[float], fn) -> Any:
+        # BEGIN IMMEDIATE serializa read-modify-write entre processos
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                entry = self._read(conn, ns, key)
+                if entry is None:
+                    entry = (default, time.time() + ttl if ttl else None)
+                value = fn(entry[0])
+                self._write(conn, ns, key, value, entry[1])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._wrote()
+        return value
+
+    def incr(self, ns: str, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return int(self._modify(ns, key, 0, ttl, lambda v: int(v) + amount))
+
+    def append(self, ns: str, key: str, item: Any, ttl: Optional[float] = None) -> None:
+        self._modify(ns, key, [], ttl, lambda v: list(v) + [item])
+
+    def clear(self, ns: str) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM kv WHERE ns=?", (ns,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._connect().execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            return cur.rowcount
+
+
+_BACKEND: StateBackend | None = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def create_backend(kind: Optional[str] = None, path: Optional[str] = None) -> StateBackend:
+    kind = (kind or os.getenv("SHARED_STATE_BACKEND") or "memory").lower()
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend(path or os.getenv("SHARED_STATE_PATH", "shared_state.db"))
+    raise ValueError(f"SHARED_STATE_BACKEND inválido: {kind}")
+
+
+def get_backend() -> StateBackend:
+    global _BACKEND
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                _BACKEND = create_backend()
+    return _BACKEND
+
+
+def set_backend(backend: StateBackend | None) -> None:
+    """Substitui o backend global (testes / configuração explícita)."""
+    global _BACKEND
+    _BACKEND = backend
+
+
+def make_key(*parts: Any) -> str:
+    """Chave estável para tuplas (ex.: parâmetros de busca)."""
+    return json.dumps(list(parts), ensure_ascii=False, sort_keys=True, default=str)
+
+
+def session_messages(session_id: str) -> List[Dict[str, Any]]:
+    return get_backend().get("sessions", session_id) or []
@@ -1,46 +1,24 @@
-from supabase import create_client, Client
+from __future__ import annotations
+
 from dotenv import load_dotenv
 import os
-import logging
-from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+import hashlib
+import threading
 import time
 
-class JsonFormatter(logging.Formatter):
-    def format(self, record: logging.LogRecord) -> str:
-        from datetime import datetime
-        import json
-
-        payload = {
-            "ts": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
-            "level": record.levelname,
-            "logger": record.name,
-            "msg": record.getMessage(),
-            "module": record.module,
-            "func": record.funcName,
-            "line": record.lineno,
-        }
-        if record.exc_info:
-            payload["exc_info"] = self.formatException(record.exc_info)
-        return json.dumps(payload, ensure_ascii=False)
-
-
-def _configure_logger() -> logging.Logger:
-    level_name = (os.getenv("MCP_LOG_LEVEL") or os.getenv("LOG_LEVEL") or "INFO").upper()
-    level = getattr(logging, level_name, logging.INFO)
-
-    logger = logging.getLogger("mcp_notes")
-    logger.setLevel(level)
-    if not logger.handlers:
-        handler = logging.StreamHandler()
-        handler.setLevel(level)
-        handler.setFormatter(JsonFormatter())
-        logger.addHandler(handler)
-    # Evita duplicar logs em loggers pais
-    logger.propagate = False
-    return logger
-
-
-logger = _configure_logger()
+from mcp_simple_tool.admission import run_limited_sync
+from mcp_simple_tool.jsonutil import dumps
+from mcp_simple_tool.logging_setup import JsonFormatter, configure_logging  # noqa: F401 (re-export)
+from mcp_simple_tool.shared_state import get_backend, make_key
+from mcp_simple_tool.tools.tags import TagIndex
+
+if TYPE_CHECKING:  # pragma: no cover
+    from supabase import Client
+
+logger = configure_logging()
 
 # Carrega variáveis de ambiente
 load_dotenv()
@@ -49,7 +27,7 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase: Any | None = None  # permite monkeypatch em testes
 
-# Lazy init do cliente Supabase para evitar custo em import/tests sem credenciais
+# Lazy init do cliente Supabase (e do import do pacote) para evitar custo em import/tests sem credenciais
 def _init_client() -> Client:
     existing = globals().get('supabase')
     # Aceita dummies injetados em testes (qualquer objeto com 'table')
@@ -57,12 +35,81 @@ def _init_client() -> Client:
         return existing  # type: ignore
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise RuntimeError("Supabase credentials not configured (defina SUPABASE_URL e SUPABASE_KEY)")
+    from supabase import create_client
+
     globals()['supabase'] = create_client(SUPABASE_URL, SUPABASE_KEY)
     return globals()['supabase']  # type: ignore
 
-# Cache simples para consultas search_notes
-_SEARCH_CACHE: Dict[Tuple[Any, Any, Tuple[str, ...]], Dict[str, Any]] = {}
+# Cache para consultas search_notes (namespace no estado compartilhado entre workers)
+_SEARCH_CACHE_NS = "search_cache"
 _CACHE_TTL_SECONDS = 30
+# Após o TTL a entrada ainda é servida (stale) por _STALE_TTL_SECONDS enquanto 1 refresh roda em background
+_STALE_TTL_SECONDS = int(os.getenv("SEARCH_STALE_TTL_SECONDS", "300"))
+# Cache negativo: resultado vazio / erro com TTL curto (0 desliga)
+_NEGATIVE_TTL_SECONDS = int(os.getenv("SEARCH_NEGATIVE_TTL_SECONDS", "5"))
+_ERROR_TTL_SECONDS = int(os.getenv("SEARCH_ERROR_TTL_SECONDS", "2"))
+_REFRESH_LOCK_NS = "search_refresh_lock"
+_REFRESH_LOCK_TTL = 30
+_REFRESH_POOL: ThreadPoolExecutor | None = None
+_REFRESH_POOL_LOCK = threading.Lock()
+
+# Dedup de add_note: idempotency_key e hash de título+conteúdo+tags -> nota já inserida
+_NOTE_DEDUP_NS = "note_dedup"
+_DEDUP_WINDOW_SECONDS = int(os.getenv("NOTE_DEDUP_WINDOW_SECONDS", "600"))  # 0 desliga o dedup por conteúdo
+_IDEMPOTENCY_TTL_SECONDS = int(os.getenv("NOTE_IDEMPOTENCY_TTL_SECONDS", "86400"))
+_DEDUP_CLAIM_TTL = 30
+
+# Índice de tags (facets/autocomplete); reconstruído periodicamente para absorver escritas de outros processos
+_TAG_INDEX = TagIndex()
+_TAG_INDEX_TTL_SECONDS = int(os.getenv("TAG_INDEX_TTL_SECONDS", "300"))
+_TAG_INDEX_PAGE_SIZE = 1000
+
+# Resultados de busca trazem trecho em volta do termo; conteúdo completo via get_notes_tool
+_SNIPPET_CHARS = int(os.getenv("SEARCH_SNIPPET_CHARS", "160"))
+_GET_NOTES_MAX_IDS = 50
+
+
+class _NoteCache:
+    """LRU por id (notas completas) com TTL; alimentado por buscas e por get_notes_tool."""
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, note_id: Any) -> Optional[Dict[str, Any]]:
+        key = str(note_id)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if time.time() - item[0] > self.ttl:
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def put_many(self, rows: Iterable[Dict[str, Any]]) -> None:
+        if self.size <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            for row in rows:
+                if row.get("id") is None or "content" not in row:
+                    continue
+                key = str(row["id"])
+                self._items[key] = (now, row)
+                self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+_NOTE_CACHE = _NoteCache(int(os.getenv("NOTE_CACHE_SIZE", "256")), float(os.getenv("NOTE_CACHE_TTL_SECONDS", "300")))
 
 _TAG_MAX_LEN = 40
 _TAG_ALLOWED_CHARS = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_")
@@ -105,13 +152,57 @@ def _err(message: str, code: Optional[str] = None, details: Any = None) -> Dict[
     return payload
 
 
-def add_note_tool(content: str, title: str, tags: List[str]) -> Dict[str, Any]:
+def _content_hash(content: str, title: str, tags: List[str]) -> str:
+    raw = dumps([(title or "").strip(), (content or "").strip(), sorted(tags)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _dedup_keys(content: str, title: str, tags: List[str], idempotency_key: Optional[str]) -> List[Tuple[str, int]]:
+    keys: List[Tuple[str, int]] = []
+    if idempotency_key:
+        keys.append((f"key:{idempotency_key}", _IDEMPOTENCY_TTL_SECONDS))
+    if _DEDUP_WINDOW_SECONDS > 0:
+        keys.append((f"hash:{_content_hash(content, title, tags)}", _DEDUP_WINDOW_SECONDS))
+    return keys
+
+
+def _find_duplicate(keys: List[Tuple[str, int]]) -> Any:
+    cache = get_backend()
+    for key, _ in keys:
+        inserted = cache.get(_NOTE_DEDUP_NS, key)
+        if inserted is not None:
+            return inserted
+    return None
+
+
+def add_note_tool(content: str, title: str, tags: List[str], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
     """
     Adiciona uma nova nota na tabela 'notes'.
+    Repetições (mesma ``idempotency_key`` ou mesmo título+conteúdo+tags dentro de
+    ``NOTE_DEDUP_WINDOW_SECONDS``) devolvem a nota já inserida, sem escrita no Supabase;
+    repetição enquanto a primeira ainda insere recebe ``code="in_progress"``.
     Retorna: { success: bool, data?: any, error?: str, code?: str, details?: any }
     """
+    claim: Optional[str] = None
     try:
         tags = _sanitize_tags(tags or [])
+        keys = _dedup_keys(content, title, tags, idempotency_key)
+        if keys:
+            existing = _find_duplicate(keys)
+            if existing is not None:
+                logger.info("add_note: duplicate skipped title=%s", title)
+                return _ok({"inserted": existing, "deduplicated": True})
+            # Chamadas concorrentes (retry do cliente durante o insert): só a 1ª escreve. A trava usa a
+            # idempotency_key quando houver (retry reformulado tem outro hash) e não espera: segurar a
+            # vaga "supabase" e a thread num loop só atrasaria as demais chamadas
+            claim = f"claim:{keys[0][0]}"
+            if get_backend().incr(_NOTE_DEDUP_NS, claim, ttl=_DEDUP_CLAIM_TTL) != 1:
+                claim = None
+                existing = _find_duplicate(keys)
+                if existing is not None:
+                    return _ok({"inserted": existing, "deduplicated": True})
+                logger.info("add_note: concurrent insert in progress title=%s", title)
+                return _err("add_note already in progress for this note; retry shortly", "in_progress")
         data = {"content": content, "title": title, "tags": tags}
         logger.info("add_note: inserting note title=%s tags=%s", title, tags)
         client = _init_client()
@@ -123,49 +214,248 @@ def add_note_tool(content: str, title: str, tags: List[str]) -> Dict[str, Any]:
             if isinstance(err, dict):
                 return _err(err.get("message", str(err)), err.get("code"), err.get("details"))
             return _err(str(err))
-        if _SEARCH_CACHE:
-            _SEARCH_CACHE.clear()
-            logger.debug("add_note: cache search_notes invalidated")
+        cache = get_backend()
+        for key, ttl in keys:
+            cache.set(_NOTE_DEDUP_NS, key, response.data, ttl=ttl)
+        cache.clear(_SEARCH_CACHE_NS)
+        logger.debug("add_note: cache search_notes invalidated")
+        if _TAG_INDEX.built and tags:
+            _TAG_INDEX.add(tags)
         return _ok({"inserted": response.data})
     except Exception as e:
         logger.exception("add_note: exception while inserting")
         return _err(str(e))
+    finally:
+        if claim is not None:
+            get_backend().delete(_NOTE_DEDUP_NS, claim)
+
+
+def _snippet(content: str, query: Optional[str], width: int) -> str:
+    """Trecho de até ``width`` caracteres centrado na 1ª ocorrência de ``query`` (ou o início)."""
+    content = " ".join(content.split())
+    if len(content) <= width:
+        return content
+    pos = content.lower().find(query.lower()) if query else -1
+    if pos < 0:
+        start = 0
+    else:
+        start = max(0, min(pos - (width - len(query or "")) // 2, len(content) - width))
+    end = start + width
+    return ("…" if start > 0 else "") + content[start:end].strip() + ("…" if end < len(content) else "")
+
+
+def compact_results(results: List[Any], query: Optional[str]) -> List[Any]:
+    """Troca ``content`` por ``snippet`` + ``content_length`` (linhas sem content ficam como estão)."""
+    out: List[Any] = []
+    for row in results:
+        if not isinstance(row, dict) or "content" not in row:
+            out.append(row)
+            continue
+        content = str(row.get("content") or "")
+        compact = {k: v for k, v in row.items() if k != "content"}
+        compact["snippet"] = _snippet(content, query, _SNIPPET_CHARS)
+        compact["content_length"] = len(content)
+        out.append(compact)
+    return out
+
+
+def _query_notes(query: Optional[str], title: Optional[str], stags: List[str]) -> Tuple[Optional[List[Any]], Optional[Dict[str, Any]]]:
+    """Consulta o Supabase. Retorna (resultados, None) ou (None, payload de erro)."""
+    client = _init_client()
+    qb = client.table("notes").select("*")
+    if query:
+        qb = qb.ilike("content", f"%{query}%")
+    if title:
+        qb = qb.ilike("title", f"%{title}%")
+    if stags:
+        qb = qb.overlaps("tags", stags)
+    logger.info("search_notes: query=%s title=%s tags=%s", query, title, stags)
+    response = qb.execute()
+    resp_dict = getattr(response, "__dict__", {})
+    if resp_dict.get("error"):
+        err = resp_dict["error"]
+        logger.error("search_notes: query error: %s", err)
+        if isinstance(err, dict):
+            return None, _err(err.get("message", str(err)), err.get("code"), err.get("details"))
+        return None, _err(str(err))
+    _NOTE_CACHE.put_many(response.data or [])
+    return response.data or [], None
+
+
+def _store_search(cache_key: str, results: Optional[List[Any]], error: Optional[Dict[str, Any]]) -> None:
+    cache = get_backend()
+    now = time.time()
+    if error is not None:
+        if _ERROR_TTL_SECONDS > 0:
+            cache.set(_SEARCH_CACHE_NS, cache_key, {"error": error, "_ts": now, "_ttl": _ERROR_TTL_SECONDS}, ttl=_ERROR_TTL_SECONDS)
+    elif not results:
+        if _NEGATIVE_TTL_SECONDS > 0:
+            cache.set(_SEARCH_CACHE_NS, cache_key, {"results": [], "_ts": now, "_ttl": _NEGATIVE_TTL_SECONDS}, ttl=_NEGATIVE_TTL_SECONDS)
+    else:
+        cache.set(
+            _SEARCH_CACHE_NS, cache_key, {"results": results, "_ts": now, "_ttl": _CACHE_TTL_SECONDS},
+            ttl=_CACHE_TTL_SECONDS + _STALE_TTL_SECONDS,
+        )
+
+
+def _refresh_search(cache_key: str, query: Optional[str], title: Optional[str], stags: List[str]) -> None:
+    try:
+        # Thread do pool, fora do event loop: a vaga "supabase" é pedida ao loop das requisições
+        results, error = run_limited_sync("supabase", _query_notes, query, title, stags)
+        if error is None:  # erro no refresh: mantém a entrada stale
+            _store_search(cache_key, results, None)
+    except Exception:
+        logger.exception("search_notes: background refresh failed")
+    finally:
+        get_backend().delete(_REFRESH_LOCK_NS, cache_key)
+
+
+def _schedule_refresh(cache_key: str, query: Optional[str], title: Optional[str], stags: List[str]) -> bool:
+    global _REFRESH_POOL
+    # Um único refresh por chave, mesmo entre workers (incr atômico no estado compartilhado)
+    if get_backend().incr(_REFRESH_LOCK_NS, cache_key, ttl=_REFRESH_LOCK_TTL) != 1:
+        return False
+    with _REFRESH_POOL_LOCK:
+        if _REFRESH_POOL is None:
+            _REFRESH_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-refresh")
+    _REFRESH_POOL.submit(_refresh_search, cache_key, query, title, stags)
+    return True
 
 
 def search_notes_tool(
-    query: Optional[str], title: Optional[str] = None, tags: Optional[List[str]] = None
+    query: Optional[str], title: Optional[str] = None, tags: Optional[List[str]] = None, full: bool = False
 ) -> Dict[str, Any]:
     """
     Busca notas que contenham a palavra-chave em content, title ou tags.
+    Cada resultado traz ``snippet`` (trecho em volta do termo) e ``content_length`` no lugar
+    de ``content``; ``full=True`` devolve as linhas completas (uso interno).
     Retorna: { success: bool, data?: any, error?: str, code?: str, details?: any }
     """
     try:
         stags = _sanitize_tags(tags or [])
-        cache_key = (query, title, tuple(stags))
-        now = time.time()
-        cached = _SEARCH_CACHE.get(cache_key)
-        if cached and (now - cached.get("_ts", 0) < _CACHE_TTL_SECONDS):
-            logger.debug("search_notes: cache hit query=%s title=%s tags=%s", query, title, stags)
-            return _ok({"results": cached["results"], "cached": True})
-        client = _init_client()
-        qb = client.table("notes").select("*")
-        if query:
-            qb = qb.ilike("content", f"%{query}%")
-        if title:
-            qb = qb.ilike("title", f"%{title}%")
-        if stags:
-            qb = qb.overlaps("tags", stags)
-        logger.info("search_notes: query=%s title=%s tags=%s", query, title, stags)
-        response = qb.execute()
-        resp_dict = getattr(response, "__dict__", {})
-        if resp_dict.get("error"):
-            err = resp_dict["error"]
-            logger.error("search_notes: query error: %s", err)
-            if isinstance(err, dict):
-                return _err(err.get("message", str(err)), err.get("code"), err.get("details"))
-            return _err(str(err))
-        _SEARCH_CACHE[cache_key] = {"results": response.data, "_ts": now}
-        return _ok({"results": response.data, "cached": False})
+        cache_key = make_key(query, title, stags)
+        shape = (lambda rows: rows) if full else (lambda rows: compact_results(rows, query))
+        cached = get_backend().get(_SEARCH_CACHE_NS, cache_key)
+        if cached:
+            age = time.time() - cached.get("_ts", 0)
+            if age < cached.get("_ttl", _CACHE_TTL_SECONDS):
+                logger.debug("search_notes: cache hit query=%s title=%s tags=%s", query, title, stags)
+                if "error" in cached:
+                    return {**cached["error"], "cached": True}
+                return _ok({"results": shape(cached["results"]), "cached": True})
+            if cached.get("results"):
+                # stale-while-revalidate: responde já e atualiza em background
+                _schedule_refresh(cache_key, query, title, stags)
+                logger.debug("search_notes: stale hit age=%.1fs query=%s", age, query)
+                return _ok({"results": shape(cached["results"]), "cached": True, "stale": True})
+        results, error = _query_notes(query, title, stags)
+        _store_search(cache_key, results, error)
+        if error is not None:
+            return error
+        return _ok({"results": shape(results), "cached": False})
     except Exception as e:
         logger.exception("search_notes: exception while querying")
         return _err(str(e))
+
+
+def get_notes_tool(ids: List[Any]) -> Dict[str, Any]:
+    """
+    Notas completas (com ``content``) pelos ids, na ordem pedida; busca no Supabase só as
+    que não estão no cache por id.
+    Retorna: { success: bool, data?: { notes: [...], missing: [ids] }, error?: str }
+    """
+    try:
+        wanted = list(dict.fromkeys(i for i in (ids or []) if i is not None and i != ""))
+        if not wanted:
+            return _err("informe ao menos um id", "invalid_argument")
+        if len(wanted) > _GET_NOTES_MAX_IDS:
+            return _err(f"máximo de {_GET_NOTES_MAX_IDS} ids por chamada", "invalid_argument")
+        found = {str(i): n for i in wanted if (n := _NOTE_CACHE.get(i)) is not None}
+        missing = [i for i in wanted if str(i) not in found]
+        if missing:
+            logger.info("get_notes: fetching ids=%s cached=%s", len(missing), len(found))
+            response = _init_client().table("notes").select("*").in_("id", missing).execute()
+            resp_dict = getattr(response, "__dict__", {})
+            if resp_dict.get("error"):
+                err = resp_dict["error"]
+                logger.error("get_notes: query error: %s", err)
+                if isinstance(err, dict):
+                    return _err(err.get("message", str(err)), err.get("code"), err.get("details"))
+                return _err(str(err))
+            rows = response.data or []
+            _NOTE_CACHE.put_many(rows)
+            found.update((str(r.get("id")), r) for r in rows)
+        return _ok({
+            "notes": [found[str(i)] for i in wanted if str(i) in found],
+            "missing": [i for i in wanted if str(i) not in found],
+        })
+    except Exception as e:
+        logger.exception("get_notes: exception while fetching")
+        return _err(str(e))
+
+
+def warm_search_cache(searches: Iterable[Tuple[Optional[str], Optional[str], List[str]]]) -> int:
+    """Pré-popula o cache com buscas (query, title, tags); retorna quantas foram carregadas."""
+    warmed = 0
+    for query, title, tags in searches:
+        stags = _sanitize_tags(tags or [])
+        try:
+            results, error = _query_notes(query, title, stags)
+        except Exception:
+            logger.exception("search_notes: warm-up failed query=%s", query)
+            continue
+        if error is None:
+            _store_search(make_key(query, title, stags), results, None)
+            warmed += 1
+    logger.info("search_notes: cache warm-up done warmed=%s", warmed)
+    return warmed
+
+
+def invalidate_caches() -> None:
+    """Descarta caches de busca e por id e o índice de tags (após escritas em massa, ex.: importação)."""
+    get_backend().clear(_SEARCH_CACHE_NS)
+    _NOTE_CACHE.clear()
+    _TAG_INDEX.built_at = None
+
+
+def _ensure_tag_index(client: Any) -> None:
+    built_at = _TAG_INDEX.built_at
+    if built_at is not None and time.time() - built_at < _TAG_INDEX_TTL_SECONDS:
+        return
+    tag_lists: List[List[str]] = []
+    last = None
+    # Lê só id+tags, paginando por keyset em ordem de id (PostgREST limita linhas por resposta;
+    # offset sem ORDER BY pode pular ou repetir linhas entre páginas)
+    while True:
+        qb = client.table("notes").select("id,tags").order("id")
+        if last is not None:
+            qb = qb.gt("id", last)
+        rows = qb.limit(_TAG_INDEX_PAGE_SIZE).execute().data or []
+        tag_lists.extend(r.get("tags") or [] for r in rows)
+        if len(rows) < _TAG_INDEX_PAGE_SIZE:
+            break
+        last = rows[-1]["id"]
+    _TAG_INDEX.rebuild(tag_lists)
+    logger.info("list_tags: tag index built tags=%s notes=%s", len(_TAG_INDEX), len(tag_lists))
+
+
+def known_tags(limit: int = 20) -> List[str]:
+    """Tags mais usadas segundo o índice já construído (sem I/O); vazio se ainda não houver índice."""
+    if _TAG_INDEX.built_at is None:
+        return []
+    return [t for t, _ in _TAG_INDEX.top(limit)]
+
+
+def list_tags_tool(prefix: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+    """
+    Lista tags em uso com contagem de notas; com ``prefix`` funciona como autocomplete.
+    Retorna: { success: bool, data?: { tags: [{tag, count}], total_tags }, error?: str }
+    """
+    try:
+        _ensure_tag_index(_init_client())
+        limit = max(1, min(int(limit or 50), 500))
+        items = _TAG_INDEX.complete(prefix, limit) if prefix else _TAG_INDEX.top(limit)
+        return _ok({"tags": [{"tag": t, "count": c} for t, c in items], "total_tags": len(_TAG_INDEX)})
+    except Exception as e:
+        logger.exception("list_tags: exception while building index")
+        return _err(str(e))
@@ -0,0 +1,61 @@
+from __future__ import annotations
+"""Índice de tags em memória: contagens (facets) + autocomplete por prefixo.
+
+Mantém um array ordenado de (tag.lower(), tag) para busca por prefixo com bisect
+e um dict de contagens. Construído uma vez a partir do Supabase e atualizado
+incrementalmente a cada add_note.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import bisect
+import threading
+import time
+
+
+class TagIndex:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._sorted: List[Tuple[str, str]] = []
+        self.built_at: Optional[float] = None
+
+    @property
+    def built(self) -> bool:
+        return self.built_at is not None
+
+    def rebuild(self, tag_lists: Iterable[Iterable[str]]) -> None:
+        counts: Dict[str, int] = {}
+        for tags in tag_lists:
+            for t in tags or []:
+                counts[t] = counts.get(t, 0) + 1
+        with self._lock:
+            self._counts = counts
+            self._sorted = sorted((t.lower(), t) for t in counts)
+            self.built_at = time.time()
+
+    def add(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for t in tags:
+                if t not in self._counts:
+                    bisect.insort(self._sorted, (t.lower(), t))
+                    self._counts[t] = 0
+                self._counts[t] += 1
+
+    def complete(self, prefix: str, limit: int = 20) -> List[Tuple[str, int]]:
+        """Tags que começam com ``prefix`` (case-insensitive), mais usadas primeiro."""
+        p = prefix.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted, (p,))
+            # U+FFFF fecha o intervalo de todas as chaves com o prefixo
+            end = bisect.bisect_left(self._sorted, (p + "\uffff",), lo=start)
+            matches = [(t, self._counts[t]) for _, t in self._sorted[start:end]]
+        matches.sort(key=lambda x: (-x[1], x[0].lower()))
+        return matches[:limit]
+
+    def top(self, limit: int = 50) -> List[Tuple[str, int]]:
+        with self._lock:
+            items = list(self._counts.items())
+        items.sort(key=lambda x: (-x[1], x[0].lower()))
+        return items[:limit]
+
+    def __len__(self) -> int:
+        return len(self._counts)
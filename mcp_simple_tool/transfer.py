@@ -0,0 +1,296 @@
+from __future__ import annotations
+"""Exportação/importação em massa (NDJSON) de notas (Supabase) e histórico de chat (SQLite).
+
+Tudo em memória constante:
+- notas são lidas em páginas por keyset (``id > último id``), não por offset;
+- o histórico é lido com cursor do SQLite (``fetchmany``) numa conexão só de leitura;
+- a importação lê linha a linha, grava em lotes (upsert / ``INSERT OR IGNORE``) e
+  registra um checkpoint após cada lote, permitindo retomar de onde parou.
+
+Uso (``.gz`` ou ``--gzip`` comprimem; na importação gzip é detectado automaticamente)::
+
+    python -m mcp_simple_tool.transfer export-notes --out notes.ndjson.gz
+    python -m mcp_simple_tool.transfer export-history --db chat_history.db --out hist.ndjson
+    python -m mcp_simple_tool.transfer import-notes notes.ndjson.gz --checkpoint notes.ckpt
+    python -m mcp_simple_tool.transfer import-history hist.ndjson --db novo.db
+"""
+from contextlib import nullcontext
+from typing import IO, Any, AsyncIterator, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional
+import gzip
+import logging
+import os
+import sys
+import zlib
+
+import click
+
+from mcp_simple_tool.jsonutil import dumps, loads
+
+logger = logging.getLogger("mcp_notes.transfer")
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 500
+
+
+# ---------------------------------------------------------------- exportação
+def notes_page(client: Any, page_size: int, after_id: Any = None) -> List[Dict[str, Any]]:
+    qb = client.table("notes").select("*").order("id")
+    if after_id is not None:
+        qb = qb.gt("id", after_id)
+    return qb.limit(page_size).execute().data or []
+
+
+def iter_notes(client: Any, page_size: int = DEFAULT_PAGE_SIZE, after_id: Any = None) -> Iterator[Dict[str, Any]]:
+    """Notas em ordem de id, paginadas por keyset (custo constante por página)."""
+    last = after_id
+    while True:
+        rows = notes_page(client, page_size, last)
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]["id"]
+
+
+async def aiter_notes(client: Any, page_size: int = DEFAULT_PAGE_SIZE, after_id: Any = None) -> AsyncIterator[Dict[str, Any]]:
+    """``iter_notes`` para a API: cada página numa thread, sob o limite "supabase" (``admission``)."""
+    from mcp_simple_tool.admission import run_limited
+
+    last = after_id
+    while True:
+        rows = await run_limited("supabase", notes_page, client, page_size, last)
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        last = rows[-1]["id"]
+
+
+def iter_history(db_path: Optional[str] = None, session_id: Optional[str] = None, after_id: int = 0) -> Iterator[Dict[str, Any]]:
+    from mcp_simple_tool.webapp import storage
+
+    conn = storage.open_reader(db_path)
+    try:
+        yield from storage.iter_messages(conn, after_id=after_id, session_id=session_id)
+    finally:
+        conn.close()
+
+
+class _NdjsonEncoder:
+    """NDJSON em blocos de ``flush_every`` linhas, com gzip incremental opcional."""
+
+    def __init__(self, compress: bool, flush_every: int) -> None:
+        self.gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        self.flush_every = flush_every
+        self.buf: List[str] = []
+
+    def _encode(self) -> bytes:
+        data = ("\n".join(self.buf) + "\n").encode("utf-8") if self.buf else b""
+        self.buf.clear()
+        return self.gz.compress(data) if self.gz else data
+
+    def add(self, row: Dict[str, Any]) -> bytes:
+        self.buf.append(dumps(row))
+        return self._encode() if len(self.buf) >= self.flush_every else b""
+
+    def finish(self) -> bytes:
+        data = self._encode()
+        return data + self.gz.flush() if self.gz else data
+
+
+def ndjson_chunks(rows: Iterable[Dict[str, Any]], compress: bool = False, flush_every: int = 200) -> Iterator[bytes]:
+    """Serializa ``rows`` como NDJSON em blocos de bytes (gzip incremental opcional)."""
+    enc = _NdjsonEncoder(compress, flush_every)
+    for row in rows:
+        out = enc.add(row)
+        if out:
+            yield out
+    out = enc.finish()
+    if out:
+        yield out
+
+
+async def andjson_chunks(rows: AsyncIterator[Dict[str, Any]], compress: bool = False, flush_every: int = 200) -> AsyncIterator[bytes]:
+    """``ndjson_chunks`` para linhas assíncronas (ex.: ``aiter_notes``)."""
+    enc = _NdjsonEncoder(compress, flush_every)
+    async for row in rows:
+        out = enc.add(row)
+        if out:
+            yield out
+    out = enc.finish()
+    if out:
+        yield out
+
+
+def write_ndjson(rows: Iterable[Dict[str, Any]], out: IO[bytes], compress: bool = False) -> int:
+    count = 0
+
+    def counted() -> Iterator[Dict[str, Any]]:
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    for chunk in ndjson_chunks(counted(), compress):
+        out.write(chunk)
+    return count
+
+
+# ---------------------------------------------------------------- importação
+def read_ndjson(fp: IO[bytes]) -> Iterator[Dict[str, Any]]:
+    """Lê NDJSON (gzip detectado pelos magic bytes) linha a linha."""
+    head = fp.peek(2)[:2] if hasattr(fp, "peek") else b""
+    stream: IO[bytes] = gzip.GzipFile(fileobj=fp) if head == b"\x1f\x8b" else fp  # type: ignore[assignment]
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield loads(line)
+
+
+async def aiter_ndjson(chunks: AsyncIterator[bytes], gzipped: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Versão assíncrona de ``read_ndjson`` para corpos de requisição em streaming."""
+    gz = zlib.decompressobj(31) if gzipped else None
+    pending = b""
+    async for chunk in chunks:
+        pending += gz.decompress(chunk) if gz else chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield loads(line)
+    if gz:
+        pending += gz.flush()
+    if pending.strip():
+        yield loads(pending)
+
+
+def _load_checkpoint(path: Optional[str]) -> int:
+    if not path or not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return int(loads(f.read() or "{}").get("lines_done", 0))
+
+
+def _save_checkpoint(path: Optional[str], lines_done: int) -> None:
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(dumps({"lines_done": lines_done}))
+    os.replace(tmp, path)  # atômico: um crash nunca deixa checkpoint corrompido
+
+
+def chunked_import(
+    rows: Iterable[Dict[str, Any]],
+    apply_chunk: Callable[[List[Dict[str, Any]]], Any],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    checkpoint: Optional[str] = None,
+    skip: int = 0,
+) -> Dict[str, int]:
+    """Aplica ``rows`` em lotes; o checkpoint guarda as linhas já gravadas (retomada idempotente)."""
+    done = max(skip, _load_checkpoint(checkpoint))
+    seen = 0
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        seen += 1
+        if seen <= done:
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            apply_chunk(chunk)
+            done = seen
+            _save_checkpoint(checkpoint, done)
+            chunk = []
+    if chunk:
+        apply_chunk(chunk)
+        done = seen
+        _save_checkpoint(checkpoint, done)
+    return {"lines_done": done, "lines_seen": seen}
+
+
+def upsert_notes(client: Any, chunk: List[Dict[str, Any]]) -> None:
+    resp = client.table("notes").upsert(chunk).execute()
+    err = getattr(resp, "__dict__", {}).get("error")
+    if err:
+        raise RuntimeError(f"falha ao importar notas: {err}")
+
+
+def import_notes(rows: Iterable[Dict[str, Any]], client: Any = None, **kw: Any) -> Dict[str, int]:
+    from mcp_simple_tool.tools import notes
+
+    client = client or notes._init_client()
+    try:
+        return chunked_import(rows, lambda chunk: upsert_notes(client, chunk), **kw)
+    finally:
+        notes.invalidate_caches()
+
+
+def import_history(rows: Iterable[Dict[str, Any]], **kw: Any) -> Dict[str, int]:
+    from mcp_simple_tool.webapp import storage
+
+    if not storage.enabled():
+        raise RuntimeError("persistência de histórico desativada")
+    return chunked_import(rows, storage.import_messages, **kw)
+
+
+# ---------------------------------------------------------------- CLI
+def _open_out(path: str) -> ContextManager[IO[bytes]]:
+    return nullcontext(sys.stdout.buffer) if path == "-" else open(path, "wb")
+
+
+def _open_in(path: str) -> ContextManager[IO[bytes]]:
+    return nullcontext(sys.stdin.buffer) if path == "-" else open(path, "rb")
+
+
+@click.group()
+def cli() -> None:
+    """Exporta/importa notas e histórico em NDJSON."""
+
+
+@cli.command("export-notes")
+@click.option("--out", default="-", help="Arquivo de saída (- = stdout)")
+@click.option("--gzip", "compress", is_flag=True, help="Comprime com gzip (automático para .gz)")
+@click.option("--page-size", default=DEFAULT_PAGE_SIZE, type=int, help="Linhas por página do Supabase")
+def export_notes_cmd(out: str, compress: bool, page_size: int) -> None:
+    from mcp_simple_tool.tools import notes
+
+    with _open_out(out) as fp:
+        n = write_ndjson(iter_notes(notes._init_client(), page_size), fp, compress or out.endswith(".gz"))
+    click.echo(f"notas exportadas: {n}", err=True)
+
+
+@cli.command("export-history")
+@click.option("--db", default=lambda: os.getenv("HISTORY_DB_PATH", "chat_history.db"), help="SQLite de histórico")
+@click.option("--out", default="-", help="Arquivo de saída (- = stdout)")
+@click.option("--gzip", "compress", is_flag=True, help="Comprime com gzip (automático para .gz)")
+@click.option("--session-id", default=None, help="Exporta só uma sessão")
+def export_history_cmd(db: str, out: str, compress: bool, session_id: Optional[str]) -> None:
+    with _open_out(out) as fp:
+        n = write_ndjson(iter_history(db, session_id), fp, compress or out.endswith(".gz"))
+    click.echo(f"mensagens exportadas: {n}", err=True)
+
+
+@cli.command("import-notes")
+@click.argument("path")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, type=int, help="Linhas por upsert")
+@click.option("--checkpoint", default=None, help="Arquivo de checkpoint (retoma se existir)")
+def import_notes_cmd(path: str, chunk_size: int, checkpoint: Optional[str]) -> None:
+    with _open_in(path) as fp:
+        res = import_notes(read_ndjson(fp), chunk_size=chunk_size, checkpoint=checkpoint)
+    click.echo(f"notas importadas: linhas={res['lines_done']}", err=True)
+
+
+@cli.command("import-history")
+@click.argument("path")
+@click.option("--db", default=lambda: os.getenv("HISTORY_DB_PATH", "chat_history.db"), help="SQLite de histórico (destino)")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, type=int, help="Linhas por transação")
+@click.option("--checkpoint", default=None, help="Arquivo de checkpoint (retoma se existir)")
+def import_history_cmd(path: str, db: str, chunk_size: int, checkpoint: Optional[str]) -> None:
+    from mcp_simple_tool.webapp import storage
+
+    storage.init(db)
+    with _open_in(path) as fp:
+        res = import_history(read_ndjson(fp), chunk_size=chunk_size, checkpoint=checkpoint)
+    click.echo(f"mensagens importadas: linhas={res['lines_done']}", err=True)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    cli()
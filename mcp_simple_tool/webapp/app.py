@@ -1,23 +1,71 @@
 from __future__ import annotations
-import os, uuid, logging, time, json
-from typing import Any, Dict
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse
+import os, uuid, logging, time, json, asyncio, hashlib
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Tuple
+import click
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Depends, WebSocket, WebSocketDisconnect
+from starlette.requests import HTTPConnection
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from mcp_simple_tool.llm.orchestrator import run_notes_chat
-from mcp_simple_tool.tools.notes import add_note_tool, search_notes_tool
+from mcp_simple_tool.llm.context import build_session_context, refresh_summary
+from mcp_simple_tool.tools.notes import add_note_tool, get_notes_tool, search_notes_tool, list_tags_tool, warm_search_cache
+from mcp_simple_tool.shared_state import get_backend, session_messages
+from mcp_simple_tool.jsonutil import dumps, dumps_bytes
+from mcp_simple_tool.logging_setup import configure_logging
+from mcp_simple_tool.admission import Overloaded
+from mcp_simple_tool import admission, profiling
+from mcp_simple_tool.llm import resilience, speculative
+from mcp_simple_tool import transfer
+from mcp_simple_tool.tools import notes as notes_module
 from . import storage
+from .compression import CompressionMiddleware
 
+configure_logging()
 logger = logging.getLogger("mcp_notes.webapp")
-if not logger.handlers:
-    logging.basicConfig(level=os.getenv("MCP_LOG_LEVEL") or os.getenv("LOG_LEVEL") or "INFO")
 
-app = FastAPI(title="Notes Chat UI")
-_SESSIONS: Dict[str, list[dict[str, Any]]] = {}
-_RATE_STATE: Dict[str, Dict[str, Any]] = {}
+class FastJSONResponse(JSONResponse):
+    """JSONResponse compacta usando o serializador compartilhado (orjson quando instalado)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
+
+# Tasks fire-and-forget (warm-up, resumo de contexto): referência forte até terminarem
+_BACKGROUND_TASKS: set = set()
+
+def _spawn(coro: Any) -> None:
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+async def _search_warmup():  # pragma: no cover
+    top = int(os.getenv("SEARCH_WARMUP", "0"))
+    if top <= 0 or not storage.enabled():
+        return
+    searches = storage.frequent_searches(top, int(os.getenv("SEARCH_WARMUP_SCAN", "2000")))
+    if searches:
+        try:  # uma vaga "supabase" só, como qualquer outra chamada ao upstream
+            await admission.run_limited("supabase", warm_search_cache, searches)
+        except Exception:
+            logger.exception("search warm-up failed")
+
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):  # pragma: no cover
+    # Em background: não atrasa o startup; primeiras buscas frequentes já encontram o cache quente
+    _spawn(_search_warmup())
+    yield
+
+app = FastAPI(title="Notes Chat UI", default_response_class=FastJSONResponse, lifespan=_lifespan)
+if not os.getenv("DISABLE_COMPRESSION"):
+    app.add_middleware(CompressionMiddleware, min_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")))
+# Sessões e contadores de rate limit vivem no estado compartilhado (ver shared_state)
+_SESSIONS_NS = "sessions"
+_RATE_NS = "rate"
+# Último id de mensagem por sessão: ETag de /api/history sem consultar o SQLite
+_HISTORY_VERSION_NS = "history_version"
+_SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "86400"))
 
 def _init_persistence():  # pragma: no cover
     if os.getenv("DISABLE_PERSISTENCE"):
@@ -31,98 +79,488 @@ def _init_persistence():  # pragma: no cover
 
 _init_persistence()
 
-def auth_dep(request: Request):
+def _authorized(conn: HTTPConnection, provided: str | None = None) -> bool:
     required = os.getenv("AUTH_API_KEY")
     if not required:
-        return
-    provided = request.headers.get("x-api-key") or request.query_params.get("api_key")
-    if provided != required:
+        return True
+    provided = provided or conn.headers.get("x-api-key") or conn.query_params.get("api_key")
+    return provided == required
+
+def auth_dep(request: Request):
+    if not _authorized(request):
         raise HTTPException(401, detail="unauthorized")
 
-def rate_limit_dep(request: Request):
+def _consume_rate(request: HTTPConnection, amount: int = 1) -> None:
     limit = int(os.getenv("RATE_LIMIT_PER_MIN", "60"))
     if limit <= 0:
         return
     key_base = request.headers.get("x-api-key") or (request.client.host if request.client else "anon")
     window = int(time.time() // 60)
     key = f"{key_base}:{window}"
-    state = _RATE_STATE.get(key)
-    if not state:
-        _RATE_STATE[key] = {"count": 1}
-        return
-    state["count"] += 1
-    if state["count"] > limit:
+    count = get_backend().incr(_RATE_NS, key, amount=amount, ttl=120)
+    if count > limit:
         raise HTTPException(429, detail="rate limit exceeded")
 
+def rate_limit_dep(request: Request):
+    _consume_rate(request)
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def _set_history_version(session_id: str, last_id: int | None) -> None:
+    if last_id is None:
+        # Sem id conhecido (lote / persistência desligada): recalcula na próxima leitura
+        get_backend().delete(_HISTORY_VERSION_NS, session_id)
+    else:
+        get_backend().set(_HISTORY_VERSION_NS, session_id, last_id, ttl=_SESSION_TTL_SECONDS)
+
+def _bump_history_version(session_id: str) -> None:
+    # Importação pode trazer mensagens com id menor que o último: só o id não mudaria o ETag
+    get_backend().set(_HISTORY_VERSION_NS, session_id, f"{storage.last_message_id(session_id)}i{time.time_ns()}", ttl=_SESSION_TTL_SECONDS)
+
+def _history_version(session_id: str) -> str:
+    if not storage.enabled():
+        return f"m{len(session_messages(session_id))}"
+    version = get_backend().get(_HISTORY_VERSION_NS, session_id)
+    if version is None:
+        version = storage.last_message_id(session_id)
+        get_backend().set(_HISTORY_VERSION_NS, session_id, version, ttl=_SESSION_TTL_SECONDS)
+    return str(version)
+
+def _error_meta(e: Exception) -> Tuple[int, Dict[str, Any] | None, Dict[str, str] | None]:
+    """Mapeia erro do orquestrador para (status HTTP, payload, headers); payload None se não for JSON."""
+    if isinstance(e, Overloaded):
+        return 503, e.to_meta(), {"Retry-After": str(max(1, int(e.retry_after + 0.5)))}
+    # Tenta decodificar payload JSON do RuntimeError
+    try:
+        meta = json.loads(str(e))
+    except Exception:
+        return 500, None, None
+    if not isinstance(meta, dict):
+        return 500, None, None
+    # Normaliza shape
+    meta.setdefault("success", False)
+    status = 500
+    headers = None
+    if meta.get("proxy_blocked"):
+        status = 502
+    elif meta.get("code") == "network_error":
+        status = 502
+    elif meta.get("code") == "circuit_open":
+        status = 503
+        headers = {"Retry-After": str(max(1, int(meta.get("retry_after") or 1)))}
+    elif meta.get("status") in (401, 403):
+        status = int(meta.get("status"))
+    elif meta.get("status") == 429:
+        status = 429
+    return status, meta, headers
+
 class ChatRequest(BaseModel):
     message: str = Field(..., min_length=1)
     session_id: str | None = None
     model: str | None = None
     params: dict[str, Any] | None = None
 
-@app.post("/api/chat")
-async def api_chat(req: ChatRequest, _: Any = Depends(auth_dep), __: Any = Depends(rate_limit_dep)):
-    if not os.getenv("OPENROUTER_API_KEY"):
-        raise HTTPException(400, detail="OPENROUTER_API_KEY não configurada")
-    session_id = req.session_id or uuid.uuid4().hex
-    history = _SESSIONS.setdefault(session_id, [])
-    history.append({"role": "user", "text": req.message})
-    storage.save_message(session_id, "user", req.message)
-    try:
+async def _chat_turn(req: ChatRequest, session_id: str, on_progress: Any = None) -> Dict[str, Any]:
+    """Um turno de chat: contexto, persistência da pergunta e da resposta. Erros propagam."""
+    async with profiling.request_scope("web", "chat") as timer:
+        # Contexto lido antes de gravar a mensagem atual (ela vai como prompt, não como histórico)
+        timer.mark("context")
+        context = build_session_context(req.session_id, history=_history())
+        timer.mark("persist_user")
+        sessions = get_backend()
+        sessions.append(_SESSIONS_NS, session_id, {"role": "user", "text": req.message}, ttl=_SESSION_TTL_SECONDS)
+        _set_history_version(session_id, storage.save_message(session_id, "user", req.message))
         payload = await run_notes_chat(
             req.message,
             model=req.model,
             params=req.params or {},
             add_note_func=add_note_tool,
             search_notes_func=search_notes_tool,
+            list_tags_func=list_tags_tool,
+            get_notes_func=get_notes_tool,
+            context=context,
+            on_progress=timer.wrap(on_progress),
         )
+        timer.mark("persist_assistant")
+        sessions.append(_SESSIONS_NS, session_id, {"role": "assistant", "text": payload["text"], "actions": payload["actions"]}, ttl=_SESSION_TTL_SECONDS)
+        _set_history_version(session_id, storage.save_message(session_id, "assistant", payload["text"], payload["actions"]))
+        return payload
+
+@app.post("/api/chat")
+async def api_chat(req: ChatRequest, background: BackgroundTasks, _: Any = Depends(auth_dep), __: Any = Depends(rate_limit_dep)):
+    if not os.getenv("OPENROUTER_API_KEY"):
+        raise HTTPException(400, detail="OPENROUTER_API_KEY não configurada")
+    session_id = req.session_id or uuid.uuid4().hex
+    try:
+        payload = await _chat_turn(req, session_id)
     except Exception as e:  # pragma: no cover
         logger.exception("chat error")
-        # Tenta decodificar payload JSON do RuntimeError
-        body = str(e)
+        status, meta, headers = _error_meta(e)
+        if meta is None:
+            raise HTTPException(500, detail=str(e))
+        return FastJSONResponse(meta, status_code=status, headers=headers)
+    # Resumo incremental fora do caminho da resposta (só resume quando a janela desliza)
+    background.add_task(refresh_summary, session_id, history=_history())
+    return {"session_id": session_id, "response": payload}
+
+class BatchItem(BaseModel):
+    message: str = Field(..., min_length=1)
+    session_id: str | None = None
+    model: str | None = None
+    params: dict[str, Any] | None = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1)
+    model: str | None = None
+    params: dict[str, Any] | None = None
+    concurrency: int | None = Field(None, ge=1)
+
+async def _run_batch_item(index: int, item: BatchItem, req: BatchRequest, sem: asyncio.Semaphore) -> Dict[str, Any]:
+    session_id = item.session_id or uuid.uuid4().hex
+    async with sem:
         try:
-            meta = json.loads(body)
-            if not isinstance(meta, dict):
-                raise ValueError
-            # Normaliza shape
-            meta.setdefault("success", False)
-            status = 500
-            if meta.get("proxy_blocked"):
-                status = 502
-            elif meta.get("code") == "network_error":
-                status = 502
-            elif meta.get("status") in (401, 403):
-                status = int(meta.get("status"))
-            elif meta.get("status") == 429:
-                status = 429
-            return JSONResponse(meta, status_code=status)
+            payload = await run_notes_chat(
+                item.message,
+                model=item.model or req.model,
+                params={**(req.params or {}), **(item.params or {})},
+                add_note_func=add_note_tool,
+                search_notes_func=search_notes_tool,
+                list_tags_func=list_tags_tool,
+                get_notes_func=get_notes_tool,
+                context=build_session_context(item.session_id, history=_history()),
+            )
+        except Exception as e:
+            logger.warning("batch item failed index=%s error=%s", index, str(e)[:200])
+            status, meta, _ = _error_meta(e)
+            return {"index": index, "session_id": session_id, "success": False, "status": status, "error": meta or {"error": str(e)[:800]}}
+    return {"index": index, "session_id": session_id, "success": True, "response": payload}
+
+def _flush_batch_history(items: List[BatchItem], results: List[Dict[str, Any]]) -> None:
+    """Histórico do lote gravado de uma vez (uma transação SQLite), na ordem dos itens."""
+    sessions = get_backend()
+    rows: List[tuple] = []
+    for res in sorted(results, key=lambda r: r["index"]):
+        if not res["success"]:
+            continue
+        sid, text, payload = res["session_id"], items[res["index"]].message, res["response"]
+        rows.append((sid, "user", text, None))
+        rows.append((sid, "assistant", payload["text"], payload["actions"]))
+        sessions.append(_SESSIONS_NS, sid, {"role": "user", "text": text}, ttl=_SESSION_TTL_SECONDS)
+        sessions.append(_SESSIONS_NS, sid, {"role": "assistant", "text": payload["text"], "actions": payload["actions"]}, ttl=_SESSION_TTL_SECONDS)
+    storage.save_messages(rows)
+    for sid in {r[0] for r in rows}:
+        _set_history_version(sid, None)
+
+@app.post("/api/chat/batch")
+async def api_chat_batch(req: BatchRequest, request: Request, _: Any = Depends(auth_dep)):
+    if not os.getenv("OPENROUTER_API_KEY"):
+        raise HTTPException(400, detail="OPENROUTER_API_KEY não configurada")
+    max_items = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+    if len(req.items) > max_items:
+        raise HTTPException(413, detail=f"batch excede BATCH_MAX_ITEMS={max_items}")
+    # Rate limit conta itens (cada um custa chamadas ao LLM), não requisições
+    _consume_rate(request, len(req.items))
+    cap = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    sem = asyncio.Semaphore(max(1, min(req.concurrency or cap, cap)))
+
+    async def stream():
+        tasks = [asyncio.ensure_future(_run_batch_item(i, item, req, sem)) for i, item in enumerate(req.items)]
+        results: List[Dict[str, Any]] = []
+        try:
+            for fut in asyncio.as_completed(tasks):
+                res = await fut
+                results.append(res)
+                yield dumps_bytes(res) + b"\n"
+        finally:
+            # Cliente desconectou: cancela o restante e persiste o que já terminou
+            for t in tasks:
+                t.cancel()
+            _flush_batch_history(req.items, results)
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _history():
+    """Fonte do contexto de sessão: SQLite quando ativo; senão o padrão (estado compartilhado)."""
+    return storage if storage.enabled() else None
+
+
+async def _refresh_summary_logged(session_id: str) -> None:
+    try:
+        await refresh_summary(session_id, history=_history())
+    except Exception:
+        logger.exception("ws summary refresh failed session=%s", session_id)
+
+class _WsChannel:
+    """Uma conexão /ws/chat: vários turnos (ids do cliente) e sessões em paralelo."""
+
+    def __init__(self, ws: WebSocket) -> None:
+        self.ws = ws
+        self.turns: Dict[str, asyncio.Task] = {}
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, event: Dict[str, Any]) -> None:
+        try:
+            async with self._send_lock:
+                await self.ws.send_text(dumps(event))
+        except Exception:  # conexão já fechada
+            logger.debug("ws send failed type=%s", event.get("type"))
+
+    async def run_turn(self, turn_id: str, req: ChatRequest, session_id: str) -> None:
+        async def progress(event: Dict[str, Any]) -> None:
+            await self.send({"type": "progress", "id": turn_id, "session_id": session_id, **event})
+        try:
+            payload = await _chat_turn(req, session_id, on_progress=progress)
+        except asyncio.CancelledError:
+            # Cancelar a task cancela a chamada ao OpenRouter em andamento e libera a vaga de admissão
+            await self.send({"type": "cancelled", "id": turn_id, "session_id": session_id})
+            raise
+        except Exception as e:
+            logger.warning("ws chat error id=%s error=%s", turn_id, str(e)[:200])
+            status, meta, _ = _error_meta(e)
+            await self.send({"type": "error", "id": turn_id, "session_id": session_id, "status": status, "error": meta or {"error": str(e)[:800]}})
+            return
+        finally:
+            self.turns.pop(turn_id, None)
+        await self.send({"type": "message", "id": turn_id, "session_id": session_id, "response": payload})
+        # Como o BackgroundTasks do HTTP: falha no resumo não transforma o turno entregue em erro
+        _spawn(_refresh_summary_logged(session_id))
+
+    def cancel_all(self) -> None:
+        for task in list(self.turns.values()):
+            task.cancel()
+
+@app.websocket("/ws/chat")
+async def ws_chat(ws: WebSocket):
+    """Protocolo JSON: ``auth`` (se a chave não veio no handshake), ``chat``, ``cancel``, ``ping``."""
+    await ws.accept()
+    authed = _authorized(ws)
+    if not authed:
+        try:
+            first = json.loads(await asyncio.wait_for(ws.receive_text(), float(os.getenv("WS_AUTH_TIMEOUT", "10"))))
         except Exception:
-            raise HTTPException(500, detail=body)
-    history.append({"role": "assistant", "text": payload["text"], "actions": payload["actions"]})
-    storage.save_message(session_id, "assistant", payload["text"], payload["actions"])
-    return {"session_id": session_id, "response": payload}
+            first = {}
+        authed = isinstance(first, dict) and first.get("type") == "auth" and _authorized(ws, first.get("api_key") or "")
+    if not authed:
+        await ws.close(code=4401, reason="unauthorized")
+        return
+    channel = _WsChannel(ws)
+    max_inflight = int(os.getenv("WS_MAX_INFLIGHT", "4"))
+    await channel.send({"type": "ready"})
+    try:
+        while True:
+            try:
+                msg = json.loads(await ws.receive_text())
+            except ValueError:
+                await channel.send({"type": "error", "status": 400, "error": {"error": "JSON inválido"}})
+                continue
+            if not isinstance(msg, dict):
+                await channel.send({"type": "error", "status": 400, "error": {"error": "mensagem deve ser um objeto JSON"}})
+                continue
+            kind = msg.get("type")
+            turn_id = str(msg.get("id") or uuid.uuid4().hex)
+            if kind == "ping":
+                await channel.send({"type": "pong"})
+            elif kind == "cancel":
+                task = channel.turns.get(turn_id)
+                if task is not None:
+                    task.cancel()
+                else:
+                    await channel.send({"type": "error", "id": turn_id, "status": 404, "error": {"error": "turno não encontrado"}})
+            elif kind == "chat":
+                if turn_id in channel.turns:
+                    await channel.send({"type": "error", "id": turn_id, "status": 409, "error": {"error": "id em uso"}})
+                    continue
+                if len(channel.turns) >= max_inflight:
+                    await channel.send({"type": "error", "id": turn_id, "status": 429, "error": {"error": "muitos turnos simultâneos nesta conexão"}})
+                    continue
+                try:
+                    req = ChatRequest(message=msg.get("message") or "", session_id=msg.get("session_id"), model=msg.get("model"), params=msg.get("params"))
+                    if not os.getenv("OPENROUTER_API_KEY"):
+                        raise HTTPException(400, detail="OPENROUTER_API_KEY não configurada")
+                    _consume_rate(ws)
+                except HTTPException as e:
+                    await channel.send({"type": "error", "id": turn_id, "status": e.status_code, "error": {"error": e.detail}})
+                    continue
+                except ValueError as e:  # validação pydantic
+                    await channel.send({"type": "error", "id": turn_id, "status": 422, "error": {"error": str(e)[:300]}})
+                    continue
+                session_id = req.session_id or uuid.uuid4().hex
+                await channel.send({"type": "accepted", "id": turn_id, "session_id": session_id})
+                channel.turns[turn_id] = asyncio.create_task(channel.run_turn(turn_id, req, session_id))
+            else:
+                await channel.send({"type": "error", "id": turn_id, "status": 400, "error": {"error": f"tipo desconhecido: {kind}"}})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Desconexão: cancela turnos em andamento para liberar capacidade do upstream
+        channel.cancel_all()
 
 @app.get("/api/history")
-async def api_history(session_id: str, _: Any = Depends(auth_dep)):
+async def api_history(session_id: str, request: Request, _: Any = Depends(auth_dep)):
+    etag = f'W/"{_history_version(session_id)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
     persisted = storage.load_history(session_id)
-    if persisted:
-        return {"session_id": session_id, "messages": persisted}
-    return {"session_id": session_id, "messages": _SESSIONS.get(session_id, [])}
+    messages = persisted or session_messages(session_id)
+    return FastJSONResponse({"session_id": session_id, "messages": messages}, headers=headers)
+
+@app.get("/api/history/search")
+async def api_history_search(q: str, session_id: str | None = None, since: str | None = None, until: str | None = None,
+                             limit: int = 20, offset: int = 0, _: Any = Depends(auth_dep)):
+    if not storage.enabled():
+        raise HTTPException(404, detail="persistência de histórico desativada")
+    if not q.strip():
+        raise HTTPException(400, detail="q vazio")
+    limit = max(1, min(limit, 100))
+    result = await asyncio.to_thread(storage.search_messages, q, session_id, since, until, limit, max(0, offset))
+    return {"query": q, **result}
+
+@app.get("/api/tags")
+async def api_tags(prefix: str | None = None, limit: int = 50, _: Any = Depends(auth_dep)):
+    # 1ª chamada constrói o índice com varredura paginada: fora do event loop, sob o limite "supabase"
+    result = await admission.run_limited("supabase", list_tags_tool, prefix, limit)
+    if not result.get("success"):
+        raise HTTPException(502, detail=result.get("error"))
+    return result["data"]
+
+@app.get("/api/metrics")
+async def api_metrics(_: Any = Depends(auth_dep)):
+    # Vagas/fila/tempo em fila por upstream e estado dos circuit breakers (por processo)
+    return {"admission": admission.stats(), "llm": resilience.stats(), "speculative_search": speculative.stats()}
+
+_INDEX_CACHE: Dict[str, Any] = {}
+
+@app.post("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10):
+    # Só com PROFILING_ENABLED e AUTH_API_KEY definida (nunca aberto sem chave)
+    if not profiling.enabled():
+        raise HTTPException(404, detail="Not Found")
+    if not os.getenv("AUTH_API_KEY"):
+        raise HTTPException(403, detail="defina AUTH_API_KEY para usar /debug/profile")
+    if not _authorized(request):
+        raise HTTPException(401, detail="unauthorized")
+    seconds = max(0.1, min(seconds, float(os.getenv("PROFILE_MAX_SECONDS", "60"))))
+    try:
+        return await asyncio.to_thread(profiling.profile_process, seconds)
+    except profiling.ProfilerBusy:
+        raise HTTPException(409, detail="profiler já em execução")
+
+def _load_index() -> Dict[str, Any] | None:
+    """index.html lido uma vez por processo (ETag = hash do conteúdo)."""
+    if not _INDEX_CACHE:
+        index_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
+        if not os.path.exists(index_path):
+            return None
+        with open(index_path, "rb") as f:
+            body = f.read()
+        _INDEX_CACHE.update(body=body, etag=f'W/"{hashlib.sha256(body).hexdigest()[:16]}"')
+    return _INDEX_CACHE
+
+def _export_response(rows: Any, name: str, compress: bool) -> StreamingResponse:
+    # Iterador síncrono (SQLite): o Starlette o consome em threadpool, sem bloquear o event loop.
+    # Assíncrono (notas): cada página já vai para thread sob o limite "supabase"
+    encode = transfer.andjson_chunks if hasattr(rows, "__aiter__") else transfer.ndjson_chunks
+    if compress:
+        return StreamingResponse(encode(rows, compress=True), media_type="application/gzip",
+                                 headers={"Content-Disposition": f'attachment; filename="{name}.ndjson.gz"'})
+    return StreamingResponse(encode(rows), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'})
+
+@app.get("/api/export/notes")
+async def api_export_notes(gzip: bool = False, page_size: int = transfer.DEFAULT_PAGE_SIZE, _: Any = Depends(auth_dep)):
+    try:
+        client = notes_module._init_client()
+    except Exception as e:
+        raise HTTPException(502, detail=str(e))
+    return _export_response(transfer.aiter_notes(client, max(1, min(page_size, 5000))), "notes", gzip)
+
+@app.get("/api/export/history")
+async def api_export_history(session_id: str | None = None, after_id: int = 0, gzip: bool = False, _: Any = Depends(auth_dep)):
+    if not storage.enabled():
+        raise HTTPException(404, detail="persistência de histórico desativada")
+    return _export_response(transfer.iter_history(session_id=session_id, after_id=after_id), "history", gzip)
+
+@app.post("/api/import/{kind}")
+async def api_import(kind: str, request: Request, skip: int = 0, chunk_size: int = transfer.DEFAULT_CHUNK_SIZE, _: Any = Depends(auth_dep)):
+    """Importa NDJSON do corpo (streaming; gzip com ``Content-Encoding: gzip``). Retomada: ``?skip=lines_done``."""
+    counts: Dict[str, int] = {}
+    sessions: set = set()
+    if kind == "notes":
+        try:
+            client = notes_module._init_client()
+        except Exception as e:
+            raise HTTPException(502, detail=str(e))
+        apply = lambda chunk: admission.run_limited("supabase", transfer.upsert_notes, client, chunk)
+    elif kind == "history":
+        if not storage.enabled():
+            raise HTTPException(404, detail="persistência de histórico desativada")
+        async def apply(chunk: List[Dict[str, Any]]) -> None:
+            sessions.update(r["session_id"] for r in chunk)
+            for k, v in (await asyncio.to_thread(storage.import_messages, chunk)).items():
+                counts[k] = counts.get(k, 0) + v
+    else:
+        raise HTTPException(404, detail=f"tipo desconhecido: {kind}")
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    chunk_size = max(1, min(chunk_size, 5000))
+    done = seen = 0
+    chunk: List[Dict[str, Any]] = []
+    try:
+        async for row in transfer.aiter_ndjson(request.stream(), gzipped):
+            seen += 1
+            if seen <= skip:
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                await apply(chunk)
+                done, chunk = seen, []
+        if chunk:
+            await apply(chunk)
+            done = seen
+    except Exception as e:
+        logger.exception("import failed kind=%s lines_done=%s", kind, done)
+        # lines_done permite retomar com ?skip=
+        return FastJSONResponse({"success": False, "error": str(e)[:800], "lines_done": max(done, skip)}, status_code=500)
+    finally:
+        if kind == "notes":
+            notes_module.invalidate_caches()
+        for sid in sessions:
+            _bump_history_version(sid)
+    # history: inserted / reassigned (id já ocupado, ganhou id novo) / skipped (já importada)
+    return {"success": True, "lines_done": max(done, skip), "lines_seen": seen, **counts}
 
 @app.get("/", response_class=HTMLResponse)
-async def index_page():  # pragma: no cover
-    index_path = os.path.join(os.path.dirname(__file__), "static", "index.html")
-    if not os.path.exists(index_path):
+async def index_page(request: Request):
+    index = _load_index()
+    if index is None:
         return HTMLResponse("<h1>Interface não encontrada</h1>", status_code=500)
-    with open(index_path, "r", encoding="utf-8") as f:
-        return HTMLResponse(f.read())
+    # no-cache: o navegador revalida (304 barato) e pega versões novas após deploy
+    headers = {"ETag": index["etag"], "Cache-Control": "no-cache"}
+    if _etag_matches(request, index["etag"]):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(index["body"], headers=headers)
 
 static_dir = os.path.join(os.path.dirname(__file__), "static")
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
-def run():  # pragma: no cover
+@click.command()
+@click.option("--host", default=lambda: os.getenv("FRONTEND_HOST", "127.0.0.1"), help="Host to bind")
+@click.option("--port", default=lambda: int(os.getenv("FRONTEND_PORT", 9000)), type=int, help="Port to listen on")
+@click.option("--workers", default=lambda: int(os.getenv("WEB_WORKERS", 1)), type=int, help="Number of uvicorn worker processes")
+def run(host: str, port: int, workers: int):  # pragma: no cover
     import uvicorn
-    uvicorn.run("mcp_simple_tool.webapp.app:app", host="127.0.0.1", port=int(os.getenv("FRONTEND_PORT", 9000)), reload=False)
+    if workers > 1 and not os.getenv("SHARED_STATE_BACKEND"):
+        # Workers não compartilham memória: usa o backend SQLite para manter rate limit/sessões/cache coerentes
+        os.environ["SHARED_STATE_BACKEND"] = "sqlite"
+        logger.info("workers=%s: SHARED_STATE_BACKEND=sqlite path=%s", workers, os.getenv("SHARED_STATE_PATH", "shared_state.db"))
+    elif workers > 1 and os.getenv("SHARED_STATE_BACKEND", "").lower() == "memory":
+        logger.warning("workers=%s com SHARED_STATE_BACKEND=memory: rate limit/sessões/cache ficam por processo", workers)
+    uvicorn.run("mcp_simple_tool.webapp.app:app", host=host, port=port, workers=workers, reload=False)
 
 if __name__ == "__main__":  # pragma: no cover
     run()
@@ -0,0 +1,91 @@
+from __future__ import annotations
+"""Middleware ASGI de compressão (brotli quando instalado, senão gzip).
+
+Só comprime respostas completas (um único corpo) de tipos textuais acima de
+``min_size`` bytes; respostas em streaming (ex.: NDJSON de ``/api/chat/batch``)
+e já codificadas passam direto, sem buffer.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import gzip
+
+try:  # opcional: pip install brotli (extra "fast")
+    import brotli  # type: ignore
+except Exception:  # pragma: no cover - depende do ambiente
+    brotli = None
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+COMPRESSIBLE_TYPES = ("application/json", "text/html")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=4)  # qualidade baixa: ganho alto com pouca CPU
+    return gzip.compress(body, compresslevel=6)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: Callable[..., Awaitable[None]], min_size: int = 1024) -> None:
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        passthrough = False
+
+        async def wrapped_send(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            assert start is not None
+            body = message.get("body", b"")
+            raw_headers: List[Any] = list(start.get("headers") or [])
+            resp_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in raw_headers}
+            ctype = resp_headers.get("content-type", "")
+            if (
+                message.get("more_body", False)  # streaming: não bufferiza
+                or "content-encoding" in resp_headers
+                or len(body) < self.min_size
+                or not ctype.startswith(COMPRESSIBLE_TYPES)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            payload = compress(body, encoding)
+            raw_headers = [(k, v) for k, v in raw_headers if k.lower() not in (b"content-length", b"vary")]
+            vary = resp_headers.get("vary")
+            raw_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(payload)).encode()),
+                (b"vary", (f"{vary}, Accept-Encoding" if vary else "Accept-Encoding").encode("latin-1")),
+            ]
+            await send({**start, "headers": raw_headers})
+            await send({"type": "http.response.body", "body": payload})
+
+        await self.app(scope, receive, wrapped_send)
@@ -1,16 +1,20 @@
 from __future__ import annotations
 """Persistência SQLite para histórico de chat."""
-import sqlite3, os, json, threading
-from typing import List, Dict, Any
+import sqlite3, os, re, threading
+from typing import List, Dict, Any, Iterator, Optional
+from mcp_simple_tool.jsonutil import dumps, loads
 
 _LOCK = threading.Lock()
 _CONN: sqlite3.Connection | None = None
+_DB_PATH: str | None = None
+_FTS = False  # FTS5 disponível (senão busca cai para LIKE)
 
 def init(db_path: str) -> None:
-    global _CONN
+    global _CONN, _DB_PATH
     with _LOCK:
         if _CONN is not None:
             return
+        _DB_PATH = db_path
         os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
         _CONN = sqlite3.connect(db_path, check_same_thread=False)
         _CONN.execute("PRAGMA journal_mode=WAL;")
@@ -25,16 +29,61 @@ def init(db_path: str) -> None:
             actions TEXT NULL,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY(session_id) REFERENCES sessions(id))""")
+        _CONN.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages(session_id, id)")
+        # Resumo incremental das mensagens que saíram da janela de contexto
+        _CONN.execute("""CREATE TABLE IF NOT EXISTS session_summaries(
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            covered_until INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)""")
+        _init_fts(_CONN)
         _CONN.commit()
 
-def save_message(session_id: str, role: str, content: str, actions: list[dict[str, Any]] | None = None) -> None:
-    if _CONN is None:
+def _init_fts(conn: sqlite3.Connection) -> None:
+    """Índice FTS5 (external content) sobre messages.content, mantido por triggers."""
+    global _FTS
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name='messages_fts'").fetchone() is not None
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                     "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')")
+    except sqlite3.OperationalError:  # SQLite compilado sem FTS5
+        _FTS = False
         return
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END""")
+    if not existed:
+        # Banco anterior ao índice: indexa as mensagens já gravadas
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    _FTS = True
+
+def enabled() -> bool:
+    return _CONN is not None
+
+def save_message(session_id: str, role: str, content: str, actions: list[dict[str, Any]] | None = None) -> Optional[int]:
+    if _CONN is None:
+        return None
     with _LOCK:
         _CONN.execute("INSERT OR IGNORE INTO sessions(id) VALUES (?)", (session_id,))
-        _CONN.execute("INSERT INTO messages(session_id, role, content, actions) VALUES (?,?,?,?)",
-                      (session_id, role, content, json.dumps(actions, ensure_ascii=False) if actions else None))
+        cur = _CONN.execute("INSERT INTO messages(session_id, role, content, actions) VALUES (?,?,?,?)",
+                            (session_id, role, content, dumps(actions) if actions else None))
         _CONN.commit()
+        return cur.lastrowid
+
+def save_messages(rows: List[tuple]) -> int:
+    """Grava várias mensagens ``(session_id, role, content, actions)`` numa única transação."""
+    if _CONN is None or not rows:
+        return 0
+    with _LOCK:
+        with _CONN:
+            _CONN.executemany("INSERT OR IGNORE INTO sessions(id) VALUES (?)", [(r[0],) for r in rows])
+            _CONN.executemany("INSERT INTO messages(session_id, role, content, actions) VALUES (?,?,?,?)",
+                              [(sid, role, content, dumps(actions) if actions else None) for sid, role, content, actions in rows])
+    return len(rows)
 
 def load_history(session_id: str) -> List[Dict[str, Any]]:
     if _CONN is None:
@@ -46,8 +95,186 @@ def load_history(session_id: str) -> List[Dict[str, Any]]:
         actions = None
         if actions_raw:
             try:
-                actions = json.loads(actions_raw)
+                actions = loads(actions_raw)
             except Exception:
                 actions = []
         out.append({"role": role, "text": content, "actions": actions, "created_at": created_at})
     return out
+
+def last_message_id(session_id: str) -> int:
+    if _CONN is None:
+        return 0
+    row = _CONN.execute("SELECT MAX(id) FROM messages WHERE session_id=?", (session_id,)).fetchone()
+    return int(row[0] or 0)
+
+def frequent_searches(limit: int, scan: int = 2000) -> List[tuple]:
+    """Buscas (query, title, tags) mais frequentes nas ações das últimas ``scan`` respostas."""
+    if _CONN is None or limit <= 0:
+        return []
+    cur = _CONN.execute("SELECT actions FROM messages WHERE role='assistant' AND actions LIKE '%search_notes%' "
+                        "ORDER BY id DESC LIMIT ?", (scan,))
+    counts: Dict[tuple, int] = {}
+    for (raw,) in cur.fetchall():
+        try:
+            actions = loads(raw)
+        except Exception:
+            continue
+        for act in actions or []:
+            if not isinstance(act, dict) or act.get("tool") != "search_notes":
+                continue
+            args = act.get("args") or {}
+            key = (args.get("query"), args.get("title"), tuple(args.get("tags") or []))
+            if any(key[:2]) or key[2]:
+                counts[key] = counts.get(key, 0) + 1
+    top = sorted(counts.items(), key=lambda kv: -kv[1])[:limit]
+    return [(q, t, list(tags)) for (q, t, tags), _ in top]
+
+def load_recent(session_id: str, limit: int) -> List[Dict[str, Any]]:
+    """Últimas ``limit`` mensagens (ordem cronológica), sem a coluna actions."""
+    if _CONN is None or limit <= 0:
+        return []
+    cur = _CONN.execute("SELECT id, role, content FROM messages WHERE session_id=? ORDER BY id DESC LIMIT ?", (session_id, limit))
+    return [{"id": i, "role": role, "text": content} for i, role, content in reversed(cur.fetchall())]
+
+def load_range(session_id: str, after_id: int, before_id: int) -> List[Dict[str, Any]]:
+    """Mensagens com after_id < id < before_id (ordem cronológica)."""
+    if _CONN is None:
+        return []
+    cur = _CONN.execute("SELECT id, role, content FROM messages WHERE session_id=? AND id>? AND id<? ORDER BY id ASC",
+                        (session_id, after_id, before_id))
+    return [{"id": i, "role": role, "text": content} for i, role, content in cur.fetchall()]
+
+def get_summary(session_id: str) -> Optional[Dict[str, Any]]:
+    if _CONN is None:
+        return None
+    row = _CONN.execute("SELECT summary, covered_until FROM session_summaries WHERE session_id=?", (session_id,)).fetchone()
+    return {"summary": row[0], "covered_until": row[1]} if row else None
+
+def save_summary(session_id: str, summary: str, covered_until: int) -> None:
+    if _CONN is None:
+        return
+    with _LOCK:
+        _CONN.execute("INSERT INTO session_summaries(session_id, summary, covered_until) VALUES (?,?,?) "
+                      "ON CONFLICT(session_id) DO UPDATE SET summary=excluded.summary, covered_until=excluded.covered_until, "
+                      "updated_at=CURRENT_TIMESTAMP", (session_id, summary, covered_until))
+        _CONN.commit()
+
+def open_reader(db_path: str | None = None) -> sqlite3.Connection:
+    """Conexão só de leitura para exportação e busca (WAL: snapshot consistente sem bloquear escritas)."""
+    path = db_path or _DB_PATH
+    if not path:
+        raise RuntimeError("persistência de histórico desativada")
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+def iter_messages(conn: sqlite3.Connection, after_id: int = 0, session_id: str | None = None, batch: int = 1000) -> Iterator[Dict[str, Any]]:
+    """Percorre mensagens em ordem de id com cursor (``fetchmany``), em memória constante."""
+    sql = "SELECT id, session_id, role, content, actions, created_at FROM messages WHERE id>?"
+    args: list = [after_id]
+    if session_id:
+        sql += " AND session_id=?"
+        args.append(session_id)
+    cur = conn.execute(sql + " ORDER BY id ASC", args)
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            return
+        for mid, sid, role, content, actions_raw, created_at in rows:
+            yield {"id": mid, "session_id": sid, "role": role, "content": content,
+                   "actions": loads(actions_raw) if actions_raw else None, "created_at": created_at}
+
+def import_messages(rows: List[Dict[str, Any]], conn: sqlite3.Connection | None = None) -> Dict[str, int]:
+    """Insere um lote exportado por ``iter_messages`` numa transação, mantendo os ids quando livres.
+
+    Id já ocupado por outra mensagem: a importada ganha id novo (``reassigned``) em vez de ser
+    descartada. Mensagem idêntica já gravada (mesma sessão, papel, conteúdo e data) é pulada
+    (``skipped``), então reimportar o mesmo arquivo é seguro.
+    """
+    counts = {"inserted": 0, "reassigned": 0, "skipped": 0}
+    target = conn or _CONN
+    if target is None or not rows:
+        return counts
+    with _LOCK:
+        with target:
+            target.executemany("INSERT OR IGNORE INTO sessions(id) VALUES (?)", {(r["session_id"],) for r in rows})
+            for r in rows:
+                values = (r["session_id"], r["role"], r.get("content") or "",
+                          dumps(r["actions"]) if r.get("actions") else None, r.get("created_at"))
+                if r.get("id") is not None and target.execute(
+                        "INSERT OR IGNORE INTO messages(id, session_id, role, content, actions, created_at) "
+                        "VALUES (?,?,?,?,?,COALESCE(?, CURRENT_TIMESTAMP))", (r["id"], *values)).rowcount:
+                    counts["inserted"] += 1
+                    continue
+                if target.execute("SELECT 1 FROM messages WHERE session_id=? AND role=? AND content=? AND (? IS NULL OR created_at=?)",
+                                  (*values[:3], values[4], values[4])).fetchone():
+                    counts["skipped"] += 1
+                    continue
+                target.execute("INSERT INTO messages(session_id, role, content, actions, created_at) "
+                               "VALUES (?,?,?,?,COALESCE(?, CURRENT_TIMESTAMP))", values)
+                counts["reassigned" if r.get("id") is not None else "inserted"] += 1
+    return counts
+
+def fts_enabled() -> bool:
+    return _FTS
+
+def _fts_query(text: str) -> str:
+    """Texto livre -> consulta FTS5 segura: termos entre aspas (AND), prefixo no último."""
+    terms = re.findall(r"\w+", text)
+    if not terms:
+        return ""
+    quoted = [f'"{t}"' for t in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def _like_snippet(content: str, text: str, width: int = 60) -> str:
+    pos = content.lower().find(text.lower())
+    if pos < 0:
+        return content[: 2 * width]
+    start, end = max(0, pos - width), min(len(content), pos + len(text) + width)
+    return ("…" if start else "") + content[start:pos] + "**" + content[pos:pos + len(text)] + "**" + content[pos + len(text):end] + ("…" if end < len(content) else "")
+
+def search_messages(text: str, session_id: str | None = None, since: str | None = None, until: str | None = None,
+                    limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """Busca textual no histórico: ranking bm25, snippet com ``**termo**``, filtros por sessão/período (UTC).
+
+    Roda em thread (``asyncio.to_thread``): usa uma conexão só de leitura própria em vez de ``_CONN``,
+    onde o event loop continua gravando.
+    """
+    if _CONN is None:
+        return {"results": [], "next_offset": None, "engine": None}
+    conn = open_reader()
+    try:
+        return _search(conn, text, session_id, since, until, limit, offset)
+    finally:
+        conn.close()
+
+def _search(conn: sqlite3.Connection, text: str, session_id: str | None, since: str | None, until: str | None,
+            limit: int, offset: int) -> Dict[str, Any]:
+    filters, args = [], []
+    if session_id:
+        filters.append("m.session_id=?")
+        args.append(session_id)
+    if since:
+        filters.append("m.created_at>=?")
+        args.append(since.replace("T", " "))
+    if until:
+        filters.append("m.created_at<?")
+        args.append(until.replace("T", " "))
+    where = "".join(f" AND {f}" for f in filters)
+    if _FTS:
+        match = _fts_query(text)
+        if not match:
+            return {"results": [], "next_offset": None, "engine": "fts5"}
+        sql = ("SELECT m.id, m.session_id, m.role, m.created_at, snippet(messages_fts, 0, '**', '**', '…', 16), bm25(messages_fts) "
+               "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+               f"WHERE messages_fts MATCH ?{where} ORDER BY bm25(messages_fts) LIMIT ? OFFSET ?")
+        rows = conn.execute(sql, [match, *args, limit + 1, offset]).fetchall()
+        engine = "fts5"
+    else:
+        escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        sql = ("SELECT m.id, m.session_id, m.role, m.created_at, m.content, 0 FROM messages m "
+               f"WHERE m.content LIKE ? ESCAPE '\\'{where} ORDER BY m.id DESC LIMIT ? OFFSET ?")
+        rows = [(*r[:4], _like_snippet(r[4], text), r[5]) for r in conn.execute(sql, [f"%{escaped}%", *args, limit + 1, offset]).fetchall()]
+        engine = "like"
+    results = [{"id": i, "session_id": sid, "role": role, "created_at": created_at, "snippet": snip, "score": round(-score, 4)}
+               for i, sid, role, created_at, snip, score in rows[:limit]]
+    return {"results": results, "next_offset": offset + limit if len(rows) > limit else None, "engine": engine}
@@ -8,4 +8,9 @@ def _base_env(monkeypatch):
     monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
     monkeypatch.setenv("AUTH_API_KEY", "k1")
     monkeypatch.setenv("DISABLE_PERSISTENCE", "1")
+    # Sem dicas de tags no planejamento: não dispara a construção do índice contra o Supabase real
+    monkeypatch.setenv("PLANNING_TAG_HINTS", "0")
+    # Dedup de add_note vive no estado compartilhado do processo: isola entre testes
+    from mcp_simple_tool.shared_state import get_backend
+    get_backend().clear("note_dedup")
 
@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from mcp_simple_tool import admission
+from mcp_simple_tool.admission import AdmissionLimiter, Overloaded
+from mcp_simple_tool.llm import orchestrator
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    admission.reset()
+    yield
+    admission.reset()
+
+
+@pytest.mark.asyncio
+async def test_limits_concurrency_and_queues_fifo():
+    limiter = AdmissionLimiter("x", max_concurrency=2, max_queue=10)
+    state = {"running": 0, "peak": 0}
+    order = []
+    async def job(i):
+        async with limiter.slot():
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+            order.append(i)
+            await asyncio.sleep(0.01)
+            state["running"] -= 1
+    await asyncio.gather(*(job(i) for i in range(6)))
+    assert state["peak"] == 2
+    assert order == list(range(6))
+    st = limiter.stats()
+    assert st["admitted"] == 6 and st["in_flight"] == 0 and st["queued"] == 0
+    assert st["queue_ms_max"] > 0
+
+
+@pytest.mark.asyncio
+async def test_sheds_when_queue_full_and_frees_cancelled_waiters():
+    limiter = AdmissionLimiter("x", max_concurrency=1, max_queue=1)
+    await limiter.acquire()
+    waiter = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded) as exc:
+        await limiter.acquire()
+    assert exc.value.retry_after >= 1 and limiter.stats()["shed"] == 1
+    waiter.cancel()
+    await asyncio.sleep(0)
+    assert limiter.stats()["queued"] == 0
+    limiter.release()
+    assert limiter.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeout_sheds():
+    limiter = AdmissionLimiter("x", max_concurrency=1, max_queue=5, queue_timeout=0.01)
+    await limiter.acquire()
+    with pytest.raises(Overloaded):
+        await limiter.acquire()
+    assert limiter.stats()["queued"] == 0
+
+
+def test_web_returns_503_with_retry_after_when_overloaded(monkeypatch):
+    monkeypatch.setenv("SUPABASE_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("SUPABASE_MAX_QUEUE", "0")
+    from mcp_simple_tool.webapp import app as webapp
+    async def fake_chat(prompt, **kw):
+        return ("Draft", [{"tool": "search_notes", "args": {"query": "abc"}}])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    client = TestClient(webapp.app)
+    limiter = admission.get_limiter("supabase")
+    limiter._in_flight = 1  # vaga ocupada por outra requisição
+    r = client.post("/api/chat", headers={"x-api-key": "k1"}, json={"message": "o que tenho sobre abc?", "params": {"fast_path": False}})
+    assert r.status_code == 503
+    assert r.headers["retry-after"] == "1"
+    assert r.json()["code"] == "overloaded"
+    metrics = client.get("/api/metrics", headers={"x-api-key": "k1"}).json()
+    assert metrics["admission"]["supabase"]["shed"] == 1
+
+
+class _FlakyLLM:
+    """Falha (500) na 1ª tentativa; registra vagas ocupadas em cada tentativa."""
+
+    def __init__(self):
+        self.in_flight = []
+        outer = self
+        class completions:
+            @staticmethod
+            async def create(**kw):
+                outer.in_flight.append(admission.get_limiter("openrouter").stats()["in_flight"])
+                if len(outer.in_flight) == 1:
+                    err = RuntimeError("HTTP 500")
+                    err.status_code = 500
+                    raise err
+                return type("Resp", (), {"choices": [type("C", (), {"message": type("M", (), {"content": "ok", "tool_calls": None})()})()]})()
+        self.chat = type("chat", (), {"completions": completions})
+
+
+@pytest.mark.asyncio
+async def test_openrouter_slot_per_attempt(monkeypatch):
+    from mcp_simple_tool.llm import resilience
+    from mcp_simple_tool.llm.openrouter_client import chat_with_tools
+    resilience.reset()
+    monkeypatch.setenv("OPENROUTER_MAX_CONCURRENCY", "1")
+    monkeypatch.setenv("LLM_RETRY_BASE_DELAY", "0.1")
+    llm = _FlakyLLM()
+    turn = asyncio.ensure_future(chat_with_tools("oi", model="m", _client=llm, use_tools=False))
+    await asyncio.sleep(0.05)  # dormindo no backoff entre tentativas
+    assert admission.get_limiter("openrouter").stats()["in_flight"] == 0
+    await turn
+    assert llm.in_flight == [1, 1]
+    # Fila local cheia: Overloaded direto, sem contar falha no circuit breaker
+    monkeypatch.setenv("OPENROUTER_MAX_QUEUE", "0")
+    admission.reset()
+    admission.get_limiter("openrouter")._in_flight = 1
+    with pytest.raises(Overloaded):
+        await chat_with_tools("oi", model="m2", _client=llm, use_tools=False)
+    assert resilience.get_breaker("m2", resilience.ResiliencePolicy.from_env())._failures == 0
+
+
+@pytest.mark.asyncio
+async def test_run_limited_sync_waits_for_loop_slot(monkeypatch):
+    monkeypatch.setenv("SUPABASE_MAX_CONCURRENCY", "1")
+    limiter = admission.get_limiter("supabase")
+    await limiter.acquire()  # vaga ocupada por uma requisição no loop
+    done = []
+    job = asyncio.ensure_future(asyncio.to_thread(admission.run_limited_sync, "supabase", lambda: done.append(1) or "ok"))
+    await asyncio.sleep(0.05)
+    assert done == [] and limiter.stats()["queued"] == 1
+    limiter.release()
+    assert await job == "ok"
+    await asyncio.sleep(0.01)
+    assert limiter.stats()["in_flight"] == 0
+    assert admission.run_limited_sync("supabase", lambda: "direto") == "direto"  # no próprio loop: sem fila
@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from mcp_simple_tool.webapp import storage
+
+H = {"x-api-key": "k1"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(str(tmp_path / "h.db"))
+    storage.save_message("s1", "user", "Como configuro o Supabase com Python?")
+    storage.save_message("s1", "assistant", "Use o cliente supabase-py e defina SUPABASE_URL.")
+    storage.save_message("s2", "user", "Notas sobre reunião de planejamento")
+    storage.save_message("s2", "assistant", "Encontrei 2 notas sobre reunião. Supabase não foi citado.")
+    from mcp_simple_tool.webapp import app as webapp
+    yield TestClient(webapp.app)
+    storage._CONN.close()
+
+
+def test_fts_ranked_snippets_and_filters(client):
+    assert storage.fts_enabled()
+    r = client.get("/api/history/search", params={"q": "supabase"}, headers=H).json()
+    assert r["engine"] == "fts5"
+    assert sorted(x["id"] for x in r["results"]) == [1, 2, 4]
+    assert all("**" in x["snippet"] for x in r["results"])
+    # acentos ignorados e prefixo no último termo
+    r = client.get("/api/history/search", params={"q": "reuniao plan"}, headers=H).json()
+    assert [x["id"] for x in r["results"]] == [3]
+    r = client.get("/api/history/search", params={"q": "supabase", "session_id": "s2"}, headers=H).json()
+    assert [x["session_id"] for x in r["results"]] == ["s2"]
+    r = client.get("/api/history/search", params={"q": "supabase", "until": "2000-01-01T00:00:00"}, headers=H).json()
+    assert r["results"] == []
+
+
+def test_pagination_and_syntax_safety(client):
+    page = client.get("/api/history/search", params={"q": "supabase", "limit": 1}, headers=H).json()
+    assert len(page["results"]) == 1 and page["next_offset"] == 1
+    page2 = client.get("/api/history/search", params={"q": "supabase", "limit": 2, "offset": 1}, headers=H).json()
+    assert page2["next_offset"] is None
+    assert sorted(x["id"] for x in page["results"] + page2["results"]) == [1, 2, 4]
+    assert client.get("/api/history/search", params={"q": 'supa" OR (NEAR'}, headers=H).status_code == 200
+
+
+def test_like_fallback(client, monkeypatch):
+    monkeypatch.setattr(storage, "_FTS", False)
+    r = client.get("/api/history/search", params={"q": "SUPABASE_URL"}, headers=H).json()
+    assert r["engine"] == "like" and [x["id"] for x in r["results"]] == [2]
+    assert "**SUPABASE_URL**" in r["results"][0]["snippet"]
+
+
+def test_search_does_not_touch_writer_connection(client, monkeypatch):
+    writer = storage._CONN
+    class NoReads:
+        def execute(self, *a):
+            raise AssertionError("busca não deve usar a conexão de escrita")
+    monkeypatch.setattr(storage, "_CONN", NoReads())
+    r = client.get("/api/history/search", params={"q": "supabase"}, headers=H).json()
+    assert sorted(x["id"] for x in r["results"]) == [1, 2, 4]
+    monkeypatch.setattr(storage, "_CONN", writer)
+
+
+def test_backfill_existing_database(tmp_path, monkeypatch):
+    import sqlite3
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE messages(id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, role TEXT NOT NULL, "
+                 "content TEXT NOT NULL, actions TEXT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    conn.execute("INSERT INTO messages(session_id, role, content) VALUES ('old', 'user', 'mensagem antiga indexada')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(path)
+    assert [x["session_id"] for x in storage.search_messages("antiga")["results"]] == ["old"]
+    storage._CONN.close()
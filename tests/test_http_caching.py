@@ -0,0 +1,79 @@
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from mcp_simple_tool.webapp import app as webapp
+from mcp_simple_tool.webapp import storage
+from mcp_simple_tool.webapp.compression import CompressionMiddleware
+from mcp_simple_tool.llm import orchestrator
+from mcp_simple_tool.shared_state import MemoryBackend, set_backend
+
+H = {"x-api-key": "k1"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(str(tmp_path / "history.db"))
+    set_backend(MemoryBackend())
+    yield TestClient(webapp.app)
+    storage._CONN.close()
+
+
+def test_history_etag_304_without_sqlite(client, monkeypatch):
+    async def fake_chat(prompt, **kw):
+        return ("ok", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    client.post("/api/chat", headers=H, json={"message": "oi", "session_id": "s1", "params": {"fast_path": False}})
+    r = client.get("/api/history", params={"session_id": "s1"}, headers=H)
+    etag = r.headers["etag"]
+    assert r.status_code == 200 and len(r.json()["messages"]) == 2
+
+    def boom(*a, **kw):
+        raise AssertionError("SQLite consultado")
+    originals = storage.load_history, storage.last_message_id
+    monkeypatch.setattr(storage, "load_history", boom)
+    monkeypatch.setattr(storage, "last_message_id", boom)
+    r = client.get("/api/history", params={"session_id": "s1"}, headers={**H, "If-None-Match": etag})
+    assert r.status_code == 304
+    storage.load_history, storage.last_message_id = originals
+    client.post("/api/chat", headers=H, json={"message": "de novo", "session_id": "s1", "params": {"fast_path": False}})
+    r = client.get("/api/history", params={"session_id": "s1"}, headers={**H, "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+
+
+def test_index_cached_with_etag(client):
+    r = client.get("/")
+    assert r.status_code == 200 and r.headers["cache-control"] == "no-cache"
+    assert client.get("/", headers={"If-None-Match": r.headers["etag"]}).status_code == 304
+
+
+def test_compression_threshold_and_streaming_passthrough():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, min_size=100)
+
+    @app.get("/big")
+    async def big():
+        return {"data": "x" * 1000}
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def gen():
+            for i in range(3):
+                yield json.dumps({"i": i, "pad": "y" * 200}).encode() + b"\n"
+        return StreamingResponse(gen(), media_type="application/x-ndjson")
+
+    c = TestClient(app)
+    raw = c.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert raw.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in raw.headers["vary"]
+    assert raw.json()["data"] == "x" * 1000
+    assert int(raw.headers["content-length"]) < 1000
+    assert "content-encoding" not in c.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    s = c.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in s.headers and len(s.text.splitlines()) == 3
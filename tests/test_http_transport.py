@@ -0,0 +1,27 @@
+import json
+from starlette.testclient import TestClient
+from mcp_simple_tool import server
+
+HEADERS = {"accept": "application/json, text/event-stream", "content-type": "application/json"}
+
+
+def _rpc(client, method, params=None, id_=1):
+    body = {"jsonrpc": "2.0", "id": id_, "method": method, "params": params or {}}
+    r = client.post("/mcp/", headers=HEADERS, content=json.dumps(body))
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_stateless_http_requests_need_no_session(monkeypatch):
+    monkeypatch.setenv("MCP_HTTP_JSON_RESPONSE", "1")
+    with TestClient(server.create_http_app()) as client:
+        init = _rpc(client, "initialize", {
+            "protocolVersion": "2025-06-18",
+            "capabilities": {},
+            "clientInfo": {"name": "test", "version": "0"},
+        })
+        assert init["result"]["serverInfo"]["name"] == "mcp-note-server"
+        # Requisição independente (sem mcp-session-id): qualquer worker pode atender
+        listed = _rpc(client, "tools/list", id_=2)
+        names = {t["name"] for t in listed["result"]["tools"]}
+        assert {"add_note", "search_notes", "list_tags"} <= names
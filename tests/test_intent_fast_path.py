@@ -0,0 +1,62 @@
+import pytest
+from mcp_simple_tool.llm.intent import parse_intent
+from mcp_simple_tool.llm.orchestrator import run_notes_chat
+
+
+def test_parse_create_and_search_commands():
+    create = parse_intent("Crie uma nota 'Reunião de status' com tags [mcp, trabalho]")
+    assert create.tool == "add_note" and create.confidence >= 0.85
+    assert create.args == {"title": "Reunião de status", "content": "Reunião de status", "tags": ["mcp", "trabalho"]}
+    search = parse_intent("Busque notas sobre python com a tag dev")
+    assert search.tool == "search_notes" and search.confidence >= 0.85
+    assert search.args == {"query": "python", "title": None, "tags": ["dev"]}
+
+
+def test_search_query_drops_courtesy_and_keeps_tag_words():
+    polite = parse_intent("busque notas sobre python, por favor")
+    assert polite.args["query"] == "python" and polite.confidence >= 0.85
+    assert parse_intent("busque notas sobre python obrigado").args["query"] == "python"
+    tags_word = parse_intent("busque notas sobre tags")
+    assert tags_word.args == {"query": "tags", "title": None, "tags": []}
+    quoted = parse_intent('busque notas sobre "python" com tag dev, por favor')
+    assert quoted.args == {"query": "python", "title": None, "tags": ["dev"]} and quoted.confidence >= 0.85
+
+
+@pytest.mark.parametrize("prompt", [
+    "Crie uma nota resumindo minhas notas de python",
+    "busque notas sobre python e resuma",
+    "busque notas sobre python e java",
+    "busque notas sobre python, docker",
+    "Buscar nota",
+    "Quais notas falam de python?",
+    "busque notas sobre python sem a tag dev",
+    "busque notas sobre python que eu criei ontem",
+    "busque notas sobre o que falei na reunião",
+    'busque notas sobre "python" com tag dev, por favor, exceto as antigas',
+])
+def test_ambiguous_prompts_are_not_confident(prompt):
+    intent = parse_intent(prompt)
+    assert intent is None or intent.confidence < 0.85
+
+
+@pytest.mark.asyncio
+async def test_fast_path_skips_llm():
+    async def fail_chat(*a, **kw):
+        raise AssertionError("LLM não deveria ser chamado")
+    calls = []
+    def fake_add(content, title, tags):
+        calls.append((content, title, tags))
+        return {"success": True, "data": {"inserted": [{"id": 1}]}}
+    payload = await run_notes_chat("Crie uma nota 'Compras' com tags [casa]", chat_func=fail_chat, add_note_func=fake_add)
+    assert calls == [("Compras", "Compras", ["casa"])]
+    assert payload["text"] == 'Nota "Compras" criada com tags: casa.'
+    assert payload["synthesized"] is False and payload["fast_path"]["confidence"] >= 0.85
+
+
+@pytest.mark.asyncio
+async def test_fast_path_can_be_disabled():
+    async def fake_chat(prompt, **kw):
+        return "via llm", []
+    payload = await run_notes_chat("busque notas sobre python", params={"fast_path": False}, chat_func=fake_chat,
+                                   search_notes_func=lambda q, t, tags: {"success": True, "data": {"results": []}})
+    assert payload["text"] == "via llm"
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import pytest
+from mcp_simple_tool.llm import resilience
+from mcp_simple_tool.llm.resilience import CircuitOpenError, ResiliencePolicy, call_with_resilience
+from mcp_simple_tool.llm.openrouter_client import chat_with_tools
+
+
+class UpstreamError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    resilience.reset()
+    yield
+    resilience.reset()
+
+
+def _policy(**kw):
+    base = dict(max_attempts=2, retry_base_delay=0, retry_max_delay=0, failure_threshold=2, reset_seconds=60)
+    base.update(kw)
+    return ResiliencePolicy(**base)
+
+
+@pytest.mark.asyncio
+async def test_fallback_model_used_when_primary_fails():
+    calls = []
+    async def call(model):
+        calls.append(model)
+        if model == "primary":
+            raise UpstreamError(502)
+        return "ok"
+    resp, used = await call_with_resilience(call, "primary", _policy(), fallback_models=["backup"])
+    assert (resp, used) == ("ok", "backup")
+    assert calls == ["primary", "primary", "backup"]
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_and_fails_fast():
+    calls = {"n": 0}
+    async def call(model):
+        calls["n"] += 1
+        raise UpstreamError(503)
+    policy = _policy()
+    with pytest.raises(UpstreamError):
+        await call_with_resilience(call, "m", policy, fallback_models=[])
+    assert resilience.get_breaker("m", policy).state == "open"
+    # Requisições seguintes não chegam ao upstream
+    with pytest.raises(CircuitOpenError) as exc:
+        await call_with_resilience(call, "m", policy, fallback_models=[])
+    assert calls["n"] == 2
+    assert exc.value.retry_after > 0
+
+
+@pytest.mark.asyncio
+async def test_client_errors_skip_retries_and_auth_errors_raise():
+    calls = []
+    async def call(model):
+        calls.append(model)
+        raise UpstreamError(400 if model == "a" else 401)
+    with pytest.raises(UpstreamError) as exc:
+        await call_with_resilience(call, "a", _policy(), fallback_models=["b", "c"])
+    assert exc.value.status_code == 401
+    assert calls == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_wins_after_p95():
+    policy = _policy(hedge_enabled=True, hedge_min_delay=0.01, hedge_min_samples=1)
+    resilience.get_latency("m").record(0.01)
+    calls = {"n": 0}
+    async def call(model):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            await asyncio.sleep(5)  # requisição lenta; será cancelada
+        return f"resp{calls['n']}"
+    resp, _ = await asyncio.wait_for(call_with_resilience(call, "m", policy, fallback_models=[]), 1)
+    assert resp == "resp2"
+
+
+@pytest.mark.asyncio
+async def test_chat_with_tools_maps_open_circuit(monkeypatch):
+    monkeypatch.setenv("LLM_CB_FAILURE_THRESHOLD", "1")
+    monkeypatch.setenv("LLM_MAX_ATTEMPTS", "1")
+    class Client:
+        class chat:
+            class completions:
+                @staticmethod
+                async def create(**kw):
+                    raise UpstreamError(500)
+    with pytest.raises(RuntimeError):
+        await chat_with_tools("oi", model="m", _client=Client)
+    with pytest.raises(RuntimeError) as exc:
+        await chat_with_tools("oi", model="m", _client=Client)
+    meta = json.loads(str(exc.value))
+    assert meta["code"] == "circuit_open" and meta["status"] == 503
@@ -0,0 +1,50 @@
+import io, json, logging
+from mcp_simple_tool.logging_setup import JsonFormatter, SamplingFilter, build_queue_handler
+
+
+def _record(level=logging.INFO, msg="search_notes: query=%s", args=("x",), name="mcp_notes"):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_json_formatter_fields():
+    line = JsonFormatter().format(_record())
+    payload = json.loads(line)
+    assert payload["msg"] == "search_notes: query=x"
+    assert payload["level"] == "INFO"
+    assert payload["ts"].endswith("Z") and "T" in payload["ts"]
+
+
+def test_sampling_and_rate_limit_spare_warnings():
+    drop_all = SamplingFilter(sample_rate=0.0)
+    assert drop_all.filter(_record()) is False
+    assert drop_all.filter(_record(level=logging.WARNING)) is True
+    limited = SamplingFilter(rate_limit_per_sec=2)
+    kept = [limited.filter(_record()) for _ in range(5)]
+    assert kept.count(True) == 2 and limited.dropped == 3
+    # Outro template tem cota própria
+    assert limited.filter(_record(msg="add_note: inserting")) is True
+
+
+def test_queue_handler_formats_off_thread():
+    stream = io.StringIO()
+    target = logging.StreamHandler(stream)
+    target.setFormatter(JsonFormatter())
+    handler, listener = build_queue_handler(target, SamplingFilter(rate_limit_per_sec=1))
+    log = logging.getLogger("mcp_notes.test_queue")
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    listener.start()
+    try:
+        log.info("hot %s", 1)
+        log.info("hot %s", 2)  # descartado pelo limite por segundo
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            log.exception("falhou")
+    finally:
+        listener.stop()
+        log.removeHandler(handler)
+    lines = [json.loads(x) for x in stream.getvalue().splitlines()]
+    assert [x["msg"] for x in lines] == ["hot 1", "falhou"]
+    assert "ValueError: boom" in lines[1]["exc_info"]
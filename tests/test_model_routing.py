@@ -0,0 +1,71 @@
+import pytest
+from mcp_simple_tool.llm import routing
+from mcp_simple_tool.llm.orchestrator import run_notes_chat
+from mcp_simple_tool.llm.routing import ModelRouter
+
+
+@pytest.fixture(autouse=True)
+def _reset_router():
+    routing.ROUTER.reset()
+    yield
+    routing.ROUTER.reset()
+
+
+def test_router_explores_then_picks_fastest_healthy():
+    router = ModelRouter(min_samples=2)
+    pool = ["slow", "fast", "flaky"]
+    assert router.choose(pool) == ("slow", "explore")
+    for _ in range(2):
+        router.record("slow", 2.0, ok=True)
+        router.record("fast", 0.3, ok=True)
+        router.record("flaky", 0.1, ok=False)
+    # flaky tem latência menor mas taxa de erro alta
+    assert router.choose(pool) == ("fast", "fastest_healthy")
+
+
+@pytest.mark.asyncio
+async def test_planning_and_synthesis_use_separate_models():
+    seen = []
+    async def fake_chat(prompt, model=None, **kw):
+        seen.append(model)
+        if len(seen) == 1:
+            return "draft", [{"tool": "search_notes", "args": {"query": "x"}}]
+        return "final", []
+    payload = await run_notes_chat(
+        "buscar x",
+        params={"planning_model": "fast/tool-caller", "synthesis_model": "good/writer"},
+        chat_func=fake_chat,
+        search_notes_func=lambda q, t, tags: {"success": True, "data": {"results": []}},
+    )
+    assert seen == ["fast/tool-caller", "good/writer"]
+    report = payload["actions"][-1]
+    assert report["tool"] == "_routing"
+    assert report["result"]["planning"]["model"] == "fast/tool-caller"
+    assert report["result"]["synthesis"]["model"] == "good/writer"
+    assert "latency_ms" in report["result"]["observed"]["good/writer"]
+
+
+@pytest.mark.asyncio
+async def test_adaptive_pool_from_env(monkeypatch):
+    monkeypatch.setenv("LLM_ADAPTIVE_ROUTING", "1")
+    monkeypatch.setenv("OPENROUTER_PLANNING_POOL", "a,b")
+    for _ in range(3):
+        routing.ROUTER.record("a", 1.5, ok=True)
+        routing.ROUTER.record("b", 0.2, ok=True)
+    async def fake_chat(prompt, model=None, **kw):
+        return f"via {model}", []
+    payload = await run_notes_chat("oi", chat_func=fake_chat)
+    assert payload["text"] == "via b"
+    assert payload["actions"][-1]["result"]["planning"]["reason"] == "fastest_healthy"
+
+
+@pytest.mark.asyncio
+async def test_router_records_model_that_served():
+    async def fake_chat(prompt, model=None, used_models=None, **kw):
+        used_models.append("backup/model")  # primário falhou, fallback atendeu
+        return "ok", []
+    payload = await run_notes_chat("oi", params={"planning_model": "primary/model", "fast_path": False}, chat_func=fake_chat)
+    observed = routing.ROUTER.snapshot()
+    assert observed["backup/model"]["error_rate"] == 0.0
+    assert observed["primary/model"]["error_rate"] == 1.0
+    assert payload["actions"][-1]["result"]["planning"]["served_by"] == "backup/model"
@@ -0,0 +1,94 @@
+import threading
+import pytest
+from mcp_simple_tool.tools import notes
+from mcp_simple_tool.llm import orchestrator
+from mcp_simple_tool.shared_state import MemoryBackend, get_backend, set_backend
+
+
+class _Resp:
+    def __init__(self, data):
+        self.data = data
+        self.__dict__['error'] = None
+
+
+class InsertClient:
+    def __init__(self, delay=None):
+        self.inserts = []
+        self.delay = delay
+        self.entered = threading.Event()
+
+    def table(self, _):
+        outer = self
+        class T:
+            def insert(self, data):
+                class Exec:
+                    def execute(self_inner):
+                        outer.entered.set()
+                        if outer.delay:
+                            outer.delay.wait(2)
+                        outer.inserts.append(data)
+                        return _Resp([{"id": len(outer.inserts), **data}])
+                return Exec()
+        return T()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    set_backend(MemoryBackend())
+    c = InsertClient()
+    monkeypatch.setattr(notes, "supabase", c)
+    return c
+
+
+def test_content_hash_dedup_skips_write_and_cache_clear(client):
+    first = notes.add_note_tool("conteúdo", "Título", ["b", "a"])
+    get_backend().set(notes._SEARCH_CACHE_NS, "k", {"results": [1]})
+    again = notes.add_note_tool(" conteúdo ", "Título", ["a", "b", "a"])
+    assert again == {"success": True, "data": {"inserted": first["data"]["inserted"], "deduplicated": True}}
+    assert len(client.inserts) == 1
+    assert get_backend().get(notes._SEARCH_CACHE_NS, "k") is not None
+    assert "deduplicated" not in notes.add_note_tool("outro", "Título", ["a", "b"])["data"]
+    assert len(client.inserts) == 2
+
+
+def test_idempotency_key_and_window(client, monkeypatch):
+    notes.add_note_tool("v1", "t", [], idempotency_key="req-1")
+    r = notes.add_note_tool("v2 (retry reformulado)", "t", [], idempotency_key="req-1")
+    assert r["data"]["deduplicated"] is True and len(client.inserts) == 1
+    monkeypatch.setattr(notes, "_DEDUP_WINDOW_SECONDS", 0)
+    notes.add_note_tool("igual", "t", [])
+    notes.add_note_tool("igual", "t", [])
+    assert len(client.inserts) == 3
+
+
+def test_concurrent_retry_fails_fast_on_idempotency_key(monkeypatch):
+    set_backend(MemoryBackend())
+    release = threading.Event()
+    c = InsertClient(delay=release)
+    monkeypatch.setattr(notes, "supabase", c)
+    first = []
+    t = threading.Thread(target=lambda: first.append(notes.add_note_tool("x", "t", [], idempotency_key="req-9")))
+    t.start()
+    assert c.entered.wait(2)
+    # Retry reformulado (outro hash) com a mesma chave durante o insert: não espera nem insere
+    busy = notes.add_note_tool("x (de novo)", "t", [], idempotency_key="req-9")
+    assert busy["success"] is False and busy["code"] == "in_progress"
+    release.set()
+    t.join()
+    again = notes.add_note_tool("x (de novo)", "t", [], idempotency_key="req-9")
+    assert again["data"]["deduplicated"] is True and len(c.inserts) == 1
+    assert "deduplicated" not in first[0]["data"]
+
+
+@pytest.mark.asyncio
+async def test_repeated_plan_actions_insert_once(client):
+    plan = [{"tool": "add_note", "args": {"content": "c", "title": "t", "idempotency_key": "k"}}] * 2
+    calls = {"n": 0}
+    async def fake_chat(prompt, **kw):
+        calls["n"] += 1
+        return ("Draft", plan) if calls["n"] == 1 else ("Final", [])
+    payload = await orchestrator.run_notes_chat(
+        "crie", params={"fast_path": False}, chat_func=fake_chat, add_note_func=notes.add_note_tool
+    )
+    assert [a["result"]["data"].get("deduplicated", False) for a in payload["actions"]] == [False, True]
+    assert len(client.inserts) == 1
@@ -0,0 +1,98 @@
+import pytest
+from mcp_simple_tool.tools import notes
+from mcp_simple_tool.shared_state import MemoryBackend, set_backend
+
+LONG = "introdução " * 40 + "o termo kubernetes aparece aqui no meio " + "conclusão " * 40
+ROWS = [{"id": 1, "title": "Longa", "content": LONG, "tags": ["infra"]}, {"id": 2, "title": "Curta", "content": "kubernetes", "tags": []}]
+
+
+class _Resp:
+    def __init__(self, data):
+        self.data = data
+        self.__dict__['error'] = None
+
+
+class FakeClient:
+    def __init__(self):
+        self.searches = 0
+        self.fetched = []
+
+    def table(self, _):
+        outer = self
+        class Q:
+            def select(self, _): return self
+            def ilike(self, *a): return self
+            def overlaps(self, *a): return self
+            def in_(self, _, ids):
+                self.ids = ids
+                return self
+            def execute(self):
+                if hasattr(self, "ids"):
+                    outer.fetched.append(list(self.ids))
+                    return _Resp([r for r in ROWS + [{"id": 3, "title": "t3", "content": "c3"}] if r["id"] in self.ids])
+                outer.searches += 1
+                return _Resp([dict(r) for r in ROWS])
+        return Q()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    set_backend(MemoryBackend())
+    notes._NOTE_CACHE.clear()
+    c = FakeClient()
+    monkeypatch.setattr(notes, "supabase", c)
+    return c
+
+
+def test_snippet_centered_on_match():
+    snip = notes._snippet(LONG, "Kubernetes", 60)
+    assert "kubernetes" in snip and snip.startswith("…") and snip.endswith("…")
+    assert len(snip) <= 62
+    assert notes._snippet(LONG, "ausente", 20) == LONG[:20].strip() + "…"
+    assert notes._snippet("curto", "x", 20) == "curto"
+
+
+def test_search_returns_snippets_not_content(client):
+    for _ in range(2):  # miss e hit do cache devolvem o mesmo formato
+        results = notes.search_notes_tool("kubernetes", None, [])["data"]["results"]
+        assert all("content" not in r for r in results)
+        assert results[0]["content_length"] == len(LONG) and len(results[0]["snippet"]) <= notes._SNIPPET_CHARS + 2
+        assert results[1] == {"id": 2, "title": "Curta", "tags": [], "snippet": "kubernetes", "content_length": 10}
+    assert notes.search_notes_tool("kubernetes", None, [], full=True)["data"]["results"][0]["content"] == LONG
+    assert client.searches == 1
+
+
+def test_get_notes_batches_and_uses_cache(client):
+    notes.search_notes_tool("kubernetes", None, [])  # busca aquece o cache por id
+    r = notes.get_notes_tool([2, 3, 1, 9, 3])
+    assert [n["id"] for n in r["data"]["notes"]] == [2, 3, 1] and r["data"]["missing"] == [9]
+    assert r["data"]["notes"][2]["content"] == LONG
+    assert client.fetched == [[3, 9]]
+    notes.get_notes_tool([3])
+    assert client.fetched == [[3, 9]]
+    notes.invalidate_caches()
+    notes.get_notes_tool([3])
+    assert client.fetched[-1] == [3]
+
+
+def test_get_notes_validation(client):
+    assert notes.get_notes_tool([])["code"] == "invalid_argument"
+    assert notes.get_notes_tool(list(range(notes._GET_NOTES_MAX_IDS + 1)))["success"] is False
+    assert client.fetched == []
+
+
+@pytest.mark.asyncio
+async def test_synthesis_gets_full_content_of_top_notes(client):
+    from mcp_simple_tool.llm import orchestrator
+    prompts = []
+    async def chat(prompt, **kw):
+        prompts.append(prompt)
+        return ("Draft", [{"tool": "search_notes", "args": {"query": "kubernetes"}}]) if len(prompts) == 1 else ("Final", [])
+    payload = await orchestrator.run_notes_chat(
+        "o que eu escrevi sobre kubernetes?", params={"fast_path": False}, chat_func=chat,
+        search_notes_func=notes.search_notes_tool, get_notes_func=notes.get_notes_tool,
+    )
+    assert "content" not in payload["actions"][0]["result"]["data"]["results"][0]
+    assert LONG in prompts[1] and "[id=1] Longa" in prompts[1]
+    assert "[id=2]" not in prompts[1]  # snippet já é a nota inteira
+    assert client.fetched == []  # veio do cache por id aquecido pela busca
@@ -1,7 +1,18 @@
 import time
+import pytest
+from mcp_simple_tool import shared_state
+from mcp_simple_tool.shared_state import MemoryBackend
 from mcp_simple_tool.tools import notes
 
 
+@pytest.fixture
+def memory_backend(monkeypatch):
+    # Backend isolado por teste; monkeypatch devolve o global do processo no teardown
+    backend = MemoryBackend()
+    monkeypatch.setattr(shared_state, "_BACKEND", backend)
+    return backend
+
+
 def test_tag_sanitization_and_dedup():
     raw = ["  python  ", "python", "PyThon!!", "with space", "toolong" + "x"*100, "valid-tag", "INVALID!*&"]
     sanitized = notes._sanitize_tags(raw)  # type: ignore
@@ -68,3 +79,78 @@ def test_search_cache_cycle(monkeypatch):
     r3 = notes.search_notes_tool("q", None, ["tag"])  # type: ignore
     assert r3['data']['cached'] is False
     assert calls['count'] == 2
+
+
+class _Resp:
+    def __init__(self, data):
+        self.data = data
+        self.__dict__['error'] = None
+
+
+class _CountingClient:
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+    def table(self, _):
+        outer = self
+        class T:
+            def select(self, _): return self
+            def ilike(self, *a, **k): return self
+            def overlaps(self, *a, **k): return self
+            def execute(self):
+                outer.calls += 1
+                return _Resp(outer.data)
+        return T()
+
+
+def _expire(key_args, seconds):
+    from mcp_simple_tool.shared_state import get_backend, make_key
+    entry = get_backend().get(notes._SEARCH_CACHE_NS, make_key(*key_args))
+    entry["_ts"] -= seconds
+    get_backend().set(notes._SEARCH_CACHE_NS, make_key(*key_args), entry, ttl=600)
+
+
+def test_stale_while_revalidate(monkeypatch, memory_backend):
+    client = _CountingClient([{"id": 1}])
+    monkeypatch.setattr(notes, 'supabase', client)
+    notes.search_notes_tool("swr", None, [])
+    client.data = [{"id": 2}]
+    _expire(("swr", None, []), notes._CACHE_TTL_SECONDS + 1)
+    r = notes.search_notes_tool("swr", None, [])
+    # entrada stale servida na hora; um único refresh em background
+    assert r['data']['stale'] is True and r['data']['results'] == [{"id": 1}]
+    notes.search_notes_tool("swr", None, [])
+    notes._REFRESH_POOL.shutdown(wait=True)
+    notes._REFRESH_POOL = None
+    assert client.calls == 2
+    assert notes.search_notes_tool("swr", None, [])['data']['results'] == [{"id": 2}]
+
+
+def test_negative_cache_for_empty_results(monkeypatch, memory_backend):
+    client = _CountingClient([])
+    monkeypatch.setattr(notes, 'supabase', client)
+    assert notes.search_notes_tool("nada", None, [])['data']['cached'] is False
+    assert notes.search_notes_tool("nada", None, [])['data']['cached'] is True
+    assert client.calls == 1
+    # vazio expira rápido e não é servido como stale
+    _expire(("nada", None, []), notes._NEGATIVE_TTL_SECONDS + 1)
+    assert notes.search_notes_tool("nada", None, [])['data']['cached'] is False
+    assert client.calls == 2
+
+
+def test_warm_up_from_history(monkeypatch, tmp_path, memory_backend):
+    from mcp_simple_tool.webapp import storage
+    # storage.init reescreve esses globais: registra os valores atuais para o monkeypatch restaurar
+    for attr in ("_CONN", "_DB_PATH", "_FTS"):
+        monkeypatch.setattr(storage, attr, getattr(storage, attr))
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(str(tmp_path / "h.db"))
+    for q in ["python", "python", "mcp"]:
+        storage.save_message("s", "assistant", "ok", [{"tool": "search_notes", "args": {"query": q, "tags": []}, "result": {}}])
+    searches = storage.frequent_searches(1)
+    assert searches == [("python", None, [])]
+    client = _CountingClient([{"id": 1}])
+    monkeypatch.setattr(notes, 'supabase', client)
+    assert notes.warm_search_cache(searches) == 1
+    assert notes.search_notes_tool("python", None, [])['data']['cached'] is True
+    storage._CONN.close()
@@ -52,3 +52,9 @@ async def test_truncation_action():
     text, acts = await chat_with_tools(long_prompt, _client=dummy, max_tool_passes=1)
     has_trunc = any(a['tool'] == '_system' and a['result'].get('truncated') for a in acts)
     assert has_trunc
+
+
+def test_sdk_retries_disabled(monkeypatch):
+    from mcp_simple_tool.llm.openrouter_client import get_async_client
+    monkeypatch.setenv("OPENROUTER_API_KEY", "k")
+    assert get_async_client().max_retries == 0  # retries só em call_with_resilience
@@ -0,0 +1,115 @@
+import logging
+import os
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from mcp_simple_tool import profiling
+from mcp_simple_tool.webapp import app as webapp
+from mcp_simple_tool.llm import orchestrator
+from mcp_simple_tool.shared_state import MemoryBackend, set_backend
+
+H = {"x-api-key": "k1"}
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+
+@pytest.fixture
+def slow_log():
+    handler = ListHandler()
+    profiling.slow_logger.addHandler(handler)
+    yield handler.records
+    profiling.slow_logger.removeHandler(handler)
+
+
+def _busy_hot_loop(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_sampled_request_writes_collapsed_profile(tmp_path, monkeypatch, slow_log):
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "1")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("SLOW_REQUEST_MS", "20")
+    async with profiling.request_scope("mcp", "search_notes") as timer:
+        timer.mark("tool")
+        _busy_hot_loop(0.1)
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and "mcp-search_notes" in files[0] and files[0].endswith(".collapsed")
+    lines = (tmp_path / files[0]).read_text().splitlines()
+    assert any("_busy_hot_loop" in line.rsplit(" ", 1)[0] for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert len(slow_log) == 1 and "name=search_notes" in slow_log[0] and '"stage":"tool"' in slow_log[0]
+
+
+@pytest.mark.asyncio
+async def test_sampled_profile_finished_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    monkeypatch.setenv("PROFILE_SAMPLE_RATE", "1")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    threads = []
+    original = profiling.SamplingProfiler.dump
+    def dump(self, label):
+        threads.append(threading.current_thread())
+        return original(self, label)
+    monkeypatch.setattr(profiling.SamplingProfiler, "dump", dump)
+    async with profiling.request_scope("web", "chat"):
+        pass
+    assert threads and threads[0] is not threading.main_thread()
+    assert profiling._ACTIVE.acquire(blocking=False)
+    profiling._ACTIVE.release()
+
+
+@pytest.mark.asyncio
+async def test_fast_request_not_logged_nor_profiled(tmp_path, monkeypatch, slow_log):
+    monkeypatch.delenv("PROFILING_ENABLED", raising=False)
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("SLOW_REQUEST_MS", "10000")
+    async with profiling.request_scope("web", "chat"):
+        pass
+    assert slow_log == [] and os.listdir(tmp_path) == []
+
+
+def test_chat_stage_timings_in_slow_log(monkeypatch, slow_log):
+    set_backend(MemoryBackend())
+    monkeypatch.setenv("SLOW_REQUEST_MS", "0.001")
+    calls = {"n": 0}
+    async def fake_chat(prompt, **kw):
+        calls["n"] += 1
+        return ("Draft", [{"tool": "list_tags", "args": {}}]) if calls["n"] == 1 else ("Final", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    monkeypatch.setattr(webapp, "list_tags_tool", lambda prefix, limit: {"success": True, "data": {"tags": []}})
+    r = TestClient(webapp.app).post("/api/chat", json={"message": "quais tags?", "params": {"fast_path": False}}, headers=H)
+    assert r.status_code == 200
+    stages = [s for s in ("context", "persist_user", "planning", "planned", "tool", "synthesis", "persist_assistant")
+              if f'"stage":"{s}"' in slow_log[-1]]
+    assert len(stages) == 7
+
+
+def test_debug_profile_endpoint_gating(tmp_path, monkeypatch):
+    client = TestClient(webapp.app)
+    monkeypatch.delenv("PROFILING_ENABLED", raising=False)
+    assert client.post("/debug/profile?seconds=0.1", headers=H).status_code == 404
+    monkeypatch.setenv("PROFILING_ENABLED", "1")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    assert client.post("/debug/profile?seconds=0.1", headers={"x-api-key": "errada"}).status_code == 401
+    monkeypatch.delenv("AUTH_API_KEY")
+    assert client.post("/debug/profile?seconds=0.1").status_code == 403
+    monkeypatch.setenv("AUTH_API_KEY", "k1")
+    body = client.post("/debug/profile?seconds=0.2", headers=H).json()
+    assert body["samples"] > 0 and os.path.exists(body["path"]) and body["top"]
+    assert profiling._ACTIVE.acquire(blocking=False)
+    try:
+        assert client.post("/debug/profile?seconds=0.1", headers=H).status_code == 409
+    finally:
+        profiling._ACTIVE.release()
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import pytest
+from click.testing import CliRunner
+from mcp_simple_tool import replay
+from mcp_simple_tool.llm import orchestrator
+from mcp_simple_tool.shared_state import MemoryBackend, set_backend
+
+
+def _live_stubs():
+    """Simula OpenRouter/Supabase 'reais' com latência para a gravação."""
+    calls = {"n": 0}
+    async def chat(prompt, **kw):
+        calls["n"] += 1
+        await asyncio.sleep(0.05)
+        if calls["n"] == 1:
+            return ("Draft", [{"tool": "search_notes", "args": {"query": "python"}}])
+        return (f"Final: {prompt.count('python')} menções", [])
+    def search(query, title, tags, full=False):
+        return {"success": True, "data": {"results": [{"id": 1, "title": "Python", "snippet": "python"}], "cached": False}}
+    return chat, search
+
+
+@pytest.fixture
+def fixture_path(tmp_path, monkeypatch):
+    path = tmp_path / "sessao.ndjson"
+    monkeypatch.setenv("REPLAY_RECORD_PATH", str(path))
+    chat, search = _live_stubs()
+    monkeypatch.setattr(orchestrator, "chat_with_tools", chat)
+    payload = asyncio.run(orchestrator.run_notes_chat("notas sobre python?", params={"fast_path": False}, search_notes_func=search))
+    monkeypatch.delenv("REPLAY_RECORD_PATH")
+    monkeypatch.setattr(orchestrator, "chat_with_tools", None)  # replay nunca chama o LLM real
+    assert payload["synthesized"] is True
+    return path
+
+
+def test_recording_captures_llm_tools_and_timings(fixture_path):
+    (turn,) = replay.load_turns(str(fixture_path))
+    kinds = [(e["kind"], e.get("tool")) for e in turn["events"]]
+    assert kinds == [("llm", None), ("tool", "search_notes"), ("llm", None)]
+    assert turn["events"][1]["args"] == ["python", None, []]
+    assert all(e["ms"] >= 0 for e in turn["events"]) and turn["ms"] >= 100
+    assert turn["result"]["text"].startswith("Final")
+
+
+@pytest.mark.asyncio
+async def test_offline_replay_accelerated(fixture_path):
+    turns = replay.load_turns(str(fixture_path))
+    summary = await replay.replay_turns(turns, speed=0)
+    assert (summary["errors"], summary["text_mismatches"], summary["misses"], summary["divergent_prompts"]) == (0, 0, 0, 0)
+    assert summary["replayed_ms"]["p50"] < 50
+    report = (await replay.replay_turns(turns, speed=1))["reports"][0]
+    assert report["replayed_ms"] >= 90 and report["llm_calls"] == 2 and report["tool_calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_replay_reports_divergence(fixture_path):
+    (turn,) = replay.load_turns(str(fixture_path))
+    turn["events"][0]["actions"] = [{"tool": "search_notes", "args": {"query": "rust"}}]
+    report = await replay.replay_turn(turn, speed=0)
+    assert report["misses"] == [{"tool": "search_notes", "args": ["rust", None, []]}]
+    assert report["divergent_prompts"] == 1  # síntese viu o resultado do miss
+    turn["events"] = turn["events"][:1]
+    assert "não gravada" in (await replay.replay_turn(turn, speed=0))["error"]
+
+
+def test_tool_kwargs_are_part_of_the_key():
+    args = ["python", None, []]
+    turn = {"events": [
+        {"kind": "tool", "tool": "search_notes", "args": args, "kwargs": {"full": True}, "ms": 0, "result": {"full": True}},
+        {"kind": "tool", "tool": "search_notes", "args": args, "ms": 0, "result": {"full": False}},
+    ]}
+    search = replay.Replayer(turn, speed=0).tool("search_notes")
+    assert search("python", None, []) == {"full": False}
+    assert search("python", None, [], full=True) == {"full": True}
+    assert search("python", None, [])["code"] == "replay_miss"
+
+
+def test_cli_replays_through_api(fixture_path, monkeypatch):
+    set_backend(MemoryBackend())
+    from mcp_simple_tool.webapp import app as webapp
+    original = webapp.search_notes_tool
+    with open(fixture_path, "a", encoding="utf-8") as f:  # 2 turnos concorrentes
+        f.write(fixture_path.read_text().splitlines()[0] + "\n")
+    monkeypatch.setenv("RATE_LIMIT_PER_MIN", "60")
+    monkeypatch.delenv("REPLAY_RECORD_SAMPLE_RATE", raising=False)
+    r = CliRunner().invoke(replay.cli, ["run", str(fixture_path), "--speed", "0", "--target", "api", "--concurrency", "2", "--strict"])
+    assert r.exit_code == 0, r.output
+    summary = json.loads(r.output)
+    assert summary["turns"] == 2 and summary["errors"] == 0 and summary["misses"] == 0
+    assert webapp.search_notes_tool is original
+    # Overrides do CLI valem só durante o comando
+    assert os.environ["RATE_LIMIT_PER_MIN"] == "60" and "REPLAY_RECORD_PATH" not in os.environ
+
+
+def test_record_scopes_env(tmp_path, monkeypatch):
+    async def chat(prompt, **kw):
+        return ("ok", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", chat)
+    monkeypatch.delenv("REPLAY_RECORD_PATH", raising=False)
+    prompts = tmp_path / "prompts.txt"
+    prompts.write_text("oi\n", encoding="utf-8")
+    out = tmp_path / "out.ndjson"
+    r = CliRunner().invoke(replay.cli, ["record", str(prompts), "--out", str(out)])
+    assert r.exit_code == 0, r.output
+    assert len(replay.load_turns(str(out))) == 1
+    assert "REPLAY_RECORD_PATH" not in os.environ and "REPLAY_RECORD_SAMPLE_RATE" not in os.environ
+
+
+def test_orchestrator_does_not_import_replay():
+    code = "import sys, mcp_simple_tool.llm.orchestrator; print('mcp_simple_tool.replay' in sys.modules)"
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, timeout=120)
+    assert proc.stdout.strip() == "False", proc.stderr
@@ -0,0 +1,95 @@
+import pytest
+from mcp_simple_tool.llm import context as ctx
+from mcp_simple_tool.llm.orchestrator import run_notes_chat
+from mcp_simple_tool.llm.openrouter_client import chat_with_tools
+from mcp_simple_tool.webapp import storage
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(str(tmp_path / "history.db"))
+    monkeypatch.setenv("CONTEXT_MAX_TURNS", "2")
+    monkeypatch.setenv("CONTEXT_SUMMARY_BATCH", "4")
+    yield
+    storage._CONN.close()
+
+
+def _fill(session_id, n):
+    for i in range(n):
+        storage.save_message(session_id, "user" if i % 2 == 0 else "assistant", f"msg{i}")
+
+
+def test_window_includes_unsummarized_overflow(db):
+    _fill("s", 7)
+    c = ctx.build_session_context("s", history=storage)
+    # janela = 4 últimas; msg0..msg2 ainda não resumidas (< batch) entram como turnos
+    assert [t["text"] for t in c.turns] == [f"msg{i}" for i in range(7)]
+    assert c.pending == 3 and c.summary == ""
+
+
+@pytest.mark.asyncio
+async def test_summary_is_incremental_and_prompt_bounded(db):
+    seen = []
+    async def summarize(previous, messages):
+        seen.append([m["text"] for m in messages])
+        return (previous + " " if previous else "") + "+".join(m["text"] for m in messages)
+    _fill("s", 8)
+    assert await ctx.refresh_summary("s", summarize, history=storage) is True
+    assert seen == [["msg0", "msg1", "msg2", "msg3"]]
+    # janela não deslizou o suficiente: nada a resumir
+    assert await ctx.refresh_summary("s", summarize, history=storage) is False
+    _fill("s", 4)
+    assert await ctx.refresh_summary("s", summarize, history=storage) is True
+    # só as mensagens novas fora da janela, nunca a sessão inteira
+    assert seen[-1] == ["msg4", "msg5", "msg6", "msg7"]
+    _fill("s", 40)
+    c = ctx.build_session_context("s", history=storage)
+    assert c.summary.startswith("msg0+msg1+msg2+msg3 msg4")
+    assert len(c.turns) < 2 * 2 + 4
+
+
+@pytest.mark.asyncio
+async def test_summarizer_failure_falls_back_to_extractive(db):
+    async def broken(previous, messages):
+        raise RuntimeError("boom")
+    _fill("s", 8)
+    assert await ctx.refresh_summary("s", broken, history=storage) is True
+    assert "Usuário: msg0" in storage.get_summary("s")["summary"]
+
+
+@pytest.mark.asyncio
+async def test_history_reaches_llm_messages():
+    sent = {}
+    class Client:
+        class chat:
+            class completions:
+                @staticmethod
+                async def create(**kw):
+                    sent.update(kw)
+                    class M: content = "ok"; tool_calls = None
+                    class C: message = M
+                    class R: choices = [C]
+                    return R
+    c = ctx.SessionContext(summary="falamos de python", turns=[{"role": "user", "text": "busque python"}, {"role": "assistant", "text": "2 notas"}])
+    async def chat(prompt, **kw):
+        return await chat_with_tools(prompt, _client=Client, **kw)
+    out = await run_notes_chat("e a segunda?", params={"fast_path": False}, chat_func=chat, context=c)
+    assert out["text"] == "ok"
+    roles = [m["role"] for m in sent["messages"]]
+    assert roles == ["system", "system", "user", "assistant", "user"]
+    assert "falamos de python" in sent["messages"][1]["content"]
+
+
+@pytest.mark.asyncio
+async def test_default_history_uses_shared_state(monkeypatch):
+    from mcp_simple_tool.shared_state import MemoryBackend, get_backend, set_backend
+    set_backend(MemoryBackend())
+    monkeypatch.setenv("CONTEXT_MAX_TURNS", "1")
+    monkeypatch.setenv("CONTEXT_SUMMARY_BATCH", "2")
+    get_backend().set("sessions", "s", [{"role": "user", "text": f"m{i}"} for i in range(4)])
+    async def summarize(previous, messages):
+        return "+".join(m["text"] for m in messages)
+    assert await ctx.refresh_summary("s", summarize) is True
+    c = ctx.build_session_context("s")
+    assert c.summary == "m0+m1" and [t["text"] for t in c.turns] == ["m2", "m3"]
@@ -0,0 +1,85 @@
+import os, tempfile, time
+import pytest
+from mcp_simple_tool import shared_state
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request):
+    if request.param == "memory":
+        yield shared_state.MemoryBackend()
+        return
+    fd, path = tempfile.mkstemp(prefix="state", suffix=".db")
+    os.close(fd)
+    yield shared_state.SQLiteBackend(path)
+    for suffix in ("", "-wal", "-shm"):
+        try: os.remove(path + suffix)
+        except OSError: pass
+
+
+def test_get_set_delete_clear(backend):
+    backend.set("ns", "a", {"x": 1})
+    backend.set("ns", "b", [1, 2])
+    backend.set("other", "a", "keep")
+    assert backend.get("ns", "a") == {"x": 1}
+    backend.delete("ns", "a")
+    assert backend.get("ns", "a") is None
+    backend.clear("ns")
+    assert backend.get("ns", "b") is None
+    assert backend.get("other", "a") == "keep"
+
+
+def test_incr_append_and_ttl(backend):
+    assert backend.incr("rate", "k", ttl=60) == 1
+    assert backend.incr("rate", "k", ttl=60) == 2
+    backend.append("sessions", "s1", {"role": "user"})
+    backend.append("sessions", "s1", {"role": "assistant"})
+    assert [m["role"] for m in backend.get("sessions", "s1")] == ["user", "assistant"]
+    backend.set("cache", "short", 1, ttl=0.05)
+    time.sleep(0.1)
+    assert backend.get("cache", "short") is None
+
+
+def test_sqlite_visible_across_instances():
+    # Duas instâncias no mesmo arquivo simulam dois workers
+    fd, path = tempfile.mkstemp(prefix="state", suffix=".db")
+    os.close(fd)
+    try:
+        w1, w2 = shared_state.SQLiteBackend(path), shared_state.SQLiteBackend(path)
+        w1.incr("rate", "ip:1")
+        assert w2.incr("rate", "ip:1") == 2
+        w2.append("sessions", "s", {"role": "user", "text": "oi"})
+        assert w1.get("sessions", "s") == [{"role": "user", "text": "oi"}]
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            try: os.remove(path + suffix)
+            except OSError: pass
+
+
+def test_create_backend_from_env(monkeypatch):
+    monkeypatch.setenv("SHARED_STATE_BACKEND", "memory")
+    assert isinstance(shared_state.create_backend(), shared_state.MemoryBackend)
+    with pytest.raises(ValueError):
+        shared_state.create_backend("redis")
+
+
+def _rows(backend):
+    if isinstance(backend, shared_state.SQLiteBackend):
+        return backend._connect().execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+    return sum(len(entries) for entries in backend._data.values())
+
+
+def test_expired_keys_purged_every_n_writes(backend, monkeypatch):
+    monkeypatch.setattr(shared_state, "_PURGE_EVERY", 10)
+    # Janelas do rate limit nunca são relidas depois de expirar
+    for window in range(5):
+        backend.incr("rate", f"ip:{window}", ttl=0.01)
+    time.sleep(0.05)
+    assert _rows(backend) == 5
+    for i in range(4):
+        backend.set("cache", str(i), i, ttl=60)
+    assert _rows(backend) == 9
+    backend.append("sessions", "s", {"role": "user"})  # 10ª escrita dispara a limpeza
+    assert _rows(backend) == 5
+    backend.set("cache", "short", 1, ttl=0.01)
+    time.sleep(0.05)
+    assert backend.purge_expired() == 1
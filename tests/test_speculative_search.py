@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import pytest
+from mcp_simple_tool.llm import orchestrator, speculative
+
+NOTES = [
+    {"id": 1, "title": "Deploy Kubernetes", "content": "kubernetes deploy com helm", "tags": ["infra"]},
+    {"id": 2, "title": "Kubernetes local", "content": "kubernetes com kind", "tags": ["dev"]},
+]
+
+
+def test_predict_and_match():
+    assert speculative.predict_search("Crie uma nota sobre kubernetes") is None
+    assert speculative.predict_search("bom dia") is None
+    assert speculative.predict_search("Quais notas falam de kubernetes?") == {"query": "kubernetes", "title": None, "tags": []}
+    assert speculative.predict_search("Busque notas sobre python com a tag dev") == {"query": "python", "title": None, "tags": ["dev"]}
+    pred = {"query": "kubernetes", "title": None, "tags": []}
+    assert speculative.match(pred, {"query": "Kubernetes"}) == "hit"
+    assert speculative.match(pred, {"query": "kubernetes deploy", "tags": ["infra"]}) == "covered"
+    assert speculative.match(pred, {"query": "docker"}) is None
+    assert speculative.match(pred, {"title": "kubernetes"}) is None
+    assert speculative.match(pred, {"query": "kubernetes_%"}) is None
+    assert speculative.filter_results(NOTES, {"query": "kubernetes deploy", "tags": ["infra"]}) == [NOTES[0]]
+
+
+def _fake_chat(planned_args):
+    calls = {"n": 0}
+    async def chat(prompt, **kw):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            await asyncio.sleep(0.05)  # planejamento em voo: a busca prevista corre em paralelo
+            return ("Draft", [{"tool": "search_notes", "args": planned_args}] if planned_args else [])
+        return ("Final", [])
+    return chat
+
+
+def _search_recorder():
+    calls = []
+    lock = threading.Lock()
+    def search(query, title, tags, full=False):
+        with lock:
+            calls.append((query, title, tags))
+        return {"success": True, "data": {"results": [n for n in NOTES if (query or "") in n["content"]], "cached": False}}
+    return search, calls
+
+
+@pytest.mark.asyncio
+async def test_covered_search_served_from_prefetch():
+    speculative.reset()
+    search, calls = _search_recorder()
+    payload = await orchestrator.run_notes_chat(
+        "Quais notas falam de kubernetes deploy?", params={"fast_path": False, "speculative_search": True},
+        chat_func=_fake_chat({"query": "kubernetes deploy", "tags": ["infra"]}), search_notes_func=search,
+    )
+    data = payload["actions"][0]["result"]["data"]
+    assert data["speculative"] == "covered" and [n["id"] for n in data["results"]] == [1]
+    assert "content" not in data["results"][0] and data["results"][0]["snippet"]
+    assert calls == [("kubernetes", None, [])]
+    assert speculative.stats()["covered"] == 1 and speculative.stats()["hit_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_miss_and_unused_are_counted():
+    speculative.reset()
+    search, calls = _search_recorder()
+    payload = await orchestrator.run_notes_chat(
+        "Quais notas falam de kubernetes?", params={"fast_path": False, "speculative_search": True},
+        chat_func=_fake_chat({"query": "docker"}), search_notes_func=search,
+    )
+    assert "speculative" not in payload["actions"][0]["result"]["data"]
+    assert sorted(c[0] for c in calls) == ["docker", "kubernetes"]
+    await orchestrator.run_notes_chat(
+        "Quais notas falam de kubernetes?", params={"fast_path": False, "speculative_search": True},
+        chat_func=_fake_chat(None), search_notes_func=search,
+    )
+    st = speculative.stats()
+    assert (st["attempts"], st["miss"], st["unused"], st["hit_rate"]) == (2, 1, 1, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("SPECULATIVE_SEARCH", raising=False)
+    speculative.reset()
+    search, calls = _search_recorder()
+    await orchestrator.run_notes_chat(
+        "Quais notas falam de kubernetes?", params={"fast_path": False},
+        chat_func=_fake_chat({"query": "kubernetes"}), search_notes_func=search,
+    )
+    assert calls == [("kubernetes", None, [])] and speculative.stats()["attempts"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_prefetch_counted_once():
+    speculative.reset()
+    search, calls = _search_recorder()
+    def flaky(query, title, tags, full=False):
+        if full:
+            raise RuntimeError("supabase fora")
+        return search(query, title, tags)
+    payload = await orchestrator.run_notes_chat(
+        "Quais notas falam de kubernetes?", params={"fast_path": False, "speculative_search": True},
+        chat_func=_fake_chat({"query": "kubernetes"}), search_notes_func=flaky,
+    )
+    assert payload["actions"][0]["result"]["success"] and calls == [("kubernetes", None, [])]
+    st = speculative.stats()
+    assert (st["errors"], st["miss"], st["hit_rate"]) == (1, 0, None)
+
+
+@pytest.mark.asyncio
+async def test_missed_prefetch_is_cancelled():
+    speculative.reset()
+    task = asyncio.ensure_future(asyncio.sleep(10))
+    predicted = {"query": "kubernetes", "title": None, "tags": []}
+    assert await orchestrator._use_prefetch((predicted, task), {"query": "docker"}) is None
+    await asyncio.sleep(0)
+    assert task.cancelled() and speculative.stats()["miss"] == 1
@@ -0,0 +1,49 @@
+import os, subprocess, sys, textwrap
+
+# Dependências que não podem ser carregadas antes do primeiro uso de ferramenta
+HEAVY_MODULES = ("supabase", "openai", "truststore")
+
+
+def _run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    return subprocess.run([sys.executable, *flags, "-c", code], capture_output=True, text=True, env=env, timeout=120)
+
+
+def test_import_time_budget(record_property):
+    proc = _run("import mcp_simple_tool.server", "-X", "importtime")
+    assert proc.returncode == 0, proc.stderr
+    # Formato: "import time: self [us] | cumulative | imported package"
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cum_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        cumulative[name] = int(cum_us)
+    loaded = set(cumulative)
+    assert not [m for m in HEAVY_MODULES if m in loaded], "dependência pesada importada no startup"
+    total_ms = cumulative["mcp_simple_tool.server"] / 1000
+    record_property("import_time_ms", total_ms)
+    print(f"import mcp_simple_tool.server: {total_ms:.1f} ms")
+    budget_ms = float(os.getenv("IMPORT_TIME_BUDGET_MS", "3000"))
+    assert total_ms < budget_ms
+
+
+def test_list_tools_does_not_load_heavy_modules():
+    code = textwrap.dedent(
+        """
+        import sys, anyio
+        import mcp.types as types
+        from mcp_simple_tool.server import create_server
+
+        app = create_server()
+        handler = app.request_handlers[types.ListToolsRequest]
+        result = anyio.run(handler, types.ListToolsRequest(method="tools/list"))
+        names = [t.name for t in result.root.tools]
+        assert "add_note" in names and "search_notes" in names, names
+        print(",".join(m for m in %r if m in sys.modules))
+        """
+        % (HEAVY_MODULES,)
+    )
+    proc = _run(code)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
@@ -0,0 +1,34 @@
+import json
+import anyio
+import pytest
+import mcp.types as types
+from mcp_simple_tool import jsonutil, server
+
+
+@pytest.fixture(params=["fast", "stdlib"])
+def serializer(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(jsonutil, "_orjson", None)
+    elif jsonutil._orjson is None:
+        pytest.skip("orjson não instalado")
+    return jsonutil
+
+
+def test_dumps_compact_utf8_roundtrip(serializer):
+    payload = {"título": "ação", "tags": ("a", "b"), "n": 1, "nested": {"ok": True}}
+    text = serializer.dumps(payload)
+    assert "ação" in text and ", " not in text and ": " not in text
+    assert serializer.loads(text) == {"título": "ação", "tags": ["a", "b"], "n": 1, "nested": {"ok": True}}
+    assert serializer.dumps_bytes(payload) == text.encode("utf-8")
+
+
+def test_call_tool_returns_structured_content(monkeypatch):
+    result = {"success": True, "data": {"results": [{"id": 1, "title": "Nota"}], "cached": False}}
+    monkeypatch.setattr(server, "search_notes_tool", lambda q, t, tags: result)
+    app = server.create_server()
+    handler = app.request_handlers[types.CallToolRequest]
+    req = types.CallToolRequest(method="tools/call", params=types.CallToolRequestParams(name="search_notes", arguments={"query": "x"}))
+    res = anyio.run(handler, req).root
+    assert res.isError is False
+    assert res.structuredContent == result
+    assert json.loads(res.content[0].text) == result
@@ -0,0 +1,112 @@
+import pytest
+from fastapi.testclient import TestClient
+from mcp_simple_tool.tools import notes
+from mcp_simple_tool.tools.tags import TagIndex
+
+
+def test_tag_index_counts_and_prefix():
+    idx = TagIndex()
+    idx.rebuild([["python", "mcp"], ["Python", "pytest"], ["python"], []])
+    assert idx.top(2) == [("python", 2), ("mcp", 1)]
+    # prefixo case-insensitive, mais usadas primeiro
+    assert [t for t, _ in idx.complete("py")] == ["python", "pytest", "Python"]
+    assert idx.complete("zzz") == []
+    idx.add(["pyramid", "mcp"])
+    assert ("pyramid", 1) in idx.complete("pyr")
+    assert dict(idx.top())["mcp"] == 2
+
+
+class DummyResp:
+    def __init__(self, data):
+        self.data = data
+        self.__dict__['error'] = None
+
+
+class DummyTable:
+    calls = {"select": 0}
+    rows = [{"id": 1, "tags": ["mcp", "trabalho"]}, {"id": 2, "tags": ["mcp"]}, {"id": 3, "tags": None}]
+
+    def select(self, cols):
+        DummyTable.calls["select"] += 1
+        self._slice = DummyTable.rows
+        return self
+    def order(self, col):
+        self._slice = sorted(self._slice, key=lambda r: r[col])
+        return self
+    def gt(self, col, value):
+        self._slice = [r for r in self._slice if r[col] > value]
+        return self
+    def limit(self, n):
+        self._slice = self._slice[:n]
+        return self
+    def insert(self, data):
+        self._slice = [data]
+        return self
+    def execute(self):
+        return DummyResp(self._slice)
+
+
+class DummyClient:
+    def table(self, _):
+        return DummyTable()
+
+
+def test_list_tags_tool_builds_once_and_updates_incrementally(monkeypatch):
+    monkeypatch.setattr(notes, 'supabase', DummyClient())
+    monkeypatch.setattr(notes, '_TAG_INDEX', TagIndex())
+    DummyTable.calls["select"] = 0
+    r = notes.list_tags_tool()
+    assert r["success"] is True
+    assert r["data"]["tags"][0] == {"tag": "mcp", "count": 2}
+    notes.add_note_tool("c", "t", ["trabalho", "novo"])
+    r2 = notes.list_tags_tool(prefix="tr")
+    assert r2["data"]["tags"] == [{"tag": "trabalho", "count": 2}]
+    assert notes.list_tags_tool(prefix="no")["data"]["tags"] == [{"tag": "novo", "count": 1}]
+    # Índice construído uma única vez (sem novo scan)
+    assert DummyTable.calls["select"] == 1
+
+
+def test_tag_index_pages_by_id(monkeypatch):
+    monkeypatch.setattr(notes, 'supabase', DummyClient())
+    monkeypatch.setattr(notes, '_TAG_INDEX', TagIndex())
+    monkeypatch.setattr(notes, '_TAG_INDEX_PAGE_SIZE', 2)
+    monkeypatch.setattr(DummyTable, 'rows', [{"id": i, "tags": [f"t{i}"]} for i in (5, 1, 4, 2, 3)])
+    DummyTable.calls["select"] = 0
+    r = notes.list_tags_tool(limit=10)
+    assert sorted(t["tag"] for t in r["data"]["tags"]) == ["t1", "t2", "t3", "t4", "t5"]
+    assert DummyTable.calls["select"] == 3
+
+
+def test_tags_endpoint(monkeypatch):
+    from mcp_simple_tool.webapp.app import app
+    monkeypatch.setenv("AUTH_API_KEY", "k1")
+    monkeypatch.setattr(notes, 'supabase', DummyClient())
+    monkeypatch.setattr(notes, '_TAG_INDEX', TagIndex())
+    client = TestClient(app)
+    r = client.get('/api/tags?prefix=m', headers={'x-api-key': 'k1'})
+    assert r.status_code == 200
+    assert r.json()["tags"] == [{"tag": "mcp", "count": 2}]
+
+
+@pytest.mark.asyncio
+async def test_planning_prompt_gets_known_tags(monkeypatch):
+    from mcp_simple_tool.llm import orchestrator
+    monkeypatch.setenv("PLANNING_TAG_HINTS", "20")
+    idx = TagIndex()
+    monkeypatch.setattr(notes, '_TAG_INDEX', idx)
+    builds = []
+    def list_tags(prefix, limit):
+        builds.append(limit)
+        idx.rebuild([["mcp", "trabalho"], ["mcp"]])
+        return {"success": True, "data": {"tags": []}}
+    seen = []
+    async def chat(prompt, **kw):
+        seen.append(kw.get("history"))
+        return ("ok", [])
+    params = {"fast_path": False}
+    # Processo novo: o primeiro planejamento dispara a construção do índice em background
+    await orchestrator.run_notes_chat("notas de trabalho?", params=params, chat_func=chat, list_tags_func=list_tags)
+    await orchestrator._TAG_INDEX_BUILD
+    await orchestrator.run_notes_chat("notas de trabalho?", params=params, chat_func=chat, list_tags_func=list_tags)
+    assert seen[0] is None and builds == [1]
+    assert seen[1] == [{"role": "system", "content": "Tags existentes (mais usadas): mcp, trabalho"}]
@@ -0,0 +1,138 @@
+import gzip
+import io
+import json
+import sqlite3
+import pytest
+from click.testing import CliRunner
+from fastapi.testclient import TestClient
+from mcp_simple_tool import transfer
+from mcp_simple_tool.webapp import storage
+
+
+class FakeNotes:
+    """Tabela notes em memória com o subconjunto do query builder usado pela exportação."""
+
+    def __init__(self, n):
+        self.rows = [{"id": i, "title": f"t{i}", "content": "c", "tags": []} for i in range(1, n + 1)]
+        self.pages = []
+        self.upserts = []
+
+    def table(self, _):
+        outer = self
+        class Q:
+            def __init__(self):
+                self.gt_id, self.n = None, None
+            def select(self, _): return self
+            def order(self, _): return self
+            def gt(self, _, v): self.gt_id = v; return self
+            def limit(self, n): self.n = n; return self
+            def upsert(self, chunk):
+                outer.upserts.append(list(chunk))
+                return self
+            def execute(self):
+                class R: pass
+                r = R()
+                if self.n is None:
+                    r.data = []
+                    return r
+                outer.pages.append(self.gt_id)
+                r.data = [x for x in outer.rows if self.gt_id is None or x["id"] > self.gt_id][: self.n]
+                return r
+        return Q()
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(str(tmp_path / "src.db"))
+    for i in range(7):
+        storage.save_message(f"s{i % 2}", "user", f"m{i}", [{"tool": "x"}] if i == 3 else None)
+    yield tmp_path
+    storage._CONN.close()
+
+
+def test_notes_keyset_pagination():
+    client = FakeNotes(5)
+    out = io.BytesIO()
+    assert transfer.write_ndjson(transfer.iter_notes(client, page_size=2), out) == 5
+    assert client.pages == [None, 2, 4]
+    assert [json.loads(line)["id"] for line in out.getvalue().splitlines()] == [1, 2, 3, 4, 5]
+
+
+def test_history_roundtrip_gzip_with_checkpoint_resume(db, monkeypatch):
+    src = str(db / "src.db")
+    dump = db / "hist.ndjson.gz"
+    runner = CliRunner()
+    r = runner.invoke(transfer.cli, ["export-history", "--db", src, "--out", str(dump)])
+    assert r.exit_code == 0, r.output
+    assert gzip.decompress(dump.read_bytes()).count(b"\n") == 7
+
+    storage._CONN.close()
+    monkeypatch.setattr(storage, "_CONN", None)
+    ckpt = str(db / "import.ckpt")
+    calls = {"n": 0}
+    real = storage.import_messages
+    def flaky(rows, conn=None):
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise RuntimeError("queda no meio")
+        return real(rows, conn)
+    monkeypatch.setattr(storage, "import_messages", flaky)
+    dst = str(db / "dst.db")
+    r = runner.invoke(transfer.cli, ["import-history", str(dump), "--db", dst, "--chunk-size", "3", "--checkpoint", ckpt])
+    assert r.exit_code != 0
+    assert json.loads(open(ckpt).read())["lines_done"] == 3
+    # retoma a partir do checkpoint (conexão já aberta pelo 1º import)
+    with open(dump, "rb") as fp:
+        res = transfer.import_history(transfer.read_ndjson(fp), chunk_size=3, checkpoint=ckpt)
+    assert res["lines_done"] == 7
+    rows = sqlite3.connect(dst).execute("SELECT id, session_id, content, actions FROM messages ORDER BY id").fetchall()
+    assert [r[2] for r in rows] == [f"m{i}" for i in range(7)]
+    assert json.loads(rows[3][3]) == [{"tool": "x"}]
+
+
+def test_web_export_and_import(db, monkeypatch):
+    from mcp_simple_tool.webapp import app as webapp
+    from mcp_simple_tool.tools import notes
+    client = TestClient(webapp.app)
+    h = {"x-api-key": "k1"}
+    r = client.get("/api/export/history", params={"session_id": "s1", "gzip": "true"}, headers=h)
+    assert r.headers["content-type"] == "application/gzip"
+    lines = gzip.decompress(r.content).splitlines()
+    assert [json.loads(x)["content"] for x in lines] == ["m1", "m3", "m5"]
+
+    from mcp_simple_tool import admission
+    admission.reset()
+    monkeypatch.setattr(notes, "supabase", FakeNotes(5))
+    r = client.get("/api/export/notes", params={"page_size": 2, "gzip": "true"}, headers=h)
+    assert [json.loads(x)["id"] for x in gzip.decompress(r.content).splitlines()] == [1, 2, 3, 4, 5]
+    assert admission.stats()["supabase"]["admitted"] == 3  # uma vaga por página
+
+    fake = FakeNotes(0)
+    monkeypatch.setattr(notes, "supabase", fake)
+    body = gzip.compress(b"".join(json.dumps({"id": i, "title": "t"}).encode() + b"\n" for i in range(5)))
+    r = client.post("/api/import/notes", params={"chunk_size": 2, "skip": 1}, content=body, headers={**h, "Content-Encoding": "gzip"})
+    assert r.json() == {"success": True, "lines_done": 5, "lines_seen": 5}
+    assert [[x["id"] for x in c] for c in fake.upserts] == [[1, 2], [3, 4]]
+
+
+def test_history_import_into_non_empty_db(db, monkeypatch):
+    from mcp_simple_tool.webapp import app as webapp
+    from mcp_simple_tool.tools import notes
+    client = TestClient(webapp.app)
+    h = {"x-api-key": "k1"}
+    exported = [json.loads(x) for x in client.get("/api/export/history", params={"session_id": "s0"}, headers=h).content.splitlines()]
+    etag = client.get("/api/history", params={"session_id": "s0"}, headers=h).headers["etag"]
+    rows = [exported[0], {**exported[1], "content": "outra base, mesmo id"}, {"id": 100, "session_id": "s0", "role": "user", "content": "nova"}]
+    body = b"".join(json.dumps(r).encode() + b"\n" for r in rows)
+    r = client.post("/api/import/history", content=body, headers=h).json()
+    assert (r["inserted"], r["reassigned"], r["skipped"]) == (1, 1, 1)
+    assert client.post("/api/import/history", content=body, headers=h).json()["skipped"] == 3
+    contents = [m["text"] for m in storage.load_history("s0")]
+    assert contents.count("outra base, mesmo id") == 1 and "nova" in contents
+    # ETag do histórico muda mesmo com mensagens de id menor que o último
+    assert client.get("/api/history", params={"session_id": "s0"}, headers={**h, "If-None-Match": etag}).status_code == 200
+
+    monkeypatch.setattr(notes, "supabase", None)
+    monkeypatch.setattr(notes, "SUPABASE_URL", None)
+    assert client.post("/api/import/notes", content=b"{}\n", headers=h).status_code == 502
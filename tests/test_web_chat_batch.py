@@ -0,0 +1,57 @@
+import asyncio
+import json
+import pytest
+from fastapi.testclient import TestClient
+from mcp_simple_tool.webapp import app as webapp
+from mcp_simple_tool.webapp import storage
+from mcp_simple_tool.llm import orchestrator
+from mcp_simple_tool.shared_state import MemoryBackend, set_backend
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_PER_MIN", "5")
+    monkeypatch.setattr(storage, "_CONN", None)
+    storage.init(str(tmp_path / "history.db"))
+    set_backend(MemoryBackend())
+    yield TestClient(webapp.app)
+    storage._CONN.close()
+
+
+def _lines(r):
+    return [json.loads(line) for line in r.text.splitlines() if line]
+
+
+def test_batch_streams_results_with_bounded_concurrency(client, monkeypatch):
+    monkeypatch.setenv("BATCH_CONCURRENCY", "2")
+    state = {"running": 0, "peak": 0}
+    async def fake_chat(prompt, **kw):
+        state["running"] += 1
+        state["peak"] = max(state["peak"], state["running"])
+        await asyncio.sleep(0.01)
+        state["running"] -= 1
+        if prompt == "falha":
+            raise RuntimeError('{"error":"Falha de conexão","code":"network_error"}')
+        return (f"resp:{prompt}", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    items = [{"message": "a", "session_id": "s1"}, {"message": "falha"}, {"message": "b", "session_id": "s1"}, {"message": "c"}]
+    r = client.post("/api/chat/batch", headers={"x-api-key": "k1"}, json={"items": items, "params": {"fast_path": False}})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    out = {res["index"]: res for res in _lines(r)}
+    assert sorted(out) == [0, 1, 2, 3]
+    assert out[0]["response"]["text"] == "resp:a"
+    assert out[1]["success"] is False and out[1]["status"] == 502
+    assert state["peak"] <= 2
+    # histórico gravado na ordem dos itens, falhas de fora
+    assert [m["text"] for m in storage.load_history("s1")] == ["a", "resp:a", "b", "resp:b"]
+
+
+def test_batch_rate_limit_counts_items(client, monkeypatch):
+    async def fake_chat(prompt, **kw):
+        return ("ok", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    items = [{"message": f"m{i}"} for i in range(4)]
+    assert client.post("/api/chat/batch", headers={"x-api-key": "k1"}, json={"items": items}).status_code == 200
+    r = client.post("/api/chat/batch", headers={"x-api-key": "k1"}, json={"items": items[:2]})
+    assert r.status_code == 429
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from mcp_simple_tool.webapp import app as webapp
+from mcp_simple_tool.llm import orchestrator
+from mcp_simple_tool.shared_state import MemoryBackend, set_backend
+
+
+@pytest.fixture
+def client():
+    set_backend(MemoryBackend())
+    return TestClient(webapp.app)
+
+
+def _until(ws, kind, turn_id=None):
+    events = []
+    while True:
+        ev = ws.receive_json()
+        events.append(ev)
+        if ev["type"] == kind and (turn_id is None or ev.get("id") == turn_id):
+            return events
+
+
+def test_rejects_without_key(client):
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "auth", "api_key": "errada"})
+        with pytest.raises(WebSocketDisconnect) as exc:
+            ws.receive_json()
+    assert exc.value.code == 4401
+
+
+def test_auth_message_and_progress_events(client, monkeypatch):
+    calls = {"n": 0}
+    async def fake_chat(prompt, **kw):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            return ("Draft", [{"tool": "list_tags", "args": {}}])
+        return ("Final", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    monkeypatch.setattr(webapp, "list_tags_tool", lambda prefix, limit: {"success": True, "data": {"tags": []}})
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "auth", "api_key": "k1"})
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "chat", "id": "t1", "session_id": "s1", "message": "quais tags?", "params": {"fast_path": False}})
+        events = _until(ws, "message", "t1")
+    stages = [e["stage"] for e in events if e["type"] == "progress"]
+    assert stages == ["planning", "planned", "tool", "synthesis"]
+    assert events[0] == {"type": "accepted", "id": "t1", "session_id": "s1"}
+    assert events[-1]["response"]["text"] == "Final"
+
+
+def test_multiplexed_sessions_and_cancel(client, monkeypatch):
+    state = {"cancelled": False}
+    async def fake_chat(prompt, **kw):
+        if prompt == "lento":
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+        return (f"resp:{prompt}", [])
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    with client.websocket_connect("/ws/chat?api_key=k1") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "chat", "id": "a", "session_id": "s1", "message": "lento", "params": {"fast_path": False}})
+        ws.send_json({"type": "chat", "id": "b", "session_id": "s2", "message": "rápido", "params": {"fast_path": False}})
+        events = _until(ws, "message", "b")
+        assert events[-1]["session_id"] == "s2" and events[-1]["response"]["text"] == "resp:rápido"
+        ws.send_json({"type": "cancel", "id": "a"})
+        ev = _until(ws, "cancelled", "a")[-1]
+        assert ev["session_id"] == "s1"
+    assert state["cancelled"] is True
+
+
+def test_non_object_json_and_summary_failure_keep_connection(client, monkeypatch):
+    async def fake_chat(prompt, **kw):
+        return (f"resp:{prompt}", [])
+    async def broken_summary(session_id, **kw):
+        raise RuntimeError("resumo falhou")
+    monkeypatch.setattr(orchestrator, "chat_with_tools", fake_chat)
+    monkeypatch.setattr(webapp, "refresh_summary", broken_summary)
+    with client.websocket_connect("/ws/chat?api_key=k1") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        for raw in ("[]", '"x"', "1"):
+            ws.send_text(raw)
+            ev = ws.receive_json()
+            assert ev["type"] == "error" and ev["status"] == 400
+        for turn in ("t1", "t2"):
+            ws.send_json({"type": "chat", "id": turn, "session_id": "s1", "message": turn, "params": {"fast_path": False}})
+            assert _until(ws, "message", turn)[-1]["response"]["text"] == f"resp:{turn}"
+        ws.send_json({"type": "ping"})
+        assert _until(ws, "pong")[-1] == {"type": "pong"}